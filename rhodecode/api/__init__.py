@@ -19,9 +19,8 @@
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
 import inspect
-import itertools
 import logging
-import types
+import time
 
 import decorator
 import venusian
@@ -31,17 +30,19 @@ from pyramid.response import Response
 from pyramid.httpexceptions import HTTPNotFound
 
 from rhodecode.api.exc import JSONRPCBaseError, JSONRPCError, JSONRPCForbidden
+from rhodecode.api.stats import ApiStats
 from rhodecode.lib.auth import AuthUser
 from rhodecode.lib.base import get_ip_addr
 from rhodecode.lib.ext_json import json
-from rhodecode.lib.utils2 import safe_str
+from rhodecode.lib.utils2 import safe_int, safe_str
 from rhodecode.lib.plugins.utils import get_plugin_settings
-from rhodecode.model.db import User, UserApiKeys
+from rhodecode.model.db import Session, User, UserApiKeys
 
 log = logging.getLogger(__name__)
 
 DEFAULT_RENDERER = 'jsonrpc_renderer'
 DEFAULT_URL = '/_admin/apiv2'
+DEFAULT_BATCH_LIMIT = 1000
 
 
 class ExtJsonRenderer(object):
@@ -74,26 +75,26 @@ class ExtJsonRenderer(object):
         return _render
 
 
-def jsonrpc_response(request, result):
-    rpc_id = getattr(request, 'rpc_id', None)
+def _jsonrpc_result(request, result):
+    ret_value = {
+        'id': request.rpc_id,
+        'result': result,
+        'error': None,
+    }
+
+    # fetch deprecation warnings, and store it inside results
+    deprecation = getattr(request, 'rpc_deprecation', None)
+    if deprecation:
+        ret_value['DEPRECATION_WARNING'] = deprecation
+    return ret_value
+
+
+def _render_response(request, ret_value):
     response = request.response
 
     # store content_type before render is called
     ct = response.content_type
 
-    ret_value = ''
-    if rpc_id:
-        ret_value = {
-            'id': rpc_id,
-            'result': result,
-            'error': None,
-        }
-
-        # fetch deprecation warnings, and store it inside results
-        deprecation = getattr(request, 'rpc_deprecation', None)
-        if deprecation:
-            ret_value['DEPRECATION_WARNING'] = deprecation
-
     raw_body = render(DEFAULT_RENDERER, ret_value, request=request)
     response.body = safe_str(raw_body, response.charset)
 
@@ -103,6 +104,16 @@ def jsonrpc_response(request, result):
     return response
 
 
+def jsonrpc_response(request, result):
+    rpc_id = getattr(request, 'rpc_id', None)
+
+    ret_value = ''
+    if rpc_id:
+        ret_value = _jsonrpc_result(request, result)
+
+    return _render_response(request, ret_value)
+
+
 def jsonrpc_error(request, message, retid=None, code=None):
     """
     Generate a Response object with a JSON-RPC error body
@@ -140,35 +151,28 @@ def exception_view(exc, request):
     return jsonrpc_error(request, fault_message, rpc_id)
 
 
-def request_view(request):
+def _authenticate(request, api_key):
     """
-    Main request handling method. It handles all logic to call a specific
-    exposed method
+    Returns the :class:`AuthUser` owning the given `api_key`. Raises a
+    :class:`JSONRPCError` if the key may not be used for an API call.
     """
-
     # check if we can find this session using api_key, get_by_auth_token
     # search not expired tokens only
 
     try:
-        u = User.get_by_auth_token(request.rpc_api_key)
+        u = User.get_by_auth_token(api_key)
 
         if u is None:
-            return jsonrpc_error(
-                request, retid=request.rpc_id, message='Invalid API KEY')
+            raise JSONRPCError('Invalid API KEY')
 
         if not u.active:
-            return jsonrpc_error(
-                request, retid=request.rpc_id,
-                message='Request from this user not allowed')
+            raise JSONRPCError('Request from this user not allowed')
 
         # check if we are allowed to use this IP
-        auth_u = AuthUser(
-            u.user_id, request.rpc_api_key, ip_addr=request.rpc_ip_addr)
+        auth_u = AuthUser(u.user_id, api_key, ip_addr=request.rpc_ip_addr)
         if not auth_u.ip_allowed:
-            return jsonrpc_error(
-                request, retid=request.rpc_id,
-                message='Request from IP:%s not allowed' % (
-                request.rpc_ip_addr,))
+            raise JSONRPCError(
+                'Request from IP:%s not allowed' % (request.rpc_ip_addr,))
         else:
             log.info('Access for IP:%s allowed' % (request.rpc_ip_addr,))
 
@@ -179,78 +183,186 @@ def request_view(request):
         active_tokens = [u.api_key] + extra_auth_tokens
 
         log.debug('Checking if API key has proper role')
-        if request.rpc_api_key not in active_tokens:
-            return jsonrpc_error(
-                request, retid=request.rpc_id,
-                message='API KEY has bad role for an API call')
+        if api_key not in active_tokens:
+            raise JSONRPCError('API KEY has bad role for an API call')
 
-    except Exception as e:
+    except JSONRPCError:
+        raise
+    except Exception:
         log.exception('Error on API AUTH')
-        return jsonrpc_error(
-            request, retid=request.rpc_id, message='Invalid API KEY')
+        raise JSONRPCError('Invalid API KEY')
 
-    method = request.rpc_method
-    func = request.registry.jsonrpc_methods[method]
+    return auth_u
 
-    # now that we have a method, add request._req_params to
-    # self.kargs and dispatch control to WGIController
-    argspec = inspect.getargspec(func)
-    arglist = argspec[0]
-    defaults = map(type, argspec[3] or [])
-    default_empty = types.NotImplementedType
 
-    # kw arguments required by this method
-    func_kwargs = dict(itertools.izip_longest(
-        reversed(arglist), reversed(defaults), fillvalue=default_empty))
+class MethodSignature(object):
+    """
+    Arguments of an API method, inspected once when the method is registered.
+    """
 
     # This attribute will need to be first param of a method that uses
     # api_key, which is translated to instance of user at that name
     user_var = 'apiuser'
     request_var = 'request'
 
-    for arg in [user_var, request_var]:
-        if arg not in arglist:
-            return jsonrpc_error(
-                request,
-                retid=request.rpc_id,
-                message='This method [%s] does not support '
-                        'required parameter `%s`' % (func.__name__, arg))
-
-    # get our arglist and check if we provided them as args
-    for arg, default in func_kwargs.items():
-        if arg in [user_var, request_var]:
-            # user_var and request_var are pre-hardcoded parameters and we
-            # don't need to do any translation
-            continue
-
-        # skip the required param check if it's default value is
-        # NotImplementedType (default_empty)
-        if default == default_empty and arg not in request.rpc_params:
-            return jsonrpc_error(
-                request,
-                retid=request.rpc_id,
-                message=('Missing non optional `%s` arg in JSON DATA' % arg)
-            )
-
-    # sanitze extra passed arguments
-    for k in request.rpc_params.keys()[:]:
-        if k not in func_kwargs:
-            del request.rpc_params[k]
+    def __init__(self, func):
+        argspec = inspect.getargspec(func)
+        arglist = argspec[0]
+        defaults = argspec[3] or []
+
+        for arg in [self.user_var, self.request_var]:
+            if arg not in arglist:
+                raise ConfigurationError(
+                    'This method [%s] does not support '
+                    'required parameter `%s`' % (func.__name__, arg))
+
+        # user_var and request_var are pre-hardcoded parameters and we
+        # don't need to do any translation
+        self.arguments = frozenset(arglist)
+        self.required = tuple(
+            arg for arg in arglist[:len(arglist) - len(defaults)]
+            if arg not in [self.user_var, self.request_var])
+
+    def validate(self, params):
+        """
+        Checks that `params` contain all required arguments and removes the
+        ones which the method does not accept.
+        """
+        for arg in self.required:
+            if arg not in params:
+                raise JSONRPCError(
+                    'Missing non optional `%s` arg in JSON DATA' % arg)
+
+        # sanitze extra passed arguments
+        for k in params.keys():
+            if k not in self.arguments:
+                del params[k]
+
+
+def _call_method(request, func, auth_u):
+    """
+    Validates the `request.rpc_params` against the signature of `func` and
+    calls it on behalf of `auth_u`. Raises a :class:`JSONRPCError` if the
+    params are not valid or the call fails unexpectedly.
+    """
+    method = request.rpc_method
+    signature = request.registry.jsonrpc_signatures[method]
+    signature.validate(request.rpc_params)
 
     call_params = request.rpc_params
     call_params.update({
         'request': request,
         'apiuser': auth_u
     })
+    start = time.time()
+    error = True
     try:
         ret_value = func(**call_params)
-        return jsonrpc_response(request, ret_value)
+        error = False
+        return ret_value
     except JSONRPCBaseError:
         raise
     except Exception:
         log.exception('Unhandled exception occured on api call: %s', func)
-        return jsonrpc_error(request, retid=request.rpc_id,
-                             message='Internal server error')
+        raise JSONRPCError('Internal server error')
+    finally:
+        request.registry.jsonrpc_stats.record(
+            method, time.time() - start, error=error)
+
+
+def request_view(request):
+    """
+    Main request handling method. It handles all logic to call a specific
+    exposed method
+    """
+    method = request.rpc_method
+    func = request.registry.jsonrpc_methods[method]
+
+    try:
+        auth_u = _authenticate(request, request.rpc_api_key)
+        ret_value = _call_method(request, func, auth_u)
+    except JSONRPCError as e:
+        return jsonrpc_error(request, retid=request.rpc_id, message=e.message)
+
+    return jsonrpc_response(request, ret_value)
+
+
+def batch_view(request):
+    """
+    Handles a batch of calls sent as a JSON array. The calls are executed in
+    sequence and each one gets its own response, in the order of the batch.
+    Every distinct auth token of the batch is authenticated only once, so the
+    calls of the batch share the permissions calculated for its user.
+    """
+    auth_users = {}
+    responses = []
+    for call in request.rpc_batch:
+        request.rpc_id = call.get('id') if isinstance(call, dict) else None
+        request.rpc_deprecation = None
+        try:
+            _setup_call(request, call)
+            func = request.registry.jsonrpc_methods.get(request.rpc_method)
+            if func is None:
+                raise JSONRPCError(
+                    "No such method: {}".format(request.rpc_method))
+
+            api_key = request.rpc_api_key
+            if api_key not in auth_users:
+                try:
+                    auth_users[api_key] = _authenticate(request, api_key)
+                except JSONRPCError as e:
+                    auth_users[api_key] = e
+            if isinstance(auth_users[api_key], JSONRPCError):
+                raise auth_users[api_key]
+
+            result = _call_method(request, func, auth_users[api_key])
+            responses.append(_jsonrpc_result(request, result))
+        except JSONRPCBaseError as e:
+            # a failed call can leave the session in an unusable state, the
+            # following calls of the batch start from a clean one
+            Session().rollback()
+            if isinstance(e, JSONRPCForbidden):
+                message = 'Access was denied to this resource.'
+            else:
+                message = e.message
+            log.debug('json-rpc batch call error rpc_id:%s "%s"',
+                      request.rpc_id, message)
+            responses.append(
+                {'id': request.rpc_id, 'result': None, 'error': message})
+
+    return _render_response(request, responses)
+
+
+def _setup_call(request, json_body):
+    """
+    Stores the parameters of a single call on the request. Raises a
+    :class:`JSONRPCError` if the call data is not valid.
+    """
+    if not isinstance(json_body, dict):
+        raise JSONRPCError('Incorrect JSON data. Expected an object')
+
+    request.rpc_id = json_body.get('id')
+    request.rpc_method = json_body.get('method')
+
+    # check required base parameters
+    try:
+        api_key = json_body.get('api_key')
+        if not api_key:
+            api_key = json_body.get('auth_token')
+
+        if not api_key:
+            raise KeyError('api_key or auth_token')
+
+        request.rpc_api_key = api_key
+        request.rpc_id = json_body['id']
+        request.rpc_method = json_body['method']
+        request.rpc_params = json_body['args'] \
+            if isinstance(json_body['args'], dict) else {}
+
+        log.debug(
+            'method: %s, params: %s' % (request.rpc_method, request.rpc_params))
+    except KeyError as e:
+        raise JSONRPCError('Incorrect JSON data. Missing %s' % e)
 
 
 def setup_request(request):
@@ -288,28 +400,21 @@ def setup_request(request):
         # catch JSON errors Here
         raise JSONRPCError("JSON parse error ERR:%s RAW:%r" % (e, raw_body))
 
-    request.rpc_id = json_body.get('id')
-    request.rpc_method = json_body.get('method')
-
-    # check required base parameters
-    try:
-        api_key = json_body.get('api_key')
-        if not api_key:
-            api_key = json_body.get('auth_token')
-
-        if not api_key:
-            raise KeyError('api_key or auth_token')
-
-        request.rpc_api_key = api_key
-        request.rpc_id = json_body['id']
-        request.rpc_method = json_body['method']
-        request.rpc_params = json_body['args'] \
-            if isinstance(json_body['args'], dict) else {}
-
-        log.debug(
-            'method: %s, params: %s' % (request.rpc_method, request.rpc_params))
-    except KeyError as e:
-        raise JSONRPCError('Incorrect JSON data. Missing %s' % e)
+    if isinstance(json_body, list):
+        request.rpc_id = None
+        request.rpc_method = None
+        if not json_body:
+            raise JSONRPCError('Empty batch request')
+        batch_limit = request.registry.jsonrpc_batch_limit
+        if len(json_body) > batch_limit:
+            raise JSONRPCError(
+                'Batch request exceeds the limit of %s calls' % batch_limit)
+        request.rpc_batch = json_body
+        log.debug('setup complete, now handling batch of %s calls',
+                  len(json_body))
+        return
+
+    _setup_call(request, json_body)
 
     log.debug('setup complete, now handling method:%s rpcid:%s',
               request.rpc_method, request.rpc_id, )
@@ -347,6 +452,19 @@ class NotFoundPredicate(object):
         return hasattr(request, 'rpc_method')
 
 
+class BatchPredicate(object):
+    def __init__(self, val, config):
+        self.val = val
+
+    def text(self):
+        return 'jsonrpc batch = %s' % self.val
+
+    phash = text
+
+    def __call__(self, context, request):
+        return hasattr(request, 'rpc_batch') == self.val
+
+
 class MethodPredicate(object):
     def __init__(self, val, config):
         self.method = val
@@ -377,7 +495,9 @@ def add_jsonrpc_method(config, view, **kwargs):
 
     kwargs['jsonrpc_method'] = method
 
-    # register our view into global view store for validation
+    # register our view into global view store for validation, its
+    # arguments are inspected only once here
+    config.registry.jsonrpc_signatures[method] = MethodSignature(view)
     config.registry.jsonrpc_methods[method] = view
 
     # we're using our main request_view handler, here, so each method
@@ -475,10 +595,15 @@ def includeme(config):
 
     if not hasattr(config.registry, 'jsonrpc_methods'):
         config.registry.jsonrpc_methods = {}
+        config.registry.jsonrpc_signatures = {}
+        config.registry.jsonrpc_stats = ApiStats()
+    config.registry.jsonrpc_batch_limit = safe_int(
+        plugin_settings.get('batch_limit'), DEFAULT_BATCH_LIMIT)
 
     # match filter by given method only
     config.add_view_predicate(
         'jsonrpc_method', MethodPredicate)
+    config.add_view_predicate('jsonrpc_batch', BatchPredicate)
 
     config.add_renderer(DEFAULT_RENDERER, ExtJsonRenderer(
         serializer=json.dumps, indent=4))
@@ -490,6 +615,9 @@ def includeme(config):
     config.add_route(
         'apiv2', plugin_settings.get('url', DEFAULT_URL), jsonrpc_call=True)
 
+    # batches of calls are handled by a single view
+    config.add_view(batch_view, route_name='apiv2', jsonrpc_batch=True)
+
     config.scan(plugin_module, ignore='rhodecode.api.tests')
     # register some exception handling view
     config.add_view(exception_view, context=JSONRPCBaseError)
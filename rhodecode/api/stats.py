@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Latency and throughput statistics of the API methods
+"""
+
+import threading
+import time
+
+
+class MethodStats(object):
+    """
+    Statistics of the calls of a single API method.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def record(self, duration, error=False):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def get_stats(self, elapsed):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_time': self.total_time,
+            'avg_time': self.total_time / self.calls if self.calls else 0.0,
+            'max_time': self.max_time,
+            'calls_per_second': self.calls / elapsed if elapsed else 0.0,
+        }
+
+
+class ApiStats(object):
+    """
+    Collects the latency and throughput of the calls of each API method since
+    the process started or since the statistics were last reset.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._started = time.time()
+
+    def record(self, method, duration, error=False):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.record(duration, error=error)
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+            self._started = time.time()
+
+    def get_stats(self):
+        with self._lock:
+            elapsed = time.time() - self._started
+            return {
+                'elapsed': elapsed,
+                'methods': dict(
+                    (method, stats.get_stats(elapsed))
+                    for method, stats in self._methods.iteritems()),
+            }
@@ -18,11 +18,17 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import mock
 import pytest
+from pyramid.exceptions import ConfigurationError
 
+from rhodecode.api import MethodSignature
+from rhodecode.api.exc import JSONRPCError
 from rhodecode.api.utils import Optional, OAttr
 from rhodecode.api.tests.utils import (
-    build_data, api_call, assert_error, assert_ok)
+    build_data, api_call, assert_error, assert_ok, jsonify)
+from rhodecode.lib.ext_json import json
+from rhodecode.model.db import User
 
 
 @pytest.mark.usefixtures("testuser_api", "app")
@@ -123,3 +129,90 @@ class TestApi(object):
         response = api_call(self.app, params)
         assert response.status == '200 OK'
         assert_ok(id_, expected, response.body)
+
+    def _batch(self, *calls):
+        return json.dumps([
+            {'id': id_, 'api_key': apikey, 'method': method, 'args': args}
+            for id_, apikey, method, args in calls])
+
+    def test_api_batch(self):
+        params = self._batch(
+            (1, self.apikey, 'test', {'args': 'first'}),
+            (2, self.apikey, 'get_repo', {}),
+            (3, self.apikey, 'not_existing', {}),
+            (4, 'trololo', 'test', {'args': 'fourth'}),
+            (5, self.apikey, 'test', {'args': 'fifth'}),
+        )
+        response = api_call(self.app, params)
+
+        assert response.status == '200 OK'
+        assert json.loads(response.body) == jsonify([
+            {'id': 1, 'result': 'first', 'error': None},
+            {'id': 2, 'result': None,
+             'error': 'Missing non optional `repoid` arg in JSON DATA'},
+            {'id': 3, 'result': None, 'error': 'No such method: not_existing'},
+            {'id': 4, 'result': None, 'error': 'Invalid API KEY'},
+            {'id': 5, 'result': 'fifth', 'error': None},
+        ])
+
+    def test_api_batch_authenticates_once_per_token(self):
+        params = self._batch(*[
+            (id_, self.apikey, 'test', {'args': id_}) for id_ in range(10)])
+
+        with mock.patch.object(
+                User, 'get_by_auth_token',
+                wraps=User.get_by_auth_token) as get_by_auth_token:
+            response = api_call(self.app, params)
+
+        assert get_by_auth_token.call_count == 1
+        assert [r['result'] for r in json.loads(response.body)] == range(10)
+
+    def test_api_batch_bad_call(self):
+        params = json.dumps([
+            'not a call',
+            {'id': 2, 'api_key': self.apikey, 'method': 'test'},
+        ])
+        response = api_call(self.app, params)
+
+        assert json.loads(response.body) == jsonify([
+            {'id': None, 'result': None,
+             'error': 'Incorrect JSON data. Expected an object'},
+            {'id': 2, 'result': None,
+             'error': "Incorrect JSON data. Missing 'args'"},
+        ])
+
+    def test_api_batch_empty(self):
+        response = api_call(self.app, '[]')
+
+        assert_error(None, 'Empty batch request', given=response.body)
+
+
+class TestMethodSignature(object):
+
+    def test_required_arguments(self):
+        def method(request, apiuser, repoid, userid, cache=Optional(True)):
+            pass
+
+        signature = MethodSignature(method)
+
+        assert signature.required == ('repoid', 'userid')
+        with pytest.raises(JSONRPCError) as exc_info:
+            signature.validate({'repoid': 1})
+        assert exc_info.value.message == (
+            'Missing non optional `userid` arg in JSON DATA')
+
+    def test_extra_arguments_are_removed(self):
+        def method(request, apiuser, repoid, cache=Optional(True)):
+            pass
+
+        params = {'repoid': 1, 'cache': False, 'other': 2}
+        MethodSignature(method).validate(params)
+
+        assert params == {'repoid': 1, 'cache': False}
+
+    def test_missing_apiuser(self):
+        def method(request, repoid):
+            pass
+
+        with pytest.raises(ConfigurationError):
+            MethodSignature(method)
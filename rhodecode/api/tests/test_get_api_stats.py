@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+import mock
+import pytest
+
+from rhodecode.api.stats import ApiStats
+from rhodecode.api.tests.utils import build_data, api_call, assert_error
+
+
+@pytest.mark.usefixtures("testuser_api", "app")
+class TestGetApiStats(object):
+
+    def _get_api_stats(self, apikey, **kwargs):
+        id_, params = build_data(apikey, 'get_api_stats', **kwargs)
+        response = api_call(self.app, params)
+        return id_, response
+
+    def test_api_get_api_stats(self):
+        self._get_api_stats(self.apikey, reset=True)
+        for args in ['first', 'second']:
+            __, params = build_data(self.apikey, 'test', args=args)
+            api_call(self.app, params)
+        __, params = build_data(self.apikey, 'get_repo', repoid='not-existing')
+        api_call(self.app, params)
+
+        __, response = self._get_api_stats(self.apikey)
+
+        methods = response.json['result']['methods']
+        assert methods['test']['calls'] == 2
+        assert methods['test']['errors'] == 0
+        assert methods['get_repo']['calls'] == 1
+        assert methods['get_repo']['errors'] == 1
+        assert methods['get_api_stats']['calls'] == 1
+
+    def test_api_get_api_stats_reset(self):
+        self._get_api_stats(self.apikey, reset=True)
+        __, response = self._get_api_stats(self.apikey)
+
+        assert response.json['result']['methods'].keys() == ['get_api_stats']
+
+    def test_api_get_api_stats_regular_user(self):
+        id_, response = self._get_api_stats(self.apikey_regular)
+
+        expected = 'Access was denied to this resource.'
+        assert_error(id_, expected, given=response.body)
+
+
+class TestApiStats(object):
+
+    def test_record(self):
+        api_stats = ApiStats()
+        api_stats.record('get_repo', 0.5)
+        api_stats.record('get_repo', 1.5, error=True)
+
+        with mock.patch('time.time', return_value=api_stats._started + 4):
+            stats = api_stats.get_stats()
+
+        assert stats == {
+            'elapsed': 4,
+            'methods': {
+                'get_repo': {
+                    'calls': 2,
+                    'errors': 1,
+                    'total_time': 2.0,
+                    'avg_time': 1.0,
+                    'max_time': 1.5,
+                    'calls_per_second': 0.5,
+                },
+            },
+        }
+
+    def test_reset(self):
+        api_stats = ApiStats()
+        api_stats.record('get_repo', 0.5)
+        api_stats.reset()
+
+        assert api_stats.get_stats()['methods'] == {}
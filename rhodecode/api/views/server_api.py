@@ -63,6 +63,51 @@ def get_server_info(request, apiuser):
     return ScmModel().get_server_info(request.environ)
 
 
+@jsonrpc_method()
+def get_api_stats(request, apiuser, reset=Optional(False)):
+    """
+    Returns the latency and throughput of the calls of each API method.
+
+    The statistics are collected by each server process since it was
+    started, or since the statistics were last reset. The durations are
+    given in seconds. This command takes the following options:
+
+    :param apiuser: This is filled automatically from the |authtoken|.
+    :type apiuser: AuthUser
+    :param reset: Resets the statistics after returning them.
+    :type reset: Optional(``True`` | ``False``)
+
+    Example output:
+
+    .. code-block:: bash
+
+      id : <id_given_in_input>
+      result : {
+        'elapsed': <seconds since the statistics were reset>,
+        'methods': {
+          '<method name>': {
+            'calls': <number of calls>,
+            'errors': <number of failed calls>,
+            'total_time': <time spent in the calls>,
+            'avg_time': <average duration of a call>,
+            'max_time': <longest duration of a call>,
+            'calls_per_second': <calls per second>
+          },
+          ...
+        }
+      }
+      error :  null
+    """
+    if not has_superadmin_permission(apiuser):
+        raise JSONRPCForbidden()
+
+    api_stats = request.registry.jsonrpc_stats
+    stats = api_stats.get_stats()
+    if Optional.extract(reset):
+        api_stats.reset()
+    return stats
+
+
 @jsonrpc_method()
 def get_ip(request, apiuser, userid=Optional(OAttr('apiuser'))):
     """
@@ -49,7 +49,7 @@ def configure_vcs(config):
     Patch VCS config with some RhodeCode specific stuff
     """
     from rhodecode.lib.vcs import conf
-    from rhodecode.lib.utils2 import aslist
+    from rhodecode.lib.utils2 import aslist, str2bool
     conf.settings.BACKENDS = {
         'hg': 'rhodecode.lib.vcs.backends.hg.MercurialRepository',
         'git': 'rhodecode.lib.vcs.backends.git.GitRepository',
@@ -63,6 +63,14 @@ def configure_vcs(config):
     conf.settings.ALIASES[:] = config.get('vcs.backends')
     conf.settings.SVN_COMPATIBLE_VERSION = config.get(
         'vcs.svn.compatible_version')
+    conf.settings.REMOTE_BATCH_CALLS = str2bool(
+        config.get('vcs.server.batch_calls', 'false'))
+    conf.settings.ARCHIVE_STREAM_BUFFER_SIZE = int(config.get(
+        'archive_stream_buffer_size',
+        conf.settings.ARCHIVE_STREAM_BUFFER_SIZE))
+    conf.settings.ARCHIVE_STREAM_BATCH_SIZE = int(config.get(
+        'archive_stream_batch_size', conf.settings.ARCHIVE_STREAM_BATCH_SIZE))
+    conf.settings.GIT_COMMIT_INDEX_DIR = config.get('git_commit_index_dir')
 
 
 def initialize_database(config):
@@ -561,6 +561,8 @@ class SettingsController(BaseController):
         except TypeError:
             c.system_memory = 'NOT AVAILABLE'
 
+        c.cache_usage = self._get_cache_usage()
+
         rhodecode_ini_safe = rhodecode.CONFIG.copy()
         blacklist = [
             'rhodecode_license_key',
@@ -596,6 +598,38 @@ class SettingsController(BaseController):
             encoding="UTF-8",
             force_defaults=False)
 
+    def _get_cache_usage(self):
+        """
+        Returns the system info entries with the statistics of the caches of
+        this worker.
+        """
+        usage = [
+            (_('Archive cache usage'), c.archive_cache_stats,
+             '%(hits)s hits, %(misses)s misses, %(builds)s builds '
+             '(%(build_time).1fs), %(evictions)s evictions'),
+            (_('Diff cache usage'), c.diff_cache_stats,
+             '%(hits)s hits, %(misses)s misses, %(builds)s diffs parsed '
+             '(%(build_time).1fs), %(evictions)s evictions'),
+            (_('Permission cache usage'), c.permission_cache_stats,
+             '%(hits)s hits, %(misses)s misses (%(compute_time).1fs '
+             'computing), %(invalidations)s invalidations'),
+            (_('File tree cache usage'), c.file_tree_cache_stats,
+             '%(hits)s hits, %(misses)s misses (%(hit_rate).1f%% hit rate), '
+             '%(evictions)s evictions, at most %(max_entries)s entries'),
+            (_('Size tracker usage'), c.size_tracker_stats,
+             '%(hits)s cached directories, %(misses)s rescanned, '
+             '%(scans)s uncached scanned'),
+        ]
+        elems = []
+        for label, stats, text in usage:
+            if stats:
+                stats = dict(stats, hit_rate=stats.get('hit_rate', 0) * 100)
+                value = '%s (this worker)' % (text % stats, )
+            else:
+                value = _('Disabled')
+            elems.append((label, value, ''))
+        return elems
+
     @staticmethod
     def get_update_data(update_url):
         """Return the JSON update data."""
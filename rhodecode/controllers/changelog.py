@@ -24,6 +24,7 @@ changelog controller for rhodecode
 
 import logging
 
+import rhodecode
 from pylons import request, url, session, tmpl_context as c
 from pylons.controllers.util import redirect
 from pylons.i18n.translation import _
@@ -32,6 +33,8 @@ from webob.exc import HTTPNotFound, HTTPBadRequest
 import rhodecode.lib.helpers as h
 from rhodecode.lib.auth import LoginRequired, HasRepoPermissionAnyDecorator
 from rhodecode.lib.base import BaseRepoController, render
+from rhodecode.lib.commit_graph import (
+    get_commit_graph, get_commit_graph_path)
 from rhodecode.lib.ext_json import json
 from rhodecode.lib.graphmod import _colored, _dagwalker
 from rhodecode.lib.helpers import RepoPage
@@ -109,7 +112,8 @@ class ChangelogController(BaseRepoController):
             c.jsdata = json.dumps([])
             return
 
-        dag = _dagwalker(repo, commits)
+        commit_graph = get_commit_graph(repo, rhodecode.CONFIG)
+        dag = _dagwalker(repo, commits, commit_graph=commit_graph)
         data = [['', vtx, edges] for vtx, edges in _colored(dag)]
         c.jsdata = json.dumps(data)
 
@@ -146,7 +150,10 @@ class ChangelogController(BaseRepoController):
             self._check_if_valid_branch(branch_name, repo_name, f_path)
 
         c.changelog_for_path = f_path
-        pre_load = ['author', 'branch', 'date', 'message', 'parents']
+        pre_load = ['author', 'branch', 'date', 'message']
+        if not get_commit_graph_path(c.rhodecode_repo, rhodecode.CONFIG):
+            # the graph is built from the parents of the commits
+            pre_load.append('parents')
         try:
             if f_path:
                 log.debug('generating changelog for path %s', f_path)
@@ -33,6 +33,7 @@ from pylons.controllers.util import redirect
 
 from rhodecode.lib import auth
 from rhodecode.lib import diffs
+from rhodecode.lib.diff_cache import get_diff_processor
 from rhodecode.lib.auth import (
     LoginRequired, HasRepoPermissionAnyDecorator, NotAnonymous)
 from rhodecode.lib.base import BaseRepoController, render
@@ -232,21 +233,19 @@ class ChangesetController(BaseRepoController):
             context_lcl = get_line_ctx('', request.GET)
             ign_whitespace_lcl = get_ignore_ws('', request.GET)
 
-            _diff = c.rhodecode_repo.get_diff(
-                commit1, commit2,
-                ignore_whitespace=ign_whitespace_lcl, context=context_lcl)
-
             # diff_limit will cut off the whole diff if the limit is applied
             # otherwise it will just hide the big files from the front-end
             diff_limit = self.cut_off_limit_diff
             file_limit = self.cut_off_limit_file
 
-            diff_processor = diffs.DiffProcessor(
-                _diff, format='gitdiff', diff_limit=diff_limit,
-                file_limit=file_limit, show_full_diff=fulldiff)
             commit_changes = OrderedDict()
             if method == 'show':
-                _parsed = diff_processor.prepare()
+                diff_processor = get_diff_processor(
+                    c.rhodecode_repo, commit1, commit2,
+                    ignore_whitespace=ign_whitespace_lcl, context=context_lcl,
+                    diff_limit=diff_limit, file_limit=file_limit,
+                    show_full_diff=fulldiff)
+                _parsed = diff_processor.parsed_diff
                 c.limited_diff = isinstance(_parsed, diffs.LimitedDiffContainer)
                 for f in _parsed:
                     c.files.append(f)
@@ -260,6 +259,10 @@ class ChangesetController(BaseRepoController):
                         commit1.raw_id, commit2.raw_id,
                         f['operation'], f['filename'], diff, st, f]
             else:
+                _diff = c.rhodecode_repo.get_diff(
+                    commit1, commit2,
+                    ignore_whitespace=ign_whitespace_lcl, context=context_lcl)
+                diff_processor = diffs.DiffProcessor(_diff, format='gitdiff')
                 # downloads/raw we only need RAW diff nothing else
                 diff = diff_processor.as_raw()
                 commit_changes[''] = [None, None, None, None, diff, None, None]
@@ -32,6 +32,7 @@ from pylons.i18n.translation import _
 from rhodecode.controllers.utils import parse_path_ref, get_commit_from_ref_name
 from rhodecode.lib import helpers as h
 from rhodecode.lib import diffs
+from rhodecode.lib.diff_cache import get_diff_processor
 from rhodecode.lib.auth import LoginRequired, HasRepoPermissionAnyDecorator
 from rhodecode.lib.base import BaseRepoController, render
 from rhodecode.lib.utils import safe_str
@@ -235,13 +236,11 @@ class CompareController(BaseRepoController):
             h.flash(msg, category='error')
             raise HTTPBadRequest()
 
-        txtdiff = source_repo.scm_instance().get_diff(
-            commit1=source_commit, commit2=target_commit,
-            path1=source_path, path=target_path)
-        diff_processor = diffs.DiffProcessor(
-            txtdiff, format='gitdiff', diff_limit=diff_limit,
+        diff_processor = get_diff_processor(
+            source_repo.scm_instance(), source_commit, target_commit,
+            path1=source_path, path=target_path, diff_limit=diff_limit,
             file_limit=file_limit, show_full_diff=c.fulldiff)
-        _parsed = diff_processor.prepare()
+        _parsed = diff_processor.parsed_diff
 
         c.limited_diff = False
         if isinstance(_parsed, diffs.LimitedDiffContainer):
@@ -25,7 +25,6 @@ Files controller for RhodeCode Enterprise
 import itertools
 import logging
 import os
-import shutil
 import tempfile
 
 from pylons import request, response, tmpl_context as c, url
@@ -33,8 +32,10 @@ from pylons.i18n.translation import _
 from pylons.controllers.util import redirect
 from webob.exc import HTTPNotFound, HTTPBadRequest
 
+import rhodecode
 from rhodecode.controllers.utils import parse_path_ref
-from rhodecode.lib import diffs, helpers as h, caches
+from rhodecode.lib import diffs, file_tree_cache, helpers as h, caches
+from rhodecode.lib.archive_cache import get_archive_cache
 from rhodecode.lib.compat import OrderedDict
 from rhodecode.lib.utils import jsonify, action_logger
 from rhodecode.lib.utils2 import (
@@ -136,25 +137,18 @@ class FilesController(BaseRepoController):
         _namespace = caches.get_repo_namespace_key(namespace_type, repo_name)
         return caches.get_cache_manager('repo_cache_long', _namespace)
 
-    def _get_tree_at_commit(self, repo_name, commit_id, f_path,
-                            full_load=False, force=False):
-        def _cached_tree():
-            log.debug('Generating cached file tree for %s, %s, %s',
-                      repo_name, commit_id, f_path)
+    def _get_tree_at_commit(self, repo_name, commit, f_path,
+                            full_load=False):
+        def _render_tree(full_load):
             c.full_load = full_load
+            c.file_tree_commit_id = file_tree_cache.COMMIT_ID_PLACEHOLDER
+            if full_load:
+                ScmModel().preload_last_commits(commit, c.file)
             return render('files/files_browser_tree.html')
 
-        cache_manager = self.__get_tree_cache_manager(
-            repo_name, caches.FILE_TREE)
-
-        cache_key = caches.compute_key_from_params(
-            repo_name, commit_id, f_path)
-
-        if force:
-            # we want to force recompute of caches
-            cache_manager.remove_value(cache_key)
-
-        return cache_manager.get(cache_key, createfunc=_cached_tree)
+        return file_tree_cache.get_tree(
+            repo_name, commit, f_path, full_load, _render_tree,
+            rhodecode.CONFIG)
 
     def _get_nodelist_at_commit(self, repo_name, commit_id, f_path):
         def _cached_nodes():
@@ -235,7 +229,7 @@ class FilesController(BaseRepoController):
             else:
                 c.authors = []
                 c.file_tree = self._get_tree_at_commit(
-                    repo_name, c.commit.raw_id, f_path)
+                    repo_name, c.commit, c.file.path)
 
         except RepositoryError as e:
             h.flash(safe_str(e), category='error')
@@ -727,50 +721,51 @@ class FilesController(BaseRepoController):
             '-sub' if subrepos else '',
             safe_str(commit.short_id), ext)
 
-        use_cached_archive = False
-        archive_cache_enabled = CONFIG.get(
-            'archive_cache_dir') and not request.GET.get('no_cache')
-
-        if archive_cache_enabled:
-            # check if we it's ok to write
-            if not os.path.isdir(CONFIG['archive_cache_dir']):
-                os.makedirs(CONFIG['archive_cache_dir'])
-            cached_archive_path = os.path.join(
-                CONFIG['archive_cache_dir'], archive_name)
-            if os.path.isfile(cached_archive_path):
-                log.debug('Found cached archive in %s', cached_archive_path)
-                fd, archive = None, cached_archive_path
-                use_cached_archive = True
-            else:
-                log.debug('Archive %s is not yet cached', archive_name)
+        archive_streaming = str2bool(CONFIG.get('archive_streaming'))
+        archive_cache = None
+        if not request.GET.get('no_cache'):
+            archive_cache = get_archive_cache(CONFIG)
 
-        if not use_cached_archive:
-            # generate new archive
-            fd, archive = tempfile.mkstemp()
-            log.debug('Creating new temp archive in %s' % (archive,))
-            try:
-                commit.archive_repo(archive, kind=fileformat, subrepos=subrepos)
-            except ImproperArchiveTypeError:
-                return _('Unknown archive type')
-            if archive_cache_enabled:
-                # if we generated the archive and we have cache enabled
-                # let's use this for future
-                log.debug('Storing new archive in %s' % (cached_archive_path,))
-                shutil.move(archive, cached_archive_path)
-                archive = cached_archive_path
+        def create_archive(archive_path):
+            commit.archive_repo(
+                archive_path, kind=fileformat, subrepos=subrepos)
+
+        temp_archive = None
+        try:
+            if archive_cache and archive_streaming:
+                archive = archive_cache.get_or_stream(
+                    archive_name, lambda: commit.archive_repo_stream(
+                        kind=fileformat, subrepos=subrepos))
+            elif archive_cache:
+                archive = archive_cache.get_or_create(
+                    archive_name, create_archive)
+            elif archive_streaming:
+                archive = commit.archive_repo_stream(
+                    kind=fileformat, subrepos=subrepos)
+            else:
+                # generate new archive
+                fd, temp_archive = tempfile.mkstemp()
+                os.close(fd)
+                log.debug('Creating new temp archive in %s', temp_archive)
+                create_archive(temp_archive)
+                archive = open(temp_archive, 'rb')
+        except ImproperArchiveTypeError:
+            if temp_archive:
+                os.remove(temp_archive)
+            return _('Unknown archive type')
 
         def get_chunked_archive(archive):
-            with open(archive, 'rb') as stream:
-                while True:
-                    data = stream.read(16 * 1024)
-                    if not data:
-                        if fd:  # fd means we used temporary file
-                            os.close(fd)
-                        if not archive_cache_enabled:
-                            log.debug('Destroying temp archive %s', archive)
-                            os.remove(archive)
-                        break
-                    yield data
+            try:
+                with archive as stream:
+                    while True:
+                        data = stream.read(16 * 1024)
+                        if not data:
+                            break
+                        yield data
+            finally:
+                if temp_archive:
+                    log.debug('Destroying temp archive %s', temp_archive)
+                    os.remove(temp_archive)
 
         # store download action
         action_logger(user=c.rhodecode_user,
@@ -780,6 +775,8 @@ class FilesController(BaseRepoController):
             'attachment; filename=%s' % archive_name)
         response.content_type = str(content_type)
 
+        if archive_streaming:
+            return archive
         return get_chunked_archive(archive)
 
     @LoginRequired()
@@ -1106,9 +1103,7 @@ class FilesController(BaseRepoController):
         c.file = dir_node
         c.commit = commit
 
-        # using force=True here, make a little trick. We flush the cache and
-        # compute it using the same key as without full_load, so the fully
-        # loaded cached tree is now returned instead of partial
+        # the fully loaded tree is cached as well, later views of the same
+        # commit get it instead of the partial one
         return self._get_tree_at_commit(
-            repo_name, commit.raw_id, dir_node.path, full_load=True,
-            force=True)
+            repo_name, commit, dir_node.path, full_load=True)
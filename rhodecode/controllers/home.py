@@ -177,19 +177,23 @@ class HomeController(BaseController):
         auth_user = AuthUser(
             user_id=c.rhodecode_user.user_id, ip_addr=self.ip_addr)
         searcher = searcher_from_config(config)
-        result = searcher.search(
-            'commit_id:%s*' % commit_hash_prefix, 'commit', auth_user)
-
-        return [
-            {
-                'id': entry['commit_id'],
-                'text': entry['commit_id'],
-                'type': 'commit',
-                'obj': {'repo': entry['repository']},
-                'url': url('changeset_home',
-                    repo_name=entry['repository'], revision=entry['commit_id'])
-            }
-            for entry in result['results']]
+        try:
+            result = searcher.search(
+                'commit_id:%s*' % commit_hash_prefix, 'commit', auth_user)
+
+            return [
+                {
+                    'id': entry['commit_id'],
+                    'text': entry['commit_id'],
+                    'type': 'commit',
+                    'obj': {'repo': entry['repository']},
+                    'url': url('changeset_home',
+                        repo_name=entry['repository'],
+                        revision=entry['commit_id'])
+                }
+                for entry in result['results']]
+        finally:
+            searcher.cleanup()
 
     @LoginRequired()
     @XHRRequired()
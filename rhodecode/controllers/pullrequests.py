@@ -33,8 +33,9 @@ from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import or_
 
 from rhodecode import events
-from rhodecode.lib import auth, diffs, helpers as h
+from rhodecode.lib import auth, helpers as h
 from rhodecode.lib.ext_json import json
+from rhodecode.lib.diff_cache import get_diff_processor
 from rhodecode.lib.base import (
     BaseRepoController, render, vcs_operation_context)
 from rhodecode.lib.auth import (
@@ -121,11 +122,12 @@ class PullrequestsController(BaseRepoController):
             _parsed = []
             c.missing_commits = True
         else:
-            vcs_diff = PullRequestModel().get_diff(pull_request)
-            diff_processor = diffs.DiffProcessor(
-                vcs_diff, format='gitdiff', diff_limit=diff_limit,
-                file_limit=file_limit, show_full_diff=c.fulldiff)
-            _parsed = diff_processor.prepare()
+            diff_processor = get_diff_processor(
+                source_repo.scm_instance(), target_commit, source_commit,
+                context=PullRequestModel.DIFF_CONTEXT, diff_limit=diff_limit,
+                file_limit=file_limit, show_full_diff=c.fulldiff,
+                get_diff=lambda: PullRequestModel().get_diff(pull_request))
+            _parsed = diff_processor.parsed_diff
 
         c.limited_diff = isinstance(_parsed, LimitedDiffContainer)
 
@@ -23,7 +23,6 @@ Summary controller for RhodeCode Enterprise
 """
 
 import logging
-from string import lower
 
 from pylons import tmpl_context as c, request
 from pylons.i18n.translation import _
@@ -39,6 +38,7 @@ from rhodecode.lib.auth import (
     LoginRequired, HasRepoPermissionAnyDecorator, NotAnonymous, XHRRequired)
 from rhodecode.lib.base import BaseRepoController, render
 from rhodecode.lib.markup_renderer import MarkupRenderer
+from rhodecode.lib.repo_stats import RepoStats
 from rhodecode.lib.ext_json import json
 from rhodecode.lib.vcs.backends.base import EmptyCommit
 from rhodecode.lib.vcs.exceptions import (
@@ -188,18 +188,14 @@ class SummaryController(BaseRepoController):
             try:
                 scm_instance = c.rhodecode_db_repo.scm_instance()
                 commit = scm_instance.get_commit(commit_id)
-
-                for node in commit.get_filenodes_generator():
-                    size += node.size
-                    if not show_stats:
-                        continue
-                    ext = lower(node.extension)
-                    ext_info = LANGUAGES_EXTENSIONS_MAP.get(ext)
-                    if ext_info:
-                        if ext in code_stats:
-                            code_stats[ext]['count'] += 1
-                        else:
-                            code_stats[ext] = {"count": 1, "desc": ext_info}
+                commit_stats = RepoStats(repo_name).get_stats(commit)
+                size = commit_stats['size']
+                if show_stats:
+                    for ext, ext_stats in commit_stats['extensions'].items():
+                        ext_info = LANGUAGES_EXTENSIONS_MAP.get(ext)
+                        if ext_info:
+                            code_stats[ext] = {
+                                "count": ext_stats['count'], "desc": ext_info}
             except EmptyRepositoryError:
                 pass
             return {'size': h.format_byte_size_binary(size),
@@ -43,6 +43,10 @@ def trigger(event, registry=None):
     if isinstance(event, RhodecodeEvent):
         integrations_event_handler(event)
 
+    # the search indexer is notified in the same way
+    from rhodecode.lib.index.indexer import push_event_handler
+    push_event_handler(event)
+
 
 from rhodecode.events.base import RhodecodeEvent
 
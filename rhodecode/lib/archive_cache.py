@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Cache of generated repository archives, stored in `archive_cache_dir`.
+
+Archives are built only once, even if several requests (from any worker
+process) ask for the same archive at the same time: the build is guarded by a
+file lock per archive and the result is moved into place atomically. Streamed
+archives are passed on to the first client while they are written, the other
+requests wait for the lock and read the stored archive. The total size of the
+cache can be limited, the least recently used archives are evicted first.
+"""
+
+import logging
+import os
+import tempfile
+import time
+
+from beaker.synchronization import file_synchronizer
+
+from rhodecode.lib.cache_utils import CacheStats, ProcessWideInstances
+from rhodecode.lib.utils2 import safe_int
+
+log = logging.getLogger(__name__)
+
+LOCK_DIR = '.locks'
+TMP_PREFIX = '.tmp-'
+CHUNK_SIZE = 16 * 1024
+
+
+class _LockedStream(object):
+    """
+    Iterator over `chunks` which holds `lock` until it is exhausted or
+    closed, also if it is closed before the iteration started.
+    """
+
+    def __init__(self, chunks, lock):
+        self._chunks = chunks
+        self._lock = lock
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self._lock is None:
+            return
+        lock, self._lock = self._lock, None
+        try:
+            self._chunks.close()
+        finally:
+            lock.release_write_lock()
+
+
+def _iter_file(fileobj, chunk_size):
+    with fileobj:
+        while True:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+
+class ArchiveCache(object):
+    """
+    Manages the archives stored in `cache_dir`.
+
+    :param cache_dir: directory which holds the archives.
+    :param max_size: maximum amount of bytes used by all archives, ``0`` or
+        ``None`` disables the eviction.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size or 0
+        self._stats = CacheStats(
+            'builds', 'build_time', 'evictions', 'evicted_bytes')
+
+    def __repr__(self):
+        return '<ArchiveCache(%s, max_size=%s)>' % (
+            self.cache_dir, self.max_size)
+
+    def get_stats(self):
+        return self._stats.get_stats()
+
+    def get_path(self, archive_name):
+        return os.path.join(self.cache_dir, archive_name)
+
+    def _get_lock(self, archive_name):
+        return file_synchronizer(
+            identifier='archive_%s' % (archive_name, ),
+            lock_dir=os.path.join(self.cache_dir, LOCK_DIR))
+
+    def _touch(self, archive_path):
+        # the modification time is used to track the last access
+        try:
+            os.utime(archive_path, None)
+        except OSError:
+            log.warning('Failed to update access time of %s', archive_path)
+
+    def get_or_create(self, archive_name, create_func):
+        """
+        Returns a file object of the cached archive `archive_name`, creating
+        it first by calling ``create_func(path)`` if it does not exist.
+
+        The archive is opened before the lock is released, so that it can be
+        read completely even if it is evicted in the meantime.
+        """
+        archive_path = self.get_path(archive_name)
+        archive_file = self._open_cached(archive_path)
+        if archive_file is not None:
+            return archive_file
+
+        lock = self._get_lock(archive_name)
+        lock.acquire_write_lock()
+        try:
+            if os.path.isfile(archive_path):
+                # another request has built it while we waited for the lock
+                log.debug('Archive %s built by a concurrent request',
+                          archive_name)
+                self._stats.count('hits')
+                self._touch(archive_path)
+            else:
+                self._stats.count('misses')
+                self._build(archive_path, create_func)
+                self.evict(keep=archive_path)
+            return open(archive_path, 'rb')
+        finally:
+            lock.release_write_lock()
+
+    def get_or_stream(self, archive_name, stream_func,
+                      chunk_size=CHUNK_SIZE):
+        """
+        Returns an iterator over the chunks of the cached archive
+        `archive_name`.
+
+        If it is not cached, the chunks of the iterator returned by
+        ``stream_func()`` are passed on while they are written into the cache,
+        so the client does not wait for the whole archive. The archive is
+        moved into place once the stream is complete. Until then the lock of
+        the archive is held, concurrent requests wait for it and read the
+        stored archive afterwards.
+        """
+        archive_path = self.get_path(archive_name)
+        archive_file = self._open_cached(archive_path)
+        if archive_file is not None:
+            return _iter_file(archive_file, chunk_size)
+
+        stream = stream_func()
+        lock = self._get_lock(archive_name)
+        try:
+            if not lock.acquire_write_lock(wait=False):
+                log.debug('Waiting for archive %s streamed by a concurrent '
+                          'request', archive_name)
+                lock.acquire_write_lock()
+        except (IOError, OSError):
+            log.warning('Failed to lock archive %s, streaming it without '
+                        'caching', archive_name, exc_info=True)
+            self._stats.count('misses')
+            return stream
+
+        try:
+            # another request may have stored it in the meantime
+            archive_file = self._open_cached(archive_path)
+        except Exception:
+            lock.release_write_lock()
+            raise
+        if archive_file is not None:
+            lock.release_write_lock()
+            return _iter_file(archive_file, chunk_size)
+
+        self._stats.count('misses')
+        return _LockedStream(
+            self._stream_and_store(archive_path, stream), lock)
+
+    def _open_cached(self, archive_path):
+        """
+        Returns the opened archive `archive_path` or ``None`` if it is not
+        cached.
+        """
+        try:
+            archive_file = open(archive_path, 'rb')
+        except IOError:
+            return None
+        log.debug('Found cached archive in %s', archive_path)
+        self._stats.count('hits')
+        self._touch(archive_path)
+        return archive_file
+
+    def _stream_and_store(self, archive_path, stream):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=self.cache_dir)
+        log.debug('Streaming new archive %s into %s', archive_path, tmp_path)
+        start = time.time()
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                for chunk in stream:
+                    tmp_file.write(chunk)
+                    yield chunk
+            os.rename(tmp_path, archive_path)
+        finally:
+            # the client may have closed the connection before the end
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        build_time = time.time() - start
+        log.debug('Stored new archive %s, build took %.3fs',
+                  archive_path, build_time)
+        self._stats.count('builds')
+        self._stats.count('build_time', build_time)
+        self.evict(keep=archive_path)
+
+    def _build(self, archive_path, create_func):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=self.cache_dir)
+        os.close(fd)
+        log.debug('Creating new archive %s in %s', archive_path, tmp_path)
+        start = time.time()
+        try:
+            create_func(tmp_path)
+            os.rename(tmp_path, archive_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        build_time = time.time() - start
+        log.debug('Stored new archive %s, build took %.3fs',
+                  archive_path, build_time)
+        self._stats.count('builds')
+        self._stats.count('build_time', build_time)
+
+    def _archives(self):
+        """
+        Returns a list of ``(mtime, size, path)`` for all stored archives.
+        """
+        archives = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            archives.append((st.st_mtime, st.st_size, path))
+        return archives
+
+    def _remove_lock(self, archive_name):
+        lock_path = getattr(self._get_lock(archive_name), 'filename', None)
+        if lock_path:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used archives, and their lock files,
+        until the cache fits into `max_size` again. The archive `keep` is
+        never removed.
+        """
+        if not self.max_size:
+            return
+
+        archives = self._archives()
+        total_size = sum(size for _mtime, size, _path in archives)
+        for _mtime, size, path in sorted(archives):
+            if total_size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                log.warning('Failed to evict cached archive %s', path)
+                continue
+            log.debug('Evicted cached archive %s', path)
+            self._remove_lock(os.path.basename(path))
+            total_size -= size
+            self._stats.count('evictions')
+            self._stats.count('evicted_bytes', size)
+
+
+_archive_caches = ProcessWideInstances(ArchiveCache)
+
+
+def get_archive_cache(config):
+    """
+    Returns the process wide `ArchiveCache` for the given `config` or
+    ``None`` if the archive cache is not enabled.
+    """
+    cache_dir = config.get('archive_cache_dir')
+    if not cache_dir:
+        return None
+    max_size = safe_int(config.get('archive_cache_max_size'), 0)
+    return _archive_caches.get(cache_dir, cache_dir, max_size)
@@ -50,7 +50,7 @@ from rhodecode.model.user import UserModel
 from rhodecode.model.db import (
     User, Repository, Permission, UserToPerm, UserGroupToPerm, UserGroupMember,
     UserIpMap, UserApiKeys)
-from rhodecode.lib import caches
+from rhodecode.lib.permission_cache import get_permission_cache
 from rhodecode.lib.utils2 import safe_unicode, aslist, safe_str, md5
 from rhodecode.lib.utils import (
     get_repo_slug, get_repo_group_slug, get_user_group_slug)
@@ -347,6 +347,19 @@ class PermOriginDict(dict):
         self.perm_origin_stack.setdefault(key, []).append((perm, origin))
         dict.__setitem__(self, key, perm)
 
+    def __reduce__(self):
+        # pickle would restore the items through `__setitem__` without their
+        # origin, so they are restored from the origin stack instead
+        return _perm_origin_dict_from_stack, (self.perm_origin_stack, )
+
+
+def _perm_origin_dict_from_stack(perm_origin_stack):
+    perms = PermOriginDict()
+    for key, stack in perm_origin_stack.iteritems():
+        for perm, origin in stack:
+            perms[key] = perm, origin
+    return perms
+
 
 class PermissionCalculator(object):
 
@@ -799,7 +812,7 @@ class AuthUser(object):
 
     @LazyProperty
     def permissions(self):
-        return self.get_perms(user=self, cache=False)
+        return self.get_perms(user=self)
 
     def permissions_with_scope(self, scope):
         """
@@ -826,7 +839,7 @@ class AuthUser(object):
             # store in cache to mimic how the @LazyProperty works,
             # the difference here is that we use the unique key calculated
             # from params and values
-            res = self.get_perms(user=self, cache=False, scope=_scope)
+            res = self.get_perms(user=self, scope=_scope)
             self._permissions_scoped_cache[cache_key] = res
         return self._permissions_scoped_cache[cache_key]
 
@@ -887,12 +900,12 @@ class AuthUser(object):
 
         log.debug('Auth User is now %s' % self)
 
-    def get_perms(self, user, scope=None, explicit=True, algo='higherwin',
-                  cache=False):
+    def get_perms(self, user, scope=None, explicit=True, algo='higherwin'):
         """
         Fills user permission attribute with permissions taken from database
         works for permissions given for repositories, and for permissions that
-        are granted to groups
+        are granted to groups. The result is taken from the permission cache
+        if the `permissions` cache region is configured.
 
         :param user: instance of User object from database
         :param explicit: In case there are permissions both for user and a group
@@ -911,11 +924,20 @@ class AuthUser(object):
         user_inherit_default_permissions = user.inherit_default_permissions
 
         log.debug('Computing PERMISSION tree for scope %s' % (scope, ))
-        compute = caches.conditional_cache(
-            'short_term', 'cache_desc',
-            condition=cache, func=_cached_perms_data)
-        result = compute(user_id, scope, user_is_admin,
-                         user_inherit_default_permissions, explicit, algo)
+        permission_cache = get_permission_cache()
+        if permission_cache:
+            scope_params = sorted((scope or {}).items())
+            result = permission_cache.get_permissions(
+                user_id,
+                (scope_params, user_is_admin,
+                 user_inherit_default_permissions, explicit, algo),
+                lambda: _cached_perms_data(
+                    user_id, scope, user_is_admin,
+                    user_inherit_default_permissions, explicit, algo))
+        else:
+            result = _cached_perms_data(
+                user_id, scope, user_is_admin,
+                user_inherit_default_permissions, explicit, algo)
 
         result_repr = []
         for k in result:
@@ -1496,6 +1518,11 @@ class HasUserGroupPermissionAnyDecorator(PermsDecorator):
 class PermsFunction(object):
     """Base function for other check functions"""
 
+    # section of the permissions of the user which is checked by
+    # `filter_allowed`, and if all or any of the required permissions are needed
+    perms_section = None
+    require_all = False
+
     def __init__(self, *perms):
         self.required_perms = set(perms)
         self.repo_name = None
@@ -1513,7 +1540,7 @@ class PermsFunction(object):
         return False
     __nonzero__ = __bool__
 
-    def __call__(self, check_location='', user=None):
+    def _get_auth_user(self, user):
         if not user:
             log.debug('Using user attribute from global request')
             # TODO: remove this someday,put as user as attribute here
@@ -1523,6 +1550,10 @@ class PermsFunction(object):
         if not isinstance(user, AuthUser):
             log.debug('Wrapping user %s into AuthUser', user)
             user = AuthUser(user.user_id)
+        return user
+
+    def __call__(self, check_location='', user=None):
+        user = self._get_auth_user(user)
 
         cls_name = self.__class__.__name__
         check_scope = self._get_check_scope(cls_name)
@@ -1560,6 +1591,37 @@ class PermsFunction(object):
         """Dummy function for overriding"""
         raise Exception('You have to write this function in child class')
 
+    def filter_allowed(self, names, check_location='', user=None):
+        """
+        Returns the list of `names` for which the permission check passes,
+        in the same order. All names are checked in one pass over the
+        permissions of the user, this is much cheaper than calling the
+        check function for every single name.
+        """
+        if not self.perms_section:
+            raise Exception(
+                '%s does not support bulk checks' % self.__class__.__name__)
+
+        user = self._get_auth_user(user)
+        check_location = check_location or 'unspecified location'
+        if not user:
+            log.warning('Empty user given for permission check')
+            return []
+
+        section_perms = user.permissions[self.perms_section]
+        required_perms = self.required_perms
+        if self.require_all:
+            allowed = [name for name in names if name in section_perms and
+                       required_perms.issubset([section_perms[name]])]
+        else:
+            allowed = [name for name in names
+                       if section_perms.get(name) in required_perms]
+
+        log.debug('checked cls:%s %s usr:%s for %s objects @ %s, %s GRANTED',
+                  self.__class__.__name__, required_perms, user, len(names),
+                  check_location, len(allowed))
+        return allowed
+
 
 class HasPermissionAll(PermsFunction):
     def check_permissions(self, user):
@@ -1578,6 +1640,9 @@ class HasPermissionAny(PermsFunction):
 
 
 class HasRepoPermissionAll(PermsFunction):
+    perms_section = 'repositories'
+    require_all = True
+
     def __call__(self, repo_name=None, check_location='', user=None):
         self.repo_name = repo_name
         return super(HasRepoPermissionAll, self).__call__(check_location, user)
@@ -1597,6 +1662,8 @@ class HasRepoPermissionAll(PermsFunction):
 
 
 class HasRepoPermissionAny(PermsFunction):
+    perms_section = 'repositories'
+
     def __call__(self, repo_name=None, check_location='', user=None):
         self.repo_name = repo_name
         return super(HasRepoPermissionAny, self).__call__(check_location, user)
@@ -1616,6 +1683,8 @@ class HasRepoPermissionAny(PermsFunction):
 
 
 class HasRepoGroupPermissionAny(PermsFunction):
+    perms_section = 'repositories_groups'
+
     def __call__(self, group_name=None, check_location='', user=None):
         self.repo_group_name = group_name
         return super(HasRepoGroupPermissionAny, self).__call__(
@@ -1634,6 +1703,9 @@ class HasRepoGroupPermissionAny(PermsFunction):
 
 
 class HasRepoGroupPermissionAll(PermsFunction):
+    perms_section = 'repositories_groups'
+    require_all = True
+
     def __call__(self, group_name=None, check_location='', user=None):
         self.repo_group_name = group_name
         return super(HasRepoGroupPermissionAll, self).__call__(
@@ -1652,6 +1724,8 @@ class HasRepoGroupPermissionAll(PermsFunction):
 
 
 class HasUserGroupPermissionAny(PermsFunction):
+    perms_section = 'user_groups'
+
     def __call__(self, user_group_name=None, check_location='', user=None):
         self.user_group_name = user_group_name
         return super(HasUserGroupPermissionAny, self).__call__(
@@ -1669,6 +1743,9 @@ class HasUserGroupPermissionAny(PermsFunction):
 
 
 class HasUserGroupPermissionAll(PermsFunction):
+    perms_section = 'user_groups'
+    require_all = True
+
     def __call__(self, user_group_name=None, check_location='', user=None):
         self.user_group_name = user_group_name
         return super(HasUserGroupPermissionAll, self).__call__(
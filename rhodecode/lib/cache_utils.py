@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Helpers shared by the in-process caches, e.g. the archive and the file tree
+cache.
+"""
+
+import threading
+
+
+class CacheStats(object):
+    """
+    Thread safe counters of a cache. The `hits` and `misses` are always
+    counted, further counters are given by `keys`.
+    """
+
+    def __init__(self, *keys):
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('hits', 'misses') + keys, 0)
+
+    def count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def get_stats(self):
+        """
+        Returns a copy of the counters, together with the `hit_rate`.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / float(requests) if requests else 0
+        return stats
+
+
+class ProcessWideInstances(object):
+    """
+    Holds the process wide instances created by `factory`, one per key.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def get(self, key=None, *args):
+        """
+        Returns the instance for `key`. It is created by calling
+        ``factory(*args)`` if there is none yet or if it was created with
+        different `args`, e.g. after the configuration changed.
+        """
+        with self._lock:
+            entry = self._instances.get(key)
+            if entry is None or entry[0] != args:
+                entry = (args, self._factory(*args))
+                self._instances[key] = entry
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
@@ -29,13 +29,13 @@ from rhodecode.model.db import Session, CacheKey, IntegrityError
 
 log = logging.getLogger(__name__)
 
-FILE_TREE = 'cache_file_tree'
 FILE_TREE_META = 'cache_file_tree_metadata'
 FILE_SEARCH_TREE_META = 'cache_file_search_metadata'
 SUMMARY_STATS = 'cache_summary_stats'
+REPO_STATS = 'cache_repo_stats'
 
 # This list of caches gets purged when invalidation happens
-USED_REPO_CACHES = (FILE_TREE, FILE_SEARCH_TREE_META)
+USED_REPO_CACHES = (FILE_SEARCH_TREE_META, )
 
 DEFAULT_CACHE_MANAGER_CONFIG = {
     'type': 'memorylru_base',
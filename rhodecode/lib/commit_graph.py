@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Persistent commit graph index of a repository, stored in `commit_graph_dir`.
+
+The index maps each commit index to the indexes of its parents and to its
+generation number, so that the changelog graph can be computed without asking
+the VCS backend for the parents of each commit. It is built by the
+``commit-graph`` paster command and updated incrementally afterwards: only the
+parents of commits added since the last update are looked up.
+
+The incremental update relies on the commit ids of a repository only growing
+at the end, unless history is rewritten. Mercurial and Subversion number their
+commits this way. The commit ids of git are only kept in this order by the
+commit id index, see :mod:`rhodecode.lib.vcs.backends.git.commit_index`, so
+the commit graph index of git repositories is only used if
+`git_commit_index_dir` is set as well.
+
+File layout, all numbers are native 32 bit integers::
+
+    header (magic, format version, commit count, parent count, id length)
+    id of the last indexed commit
+    parent offsets, one per commit plus one
+    generation numbers, one per commit
+    parent indexes
+"""
+
+import array
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from rhodecode.lib.graphmod import get_parent_indexes_func
+from rhodecode.lib.utils2 import safe_str
+
+log = logging.getLogger(__name__)
+
+MAGIC = 'RCCG'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('=4sIIII')
+INT_SIZE = array.array('i').itemsize
+
+# amount of commits for which the parents are looked up at once
+UPDATE_CHUNK_SIZE = 1000
+
+# maximum amount of new commits which are added to an index within a request
+MAX_UPDATE_COUNT = 10000
+
+# state of the repositories for which the update of the index failed
+_failed_updates = {}
+_failed_updates_lock = threading.Lock()
+
+
+class CommitGraph(object):
+    """
+    Read only view on a stored commit graph index, the file is memory mapped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, self.parent_count, id_len = \
+            HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Unsupported commit graph index %s' % (path, ))
+
+        offset = HEADER.size
+        self.last_commit_id = self._data[offset:offset + id_len]
+        self._offsets_pos = offset + id_len
+        self._generations_pos = self._offsets_pos + (
+            (self.count + 1) * INT_SIZE)
+        self._parents_pos = self._generations_pos + self.count * INT_SIZE
+
+    def __repr__(self):
+        return '<CommitGraph(%s, count=%s)>' % (self.path, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def _int(self, pos, idx):
+        return struct.unpack_from('=i', self._data, pos + idx * INT_SIZE)[0]
+
+    def _array(self, pos, length):
+        values = array.array('i')
+        values.fromstring(self._data[pos:pos + length * INT_SIZE])
+        return values
+
+    def parents(self, idx):
+        start, end = struct.unpack_from(
+            '=ii', self._data, self._offsets_pos + idx * INT_SIZE)
+        if start == end:
+            return []
+        return list(struct.unpack_from(
+            '=%di' % (end - start, ), self._data,
+            self._parents_pos + start * INT_SIZE))
+
+    def generation(self, idx):
+        return self._int(self._generations_pos, idx)
+
+    def is_valid_for(self, commit_ids):
+        """
+        Checks that this index describes the beginning of `commit_ids`.
+
+        Commits are only ever appended, see the module documentation. If the
+        last indexed commit moved the history was rewritten and the index has
+        to be built again.
+        """
+        if self.count > len(commit_ids):
+            return False
+        if not self.count:
+            return True
+        return safe_str(commit_ids[self.count - 1]) == self.last_commit_id
+
+    def arrays(self):
+        """
+        Returns copies of the ``(offsets, generations, parents)`` arrays.
+        """
+        return (
+            self._array(self._offsets_pos, self.count + 1),
+            self._array(self._generations_pos, self.count),
+            self._array(self._parents_pos, self.parent_count))
+
+    def close(self):
+        self._data.close()
+
+
+def _write(path, last_commit_id, offsets, generations, parents):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    last_commit_id = safe_str(last_commit_id)
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, len(generations), len(parents),
+                len(last_commit_id)))
+            f.write(last_commit_id)
+            offsets.tofile(f)
+            generations.tofile(f)
+            parents.tofile(f)
+        # readers have the old file mapped, so it is replaced atomically
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def update_commit_graph(repo, path, commit_graph=None):
+    """
+    Updates the index at `path` for the vcs repository `repo` and returns it.
+
+    If the existing `commit_graph` is still valid only the commits which have
+    been added since are looked up, otherwise the index is built from scratch.
+    """
+    commit_ids = repo.commit_ids
+    if commit_graph is not None and commit_graph.is_valid_for(commit_ids):
+        offsets, generations, parents = commit_graph.arrays()
+    else:
+        offsets, generations, parents = (
+            array.array('i', [0]), array.array('i'), array.array('i'))
+
+    start = len(generations)
+    if start == len(commit_ids) and commit_graph is not None:
+        return commit_graph
+
+    log.debug('Updating commit graph of %s from commit %s to %s',
+              repo, start, len(commit_ids))
+    get_parent_indexes = get_parent_indexes_func(repo)
+    for chunk_start in xrange(start, len(commit_ids), UPDATE_CHUNK_SIZE):
+        indexes = range(
+            chunk_start, min(chunk_start + UPDATE_CHUNK_SIZE, len(commit_ids)))
+        for idx, parent_indexes in zip(indexes, get_parent_indexes(indexes)):
+            generation = 1
+            for parent_idx in parent_indexes:
+                if not 0 <= parent_idx < idx:
+                    raise ValueError(
+                        'Commit %s of %s is not in topological order' % (
+                            idx, repo))
+                generation = max(generation, generations[parent_idx] + 1)
+            parents.extend(parent_indexes)
+            offsets.append(len(parents))
+            generations.append(generation)
+
+    last_commit_id = commit_ids[-1] if commit_ids else ''
+    _write(path, last_commit_id, offsets, generations, parents)
+    return CommitGraph(path)
+
+
+def get_commit_graph_path(repo, config):
+    """
+    Returns the path of the index for the vcs repository `repo` or ``None``
+    if the commit graph index is not enabled for it.
+    """
+    graph_dir = config.get('commit_graph_dir')
+    if not graph_dir:
+        return None
+    if repo.alias == 'git' and not config.get('git_commit_index_dir'):
+        # without the commit id index new commits are not always appended
+        return None
+    name = hashlib.sha1(safe_str(repo.path)).hexdigest()
+    return os.path.join(graph_dir, '%s.%s' % (name, repo.alias))
+
+
+def build_commit_graph(repo, config):
+    """
+    Builds the index of the vcs repository `repo` from scratch and returns
+    it, or ``None`` if the commit graph index is not enabled for it.
+
+    This looks up the parents of every commit, it is done by the
+    ``commit-graph`` paster command and not within requests.
+    """
+    path = get_commit_graph_path(repo, config)
+    if not path:
+        return None
+    commit_graph = update_commit_graph(repo, path)
+    with _failed_updates_lock:
+        _failed_updates.pop(path, None)
+    return commit_graph
+
+
+def _repo_state(commit_ids):
+    return len(commit_ids), commit_ids[-1] if commit_ids else None
+
+
+def get_commit_graph(repo, config):
+    """
+    Returns the up to date `CommitGraph` of the vcs repository `repo`.
+
+    An existing index is extended by the commits which have been added since
+    it was written, if they are not more than `MAX_UPDATE_COUNT`. Indexes are
+    never built from scratch here, see :func:`build_commit_graph`.
+
+    ``None`` is returned if the commit graph index is not enabled for `repo`,
+    does not exist yet, has been made invalid by rewritten history or could
+    not be updated, callers have to ask the repository instead. A failed
+    update is not tried again until the repository changes.
+    """
+    path = get_commit_graph_path(repo, config)
+    if not path or not os.path.isfile(path):
+        return None
+
+    try:
+        commit_graph = CommitGraph(path)
+    except Exception:
+        log.exception('Failed to read commit graph index %s', path)
+        return None
+
+    commit_ids = repo.commit_ids
+    if not commit_graph.is_valid_for(commit_ids):
+        log.debug('Commit graph index %s is outdated by rewritten history',
+                  path)
+        return None
+    if commit_graph.count == len(commit_ids):
+        return commit_graph
+    if len(commit_ids) - commit_graph.count > MAX_UPDATE_COUNT:
+        log.debug('Too many new commits to update commit graph index %s',
+                  path)
+        return None
+
+    state = _repo_state(commit_ids)
+    with _failed_updates_lock:
+        if _failed_updates.get(path) == state:
+            return None
+    try:
+        return update_commit_graph(repo, path, commit_graph=commit_graph)
+    except Exception:
+        log.exception('Failed to update commit graph index %s', path)
+        with _failed_updates_lock:
+            _failed_updates[path] = state
+        return None
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Cache of parsed diffs, stored in `diff_cache_dir`.
+
+The diff between two commits never changes, so the parsed result of a diff is
+stored under a key built from the repository, both commit ids and all options
+which influence the result. Repeated views of the same diff skip the call to
+the VCSServer and the parsing. The files are handled like cached archives,
+see :class:`rhodecode.lib.archive_cache.ArchiveCache`: concurrent requests
+parse a diff only once and the total size can be limited.
+
+Subversion repositories are not cached, their commit ids are revision numbers
+which are re-used if a repository is created again under the same path.
+"""
+
+import cPickle as pickle
+import hashlib
+import logging
+import zlib
+
+import rhodecode
+from rhodecode.lib.archive_cache import ArchiveCache
+from rhodecode.lib.cache_utils import ProcessWideInstances
+from rhodecode.lib.diffs import (
+    DiffProcessor, LimitedDiffContainer, get_inline_diff_settings)
+from rhodecode.lib.utils2 import safe_int, safe_str
+
+log = logging.getLogger(__name__)
+
+# increase if the format of the parsed diff changes
+FORMAT_VERSION = 1
+
+CACHED_BACKENDS = ('git', 'hg')
+
+
+def _serialize(diff_processor):
+    files = list(diff_processor.parsed_diff)
+    data = (FORMAT_VERSION, files, diff_processor.limited_diff,
+            diff_processor.cur_diff_size)
+    return zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+
+def _deserialize(data, processor_kwargs):
+    version, files, limited_diff, cur_diff_size = pickle.loads(
+        zlib.decompress(data))
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported diff cache format %s' % (version, ))
+
+    diff_processor = DiffProcessor(None, **processor_kwargs)
+    diff_processor.cur_diff_size = cur_diff_size
+    diff_processor.limited_diff = limited_diff
+    if limited_diff:
+        files = LimitedDiffContainer(
+            diff_processor.diff_limit, cur_diff_size, files)
+    diff_processor.parsed_diff = files
+    diff_processor.parsed = True
+    return diff_processor
+
+
+def _parse(get_diff, processor_kwargs):
+    diff_processor = DiffProcessor(get_diff(), **processor_kwargs)
+    diff_processor.prepare()
+    return diff_processor
+
+
+class _NotCacheable(Exception):
+    """
+    Raised while creating a cache entry which must not be stored.
+    """
+
+
+class DiffCache(object):
+    """
+    Stores parsed diffs in `cache_dir`, using at most `max_size` bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size or 0
+        self._store = ArchiveCache(cache_dir, max_size=max_size)
+
+    def __repr__(self):
+        return '<DiffCache(%s, max_size=%s)>' % (
+            self.cache_dir, self.max_size)
+
+    def get_stats(self):
+        return self._store.get_stats()
+
+    def get_diff_processor(self, key, get_diff, processor_kwargs):
+        """
+        Returns a prepared `DiffProcessor` for the diff identified by `key`.
+        If it is not cached, the diff is fetched by calling `get_diff` and
+        parsed.
+        """
+        name = '%s.diff' % (hashlib.sha1(repr(key)).hexdigest(), )
+        created = []
+
+        def create(path):
+            diff_processor = _parse(get_diff, processor_kwargs)
+            created.append(diff_processor)
+            if diff_processor.inline_diff_timed_out:
+                # the highlighting depends on the load of the server, so it
+                # is not stored permanently
+                raise _NotCacheable()
+            with open(path, 'wb') as f:
+                f.write(_serialize(diff_processor))
+
+        try:
+            with self._store.get_or_create(name, create) as cached_file:
+                if created:
+                    return created[0]
+                data = cached_file.read()
+        except _NotCacheable:
+            log.debug('Not caching diff %s, its inline diff timed out', name)
+            return created[0]
+
+        try:
+            return _deserialize(data, processor_kwargs)
+        except Exception:
+            log.exception('Failed to read cached diff %s', name)
+            return _parse(get_diff, processor_kwargs)
+
+
+_diff_caches = ProcessWideInstances(DiffCache)
+
+
+def get_diff_cache(config):
+    """
+    Returns the process wide `DiffCache` for the given `config` or ``None``
+    if the diff cache is not enabled.
+    """
+    cache_dir = config.get('diff_cache_dir')
+    if not cache_dir:
+        return None
+    max_size = safe_int(config.get('diff_cache_max_size'), 0)
+    return _diff_caches.get(cache_dir, cache_dir, max_size)
+
+
+def get_diff_processor(
+        vcs_repo, commit1, commit2, path=None, path1=None,
+        ignore_whitespace=False, context=3, diff_limit=None, file_limit=None,
+        show_full_diff=True, get_diff=None):
+    """
+    Returns a prepared `DiffProcessor` for the diff between `commit1` and
+    `commit2` of the vcs repository `vcs_repo`, from the diff cache if it is
+    enabled.
+
+    :param get_diff: optional function which returns the vcs diff, by
+        default ``vcs_repo.get_diff`` is called with the given arguments.
+    """
+    if get_diff is None:
+        def get_diff():
+            return vcs_repo.get_diff(
+                commit1, commit2, path=path, ignore_whitespace=ignore_whitespace,
+                context=context, path1=path1)
+
+    processor_kwargs = {
+        'format': 'gitdiff',
+        'diff_limit': diff_limit,
+        'file_limit': file_limit,
+        'show_full_diff': show_full_diff,
+    }
+
+    diff_cache = get_diff_cache(rhodecode.CONFIG)
+    if diff_cache is None or vcs_repo.alias not in CACHED_BACKENDS:
+        return _parse(get_diff, processor_kwargs)
+
+    key = (
+        FORMAT_VERSION, vcs_repo.alias, safe_str(vcs_repo.path),
+        commit1.raw_id, commit2.raw_id, safe_str(path), safe_str(path1),
+        bool(ignore_whitespace), safe_int(context),
+        sorted(processor_kwargs.items()),
+        get_inline_diff_settings(rhodecode.CONFIG))
+    return diff_cache.get_diff_processor(key, get_diff, processor_kwargs)
@@ -27,16 +27,18 @@ import collections
 import re
 import difflib
 import logging
+import time
 
 from itertools import tee, imap
 
 from pylons.i18n.translation import _
 
+import rhodecode
 from rhodecode.lib.vcs.exceptions import VCSError
 from rhodecode.lib.vcs.nodes import FileNode, SubModuleNode
 from rhodecode.lib.vcs.backends.base import EmptyCommit
 from rhodecode.lib.helpers import escape
-from rhodecode.lib.utils2 import safe_unicode
+from rhodecode.lib.utils2 import safe_int, safe_unicode
 
 log = logging.getLogger(__name__)
 
@@ -171,6 +173,185 @@ class Action(object):
     CONTEXT = 'context'
 
 
+class DiffLine(object):
+    """
+    A line of a parsed diff.
+
+    The attributes can also be accessed like the keys of a dict, e.g.
+    ``line['action']``, as the lines used to be plain dicts.
+    """
+
+    __slots__ = ('old_lineno', 'new_lineno', 'action', 'line')
+
+    def __init__(self, old_lineno, new_lineno, action, line):
+        self.old_lineno = old_lineno
+        self.new_lineno = new_lineno
+        self.action = action
+        self.line = line
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, DiffLine):
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __ne__(self, other):
+        if not isinstance(other, DiffLine):
+            return NotImplemented
+        return self._values() != other._values()
+
+    def __repr__(self):
+        return '<DiffLine(%r, %r, %r, %r)>' % self._values()
+
+    def __reduce__(self):
+        return (DiffLine, self._values())
+
+    def _values(self):
+        return (self.old_lineno, self.new_lineno, self.action, self.line)
+
+
+INLINE_DIFF_ALGORITHMS = ('myers', 'difflib')
+
+
+class InlineDiffTimeout(Exception):
+    pass
+
+
+def _myers_matching_blocks(a, b, deadline=None):
+    """
+    Returns the matching blocks ``(i, j, size)`` of a shortest edit script
+    between the sequences `a` and `b`, based on the O(ND) algorithm of
+    E. Myers. The runtime grows with the number of differences D, not with
+    the product of the lengths.
+
+    Raises `InlineDiffTimeout` once `time.time()` passes `deadline`.
+    """
+    n, m = len(a), len(b)
+    max_d = n + m
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    # values of v before each step d, only the part which is used by step d
+    trace = []
+
+    for d in xrange(max_d + 1):
+        if deadline is not None and time.time() > deadline:
+            raise InlineDiffTimeout()
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in xrange(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, n, m)
+    return []
+
+
+def _myers_backtrack(trace, x, y):
+    blocks = []
+    for d in xrange(len(trace) - 1, 0, -1):
+        v = trace[d]
+        k = x - y
+        # trace[d] starts at diagonal -d - 1
+        if k == -d or (k != d and v[k + d] < v[k + d + 2]):
+            prev_k = k + 1
+            prev_x = v[k + d + 2]
+            start_x = prev_x
+        else:
+            prev_k = k - 1
+            prev_x = v[k + d]
+            start_x = prev_x + 1
+        if x > start_x:
+            blocks.append((start_x, start_x - k, x - start_x))
+        x, y = prev_x, prev_x - prev_k
+    if x > 0:
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    return blocks
+
+
+def myers_opcodes(a, b, deadline=None):
+    """
+    Returns the changes between the sequences `a` and `b` in the format of
+    `difflib.SequenceMatcher.get_opcodes`.
+
+    The common prefix and suffix are stripped first, lines with small
+    changes are handled in linear time.
+    """
+    n, m = len(a), len(b)
+    prefix = 0
+    while prefix < n and prefix < m and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < n - prefix and suffix < m - prefix and
+           a[n - suffix - 1] == b[m - suffix - 1]):
+        suffix += 1
+
+    blocks = [(0, 0, prefix)]
+    for i, j, size in _myers_matching_blocks(
+            a[prefix:n - suffix], b[prefix:m - suffix], deadline=deadline):
+        blocks.append((i + prefix, j + prefix, size))
+    blocks.append((n - suffix, m - suffix, suffix))
+
+    opcodes = []
+    i = j = 0
+    for block_i, block_j, size in blocks:
+        if not size:
+            continue
+        if i < block_i and j < block_j:
+            opcodes.append(('replace', i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(('delete', i, block_i, j, block_j))
+        elif j < block_j:
+            opcodes.append(('insert', i, block_i, j, block_j))
+        if opcodes and opcodes[-1][0] == 'equal':
+            opcodes[-1] = ('equal', opcodes[-1][1], block_i + size,
+                           opcodes[-1][3], block_j + size)
+        else:
+            opcodes.append(
+                ('equal', block_i, block_i + size, block_j, block_j + size))
+        i, j = block_i + size, block_j + size
+
+    if i < n and j < m:
+        opcodes.append(('replace', i, n, j, m))
+    elif i < n:
+        opcodes.append(('delete', i, n, j, m))
+    elif j < m:
+        opcodes.append(('insert', i, n, j, m))
+    return opcodes
+
+
+def get_inline_diff_settings(config):
+    """
+    Returns the algorithm, the maximum number of tokens per line and the time
+    budget in seconds of the inline diff highlighting from `config`.
+    """
+    algorithm = config.get('diff_inline_algorithm') or 'myers'
+    if algorithm not in INLINE_DIFF_ALGORITHMS:
+        log.warning('Unknown diff_inline_algorithm %s, using myers', algorithm)
+        algorithm = 'myers'
+    max_tokens = safe_int(config.get('diff_inline_max_tokens'), 2000)
+    try:
+        time_budget = float(config.get('diff_inline_time_budget') or 2.0)
+    except ValueError:
+        time_budget = 2.0
+    return algorithm, max_tokens, time_budget
+
+
 class DiffProcessor(object):
     """
     Give it a unified or git diff and it returns a list of the files that were
@@ -207,8 +388,16 @@ class DiffProcessor(object):
         self.file_limit = file_limit
         self.show_full_diff = show_full_diff
         self.cur_diff_size = 0
+        self.limited_diff = False
         self.parsed = False
         self.parsed_diff = []
+        (self.inline_diff_algorithm, self.inline_diff_max_tokens,
+         self.inline_diff_time_budget) = get_inline_diff_settings(
+            rhodecode.CONFIG)
+        self._inline_diff_time = 0
+        # set if lines were not highlighted because the time budget ran out,
+        # the result then depends on the load of the server
+        self.inline_diff_timed_out = False
 
         if format == 'gitdiff':
             self.differ = self._highlight_line_difflib
@@ -235,7 +424,7 @@ class DiffProcessor(object):
 
         self.cur_diff_size += len(string)
 
-        if not self.show_full_diff and (self.cur_diff_size > self.diff_limit):
+        if self._diff_limit_exceeded():
             raise DiffLimitExceeded('Diff Limit Exceeded')
 
         return safe_unicode(string)\
@@ -243,6 +432,9 @@ class DiffProcessor(object):
             .replace('<', '&lt;')\
             .replace('>', '&gt;')
 
+    def _diff_limit_exceeded(self):
+        return not self.show_full_diff and (self.cur_diff_size > self.diff_limit)
+
     def _line_counter(self, l):
         """
         Checks each line and bumps total adds/removes for this diff
@@ -260,17 +452,19 @@ class DiffProcessor(object):
         Highlight inline changes in both lines.
         """
 
-        if line['action'] == Action.DELETE:
+        if line.action == Action.DELETE:
             old, new = line, next_
         else:
             old, new = next_, line
 
-        oldwords = self._token_re.split(old['line'])
-        newwords = self._token_re.split(new['line'])
-        sequence = difflib.SequenceMatcher(None, oldwords, newwords)
+        oldwords = self._token_re.split(old.line)
+        newwords = self._token_re.split(new.line)
+        opcodes = self._get_inline_opcodes(oldwords, newwords)
+        if opcodes is None:
+            return
 
         oldfragments, newfragments = [], []
-        for tag, i1, i2, j1, j2 in sequence.get_opcodes():
+        for tag, i1, i2, j1, j2 in opcodes:
             oldfrag = ''.join(oldwords[i1:i2])
             newfrag = ''.join(newwords[j1:j2])
             if tag != 'equal':
@@ -281,35 +475,67 @@ class DiffProcessor(object):
             oldfragments.append(oldfrag)
             newfragments.append(newfrag)
 
-        old['line'] = "".join(oldfragments)
-        new['line'] = "".join(newfragments)
+        old.line = "".join(oldfragments)
+        new.line = "".join(newfragments)
+
+    def _get_inline_opcodes(self, oldwords, newwords):
+        """
+        Returns the opcodes of the inline changes or ``None`` if the lines are
+        not highlighted because they are too long or the time budget of this
+        diff has been used up.
+        """
+        max_tokens = self.inline_diff_max_tokens
+        if max_tokens and max(len(oldwords), len(newwords)) > max_tokens:
+            return None
+
+        deadline = None
+        start = time.time()
+        if self.inline_diff_time_budget:
+            remaining = self.inline_diff_time_budget - self._inline_diff_time
+            if remaining <= 0:
+                self.inline_diff_timed_out = True
+                return None
+            deadline = start + remaining
+
+        try:
+            if self.inline_diff_algorithm == 'difflib':
+                sequence = difflib.SequenceMatcher(None, oldwords, newwords)
+                return sequence.get_opcodes()
+            return myers_opcodes(oldwords, newwords, deadline=deadline)
+        except InlineDiffTimeout:
+            log.debug('Inline diff time budget of %ss exceeded, skipping '
+                      'the remaining lines', self.inline_diff_time_budget)
+            self.inline_diff_timed_out = True
+            return None
+        finally:
+            self._inline_diff_time += time.time() - start
 
     def _highlight_line_udiff(self, line, next_):
         """
         Highlight inline changes in both lines.
         """
         start = 0
-        limit = min(len(line['line']), len(next_['line']))
-        while start < limit and line['line'][start] == next_['line'][start]:
+        limit = min(len(line.line), len(next_.line))
+        while start < limit and line.line[start] == next_.line[start]:
             start += 1
         end = -1
         limit -= start
-        while -end <= limit and line['line'][end] == next_['line'][end]:
+        while -end <= limit and line.line[end] == next_.line[end]:
             end -= 1
         end += 1
         if start or end:
             def do(l):
-                last = end + len(l['line'])
-                if l['action'] == Action.ADD:
+                last = end + len(l.line)
+                if l.action == Action.ADD:
                     tag = 'ins'
                 else:
                     tag = 'del'
-                l['line'] = '%s<%s>%s</%s>%s' % (
-                    l['line'][:start],
+                l.line = '%s<%s>%s</%s>%s' % (
+                    l.line[:start],
                     tag,
-                    l['line'][start:last],
+                    l.line[start:last],
                     tag,
-                    l['line'][last:]
+                    l.line[last:]
                 )
             do(line)
             do(next_)
@@ -321,9 +547,23 @@ class DiffProcessor(object):
         return line
 
     def _parse_gitdiff(self, inline_diff=True):
-        _files = []
-        diff_container = lambda arg: arg
+        _files = list(self._iter_files(inline_diff=inline_diff))
 
+        sorter = lambda info: {OPS.ADD: 0, OPS.MOD: 1,
+                               OPS.DEL: 2}.get(info['operation'])
+        _files.sort(key=sorter)
+
+        if self.limited_diff:
+            return LimitedDiffContainer(
+                self.diff_limit, self.cur_diff_size, _files)
+        return _files
+
+    def _iter_files(self, inline_diff=True):
+        """
+        Parses the diff file by file and yields the data of each file in the
+        order of the diff. Once the diff limit is exceeded the content of the
+        remaining files is skipped, they are only listed from their headers.
+        """
         for chunk in self._diff.chunks():
             head = chunk.header
 
@@ -395,6 +635,9 @@ class DiffProcessor(object):
             # a real non-binary diff
             if head['a_file'] or head['b_file']:
                 try:
+                    if self._diff_limit_exceeded():
+                        # the file is listed, but its lines are not parsed
+                        raise DiffLimitExceeded('Diff Limit Exceeded')
                     raw_diff, chunks, _stats = self._parse_lines(diff)
                     stats['binary'] = False
                     stats['added'] = _stats[0]
@@ -413,12 +656,12 @@ class DiffProcessor(object):
                         raise DiffLimitExceeded('File Limit Exceeded')
 
                 except DiffLimitExceeded:
-                    diff_container = lambda _diff: \
-                        LimitedDiffContainer(
-                            self.diff_limit, self.cur_diff_size, _diff)
+                    self.limited_diff = True
 
                     exceeds_limit = len(raw_diff) > self.file_limit
                     limited_diff = True
+                    # the content is not shown, don't keep it in memory
+                    raw_diff = ''
                     chunks = []
 
             else:  # GIT format binary patch, or possibly empty diff
@@ -434,15 +677,11 @@ class DiffProcessor(object):
                 # to see the content of the file
                 chunks = []
 
-            chunks.insert(0, [{
-                                  'old_lineno': '',
-                                  'new_lineno': '',
-                                  'action': Action.CONTEXT,
-                                  'line': msg,
-                              } for _op, msg in stats['ops'].iteritems()
+            chunks.insert(0, [DiffLine('', '', Action.CONTEXT, msg)
+                              for _op, msg in stats['ops'].iteritems()
                               if _op not in [MOD_FILENODE]])
 
-            _files.append({
+            diff_data = {
                 'filename': safe_unicode(head['b_path']),
                 'old_revision': head['a_blob_id'],
                 'new_revision': head['b_blob_id'],
@@ -452,32 +691,29 @@ class DiffProcessor(object):
                 'stats': stats,
                 'exceeds_limit': exceeds_limit,
                 'is_limited_diff': limited_diff,
-            })
-
-        sorter = lambda info: {OPS.ADD: 0, OPS.MOD: 1,
-                               OPS.DEL: 2}.get(info['operation'])
-
-        if not inline_diff:
-            return diff_container(sorted(_files, key=sorter))
-
-        # highlight inline changes
-        for diff_data in _files:
-            for chunk in diff_data['chunks']:
-                lineiter = iter(chunk)
-                try:
-                    while 1:
-                        line = lineiter.next()
-                        if line['action'] not in (
-                                Action.UNMODIFIED, Action.CONTEXT):
-                            nextline = lineiter.next()
-                            if nextline['action'] in ['unmod', 'context'] or \
-                               nextline['action'] == line['action']:
-                                continue
-                            self.differ(line, nextline)
-                except StopIteration:
-                    pass
+            }
+            if inline_diff:
+                self._highlight_inline(diff_data)
+            yield diff_data
 
-        return diff_container(sorted(_files, key=sorter))
+    def _highlight_inline(self, diff_data):
+        """
+        Highlights the inline changes of the lines of `diff_data`.
+        """
+        for chunk in diff_data['chunks']:
+            lineiter = iter(chunk)
+            try:
+                while 1:
+                    line = lineiter.next()
+                    if line.action not in (
+                            Action.UNMODIFIED, Action.CONTEXT):
+                        nextline = lineiter.next()
+                        if nextline.action in ['unmod', 'context'] or \
+                           nextline.action == line.action:
+                            continue
+                        self.differ(line, nextline)
+            except StopIteration:
+                pass
 
     def _parse_udiff(self, inline_diff=True):
         raise NotImplementedError()
@@ -518,12 +754,8 @@ class DiffProcessor(object):
                 if context:
                     # skip context only if it's first line
                     if int(gr[0]) > 1:
-                        lines.append({
-                            'old_lineno': '...',
-                            'new_lineno': '...',
-                            'action':     Action.CONTEXT,
-                            'line':       line,
-                        })
+                        lines.append(
+                            DiffLine('...', '...', Action.CONTEXT, line))
 
                 line = lineiter.next()
 
@@ -552,12 +784,11 @@ class DiffProcessor(object):
                     if not self._newline_marker.match(line):
                         old_line += affects_old
                         new_line += affects_new
-                        lines.append({
-                            'old_lineno':   affects_old and old_line or '',
-                            'new_lineno':   affects_new and new_line or '',
-                            'action':       action,
-                            'line':         self._clean_line(line, command)
-                        })
+                        lines.append(DiffLine(
+                            affects_old and old_line or '',
+                            affects_new and new_line or '',
+                            action,
+                            self._clean_line(line, command)))
                         raw_diff.append(line)
 
                     line = lineiter.next()
@@ -565,12 +796,9 @@ class DiffProcessor(object):
                     if self._newline_marker.match(line):
                         # we need to append to lines, since this is not
                         # counted in the line specs of diff
-                        lines.append({
-                            'old_lineno':   '...',
-                            'new_lineno':   '...',
-                            'action':       Action.CONTEXT,
-                            'line':         self._clean_line(line, command)
-                        })
+                        lines.append(DiffLine(
+                            '...', '...', Action.CONTEXT,
+                            self._clean_line(line, command)))
 
         except StopIteration:
             pass
@@ -653,28 +881,28 @@ class DiffProcessor(object):
                 for change in line:
                     _html.append('''<tr class="%(lc)s %(action)s">\n''' % {
                         'lc': line_class,
-                        'action': change['action']
+                        'action': change.action
                     })
                     anchor_old_id = ''
                     anchor_new_id = ''
                     anchor_old = "%(filename)s_o%(oldline_no)s" % {
                         'filename': self._safe_id(diff['filename']),
-                        'oldline_no': change['old_lineno']
+                        'oldline_no': change.old_lineno
                     }
                     anchor_new = "%(filename)s_n%(oldline_no)s" % {
                         'filename': self._safe_id(diff['filename']),
-                        'oldline_no': change['new_lineno']
+                        'oldline_no': change.new_lineno
                     }
-                    cond_old = (change['old_lineno'] != '...' and
-                                change['old_lineno'])
-                    cond_new = (change['new_lineno'] != '...' and
-                                change['new_lineno'])
+                    cond_old = (change.old_lineno != '...' and
+                                change.old_lineno)
+                    cond_new = (change.new_lineno != '...' and
+                                change.new_lineno)
                     if cond_old:
                         anchor_old_id = 'id="%s"' % anchor_old
                     if cond_new:
                         anchor_new_id = 'id="%s"' % anchor_new
 
-                    if change['action'] != Action.CONTEXT:
+                    if change.action != Action.CONTEXT:
                         anchor_link = True
                     else:
                         anchor_link = False
@@ -684,7 +912,7 @@ class DiffProcessor(object):
                     ###########################################################
                     _html.append('''\t<td class="add-comment-line"><span class="add-comment-content">''')
 
-                    if enable_comments and change['action'] != Action.CONTEXT:
+                    if enable_comments and change.action != Action.CONTEXT:
                         _html.append('''<a href="#"><span class="icon-comment-add"></span></a>''')
 
                     _html.append('''</span></td>\n''')
@@ -698,7 +926,7 @@ class DiffProcessor(object):
                     })
 
                     _html.append('''%(link)s''' % {
-                        'link': _link_to_if(anchor_link, change['old_lineno'],
+                        'link': _link_to_if(anchor_link, change.old_lineno,
                                             '#%s' % anchor_old)
                     })
                     _html.append('''</td>\n''')
@@ -712,7 +940,7 @@ class DiffProcessor(object):
                     })
 
                     _html.append('''%(link)s''' % {
-                        'link': _link_to_if(anchor_link, change['new_lineno'],
+                        'link': _link_to_if(anchor_link, change.new_lineno,
                                             '#%s' % anchor_new)
                     })
                     _html.append('''</td>\n''')
@@ -721,11 +949,11 @@ class DiffProcessor(object):
                     ###########################################################
                     code_classes = [code_class]
                     if (not enable_comments or
-                            change['action'] == Action.CONTEXT):
+                            change.action == Action.CONTEXT):
                         code_classes.append('no-comment')
                     _html.append('\t<td class="%s">' % ' '.join(code_classes))
                     _html.append('''\n\t\t<pre>%(code)s</pre>\n''' % {
-                        'code': change['line']
+                        'code': change.line
                     })
 
                     _html.append('''\t</td>''')
@@ -826,29 +1054,29 @@ class DiffProcessor(object):
     def _find_chunk_line_index(self, file_diff, diff_line):
         for chunk in file_diff['chunks']:
             for idx, line in enumerate(chunk):
-                if line['old_lineno'] == diff_line.old:
+                if line.old_lineno == diff_line.old:
                     return chunk, idx
-                if line['new_lineno'] == diff_line.new:
+                if line.new_lineno == diff_line.new:
                     return chunk, idx
         raise LineNotInDiffException(
             "The line {} is not part of the diff.".format(diff_line))
 
 
 def _is_diff_content(line):
-    return line['action'] in (
+    return line.action in (
         Action.UNMODIFIED, Action.ADD, Action.DELETE)
 
 
 def _context_line(line):
-    return (line['action'], line['line'])
+    return (line.action, line.line)
 
 
 DiffLineNumber = collections.namedtuple('DiffLineNumber', ['old', 'new'])
 
 
 def _line_to_diff_line_number(line):
-    new_line_no = line['new_lineno'] or None
-    old_line_no = line['old_lineno'] or None
+    new_line_no = line.new_lineno or None
+    old_line_no = line.old_lineno or None
     return DiffLineNumber(old=old_line_no, new=new_line_no)
 
 
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Cache of rendered directory listings of the file browser.
+
+The content of a git tree never changes, so a listing is cached under the id
+of the tree of the directory instead of the commit. Directories which were not
+changed by a push keep their cached listing and commits of other branches
+share it. The listing contains links to the viewed commit, it is stored with
+:data:`COMMIT_ID_PLACEHOLDER` in place of the commit id.
+
+Listings with the last commits of the files depend on the history and not only
+on the tree, they are cached per commit. Mercurial has no ids of directories,
+its listings are cached per commit as well. Subversion repositories are not
+cached, for the same reason as in :mod:`rhodecode.lib.diff_cache`.
+"""
+
+import logging
+
+from repoze.lru import LRUCache
+
+from rhodecode.lib import caches
+from rhodecode.lib.cache_utils import CacheStats, ProcessWideInstances
+from rhodecode.lib.utils2 import safe_int, safe_unicode
+
+log = logging.getLogger(__name__)
+
+CACHED_BACKENDS = ('git', 'hg')
+
+COMMIT_ID_PLACEHOLDER = '__file_tree_commit_id__'
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+class FileTreeCache(object):
+    """
+    Keeps the `max_entries` most recently used listings in memory.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._cache = LRUCache(max_entries)
+        self._stats = CacheStats()
+
+    def get_stats(self):
+        stats = self._stats.get_stats()
+        stats['evictions'] = self._cache.evictions
+        stats['max_entries'] = self.max_entries
+        return stats
+
+    def get_tree(self, repo_name, commit, path, full_load, render_func):
+        """
+        Returns the listing of the directory `path` of `commit`, it is
+        rendered by calling ``render_func(full_load)`` if it is not cached.
+
+        A cached full listing is returned for a partial one as well.
+        `render_func` has to use :data:`COMMIT_ID_PLACEHOLDER` in place of the
+        commit id.
+        """
+        tree_id = commit.get_tree_id(path) or commit.raw_id
+        full_key = caches.compute_key_from_params(
+            repo_name, path, tree_id, commit.raw_id, True)
+        partial_key = caches.compute_key_from_params(
+            repo_name, path, tree_id, False)
+
+        html = self._cache.get(full_key)
+        if html is None and not full_load:
+            html = self._cache.get(partial_key)
+        if html is not None:
+            self._stats.count('hits')
+        else:
+            self._stats.count('misses')
+            log.debug('Rendering file tree for %s, %s, %s',
+                      repo_name, commit.raw_id, path)
+            html = render_func(full_load)
+            self._cache.put(full_key if full_load else partial_key, html)
+        return html
+
+
+_file_tree_caches = ProcessWideInstances(FileTreeCache)
+
+
+def get_file_tree_cache(config):
+    """
+    Returns the process wide `FileTreeCache` for the given `config` or
+    ``None`` if the cache is disabled.
+    """
+    max_entries = safe_int(
+        config.get('file_tree_cache_size'), DEFAULT_MAX_ENTRIES)
+    if max_entries <= 0:
+        return None
+    return _file_tree_caches.get(None, max_entries)
+
+
+def get_tree(repo_name, commit, path, full_load, render_func, config):
+    """
+    Returns the listing of the directory `path` of `commit` with links to
+    `commit`, from the file tree cache if it is enabled.
+
+    :param render_func: renders the listing, called with `full_load`. It has
+        to use :data:`COMMIT_ID_PLACEHOLDER` in place of the commit id.
+    """
+    file_tree_cache = get_file_tree_cache(config)
+    if (file_tree_cache is None or
+            commit.repository.alias not in CACHED_BACKENDS):
+        html = render_func(full_load)
+    else:
+        html = file_tree_cache.get_tree(
+            repo_name, commit, path, full_load, render_func)
+    return html.replace(COMMIT_ID_PLACEHOLDER, safe_unicode(commit.raw_id))
@@ -31,50 +31,109 @@ def grandparent(parent_idx_func, lowest_idx, roots, head):
     """
     Return all ancestors of head in roots which commit is
     greater or equal to lowest_idx.
+
+    The ancestors are searched generation by generation, `parent_idx_func`
+    gets a list of commit indexes and has to return the list of parent
+    indexes for each of them. This allows to look them up in one go.
     """
     pending = set([head])
     seen = set()
     kept = set()
     llowestrev = max(nullrev, lowest_idx)
     while pending:
-        r = pending.pop()
-        if r >= llowestrev and r not in seen:
-            if r in roots:
-                kept.add(r)
-            else:
-                pending.update(parent_idx_func(r))
-            seen.add(r)
+        expand = []
+        for r in pending:
+            if r >= llowestrev and r not in seen:
+                if r in roots:
+                    kept.add(r)
+                else:
+                    expand.append(r)
+                seen.add(r)
+        pending = set()
+        if expand:
+            for parents in parent_idx_func(expand):
+                pending.update(parents)
     return sorted(kept)
 
 
-def _dagwalker(repo, commits):
-    if not commits:
-        return
-
+def get_parent_indexes_func(repo):
+    """
+    Returns a function which looks up the parent indexes for a list of
+    commit indexes of `repo`, see `grandparent`.
+    """
     # TODO: johbo: Use some sort of vcs api here
     if repo.alias == 'hg':
-        def get_parent_indexes(idx):
-            return repo._remote.ctx_parents(idx)
+        def get_parent_indexes(indexes):
+            with repo._remote.batch() as batch:
+                calls = [batch.ctx_parents(idx) for idx in indexes]
+            return [call.result for call in calls]
+
+    elif repo.alias == 'git':
+        def get_parent_indexes(indexes):
+            # only the parent ids are fetched, their indexes are looked up
+            # in the commit index instead of creating the parent commits
+            commit_index = repo._get_commit_index()
+            with repo._remote.batch() as batch:
+                calls = [batch.bulk_request(
+                    commit_index.commit_id(idx), ['parents'])
+                    for idx in indexes]
+            return [[commit_index[parent_id]
+                     for parent_id in call.result['parents']]
+                    for call in calls]
+
+    elif repo.alias == 'svn':
+        def get_parent_indexes(indexes):
+            return [[commit.idx for commit in repo[idx].parents]
+                    for idx in indexes]
+
+    return get_parent_indexes
+
+
+def _dagwalker(repo, commits, commit_graph=None):
+    """
+    Yields ``(commit_idx, parent_indexes)`` for the graph of `commits`.
 
-    elif repo.alias in ['git', 'svn']:
-        def get_parent_indexes(idx):
-            return [commit.idx for commit in repo[idx].parents]
+    If a `commit_graph` index is given, the parents are taken from it instead
+    of asking the repository.
+    """
+    if not commits:
+        return
 
     indexes = [commit.idx for commit in commits]
     lowest_idx = min(indexes)
     known_indexes = set(indexes)
 
+    if commit_graph is not None:
+        # ancestors have a lower generation than their descendants, so a
+        # commit below the lowest generation can't lead to a known commit
+        lowest_generation = min(
+            commit_graph.generation(idx) for idx in indexes)
+
+        def get_parent_indexes(indexes):
+            return [[p for p in commit_graph.parents(idx)
+                     if commit_graph.generation(p) >= lowest_generation]
+                    for idx in indexes]
+
+        def get_parents(commit):
+            return commit_graph.parents(commit.idx)
+    else:
+        get_parent_indexes = get_parent_indexes_func(repo)
+
+        def get_parents(commit):
+            return [p.idx for p in commit.parents]
+
     gpcache = {}
     for commit in commits:
-        parents = sorted(set([p.idx for p in commit.parents
-                              if p.idx in known_indexes]))
-        mpars = [p.idx for p in commit.parents if
-                 p.idx != nullrev and p.idx not in parents]
+        commit_parents = get_parents(commit)
+        parents = sorted(set([p for p in commit_parents
+                              if p in known_indexes]))
+        mpars = [p for p in commit_parents if
+                 p != nullrev and p not in parents]
         for mpar in mpars:
             gp = gpcache.get(mpar)
             if gp is None:
                 gp = gpcache[mpar] = grandparent(
-                    get_parent_indexes, lowest_idx, indexes, mpar)
+                    get_parent_indexes, lowest_idx, known_indexes, mpar)
             if not gp:
                 parents.append(mpar)
             else:
@@ -23,14 +23,17 @@
 Set of hooks run by RhodeCode Enterprise
 """
 
-import os
 import collections
 
 import rhodecode
 from rhodecode import events
 from rhodecode.lib import helpers as h
+from rhodecode.lib.commit_graph import get_commit_graph
+from rhodecode.lib.size_tracker import get_size_tracker
 from rhodecode.lib.utils import action_logger
 from rhodecode.lib.utils2 import safe_str
+from rhodecode.lib.vcs.backends.git.commit_index import get_commit_index
+from rhodecode.lib.vcs.conf import settings as vcs_settings
 from rhodecode.lib.exceptions import HTTPLockedRC, UserCreationError
 from rhodecode.model.db import Repository, User
 
@@ -44,19 +47,11 @@ def _get_scm_size(alias, root_path):
         alias += '.'
 
     size_scm, size_root = 0, 0
-    for path, unused_dirs, files in os.walk(safe_str(root_path)):
+    for path, files_size in get_size_tracker().iter_sizes(root_path):
         if path.find(alias) != -1:
-            for f in files:
-                try:
-                    size_scm += os.path.getsize(os.path.join(path, f))
-                except OSError:
-                    pass
+            size_scm += files_size
         else:
-            for f in files:
-                try:
-                    size_root += os.path.getsize(os.path.join(path, f))
-                except OSError:
-                    pass
+            size_root += files_size
 
     size_scm_f = h.format_byte_size_binary(size_scm)
     size_root_f = h.format_byte_size_binary(size_root)
@@ -183,6 +178,9 @@ def post_push(extras):
                                         pushed_commit_ids=commit_ids,
                                         extras=extras))
 
+    _update_commit_index(extras.repository)
+    _update_commit_graph(extras.repository)
+
     # extension hook call
     post_push_extension(
         repo_store_path=Repository.base_path(),
@@ -211,6 +209,28 @@ def post_push(extras):
     return HookResponse(0, output)
 
 
+def _update_commit_graph(repo_name):
+    """Adds the pushed commits to the commit graph index, if enabled."""
+    if not rhodecode.CONFIG.get('commit_graph_dir'):
+        return
+    repo = Repository.get_by_repo_name(repo_name)
+    if repo:
+        scm_repo = repo.scm_instance(cache=False)
+        if scm_repo:
+            get_commit_graph(scm_repo, rhodecode.CONFIG)
+
+
+def _update_commit_index(repo_name):
+    """Adds the pushed commits to the git commit index, if enabled."""
+    if not vcs_settings.GIT_COMMIT_INDEX_DIR:
+        return
+    repo = Repository.get_by_repo_name(repo_name)
+    if repo and repo.repo_type == 'git':
+        scm_repo = repo.scm_instance(cache=False)
+        if scm_repo:
+            get_commit_index(scm_repo)
+
+
 def _locked_by_explanation(repo_name, user_name, reason):
     message = (
         'Repository `%s` locked by user `%s`. Reason:`%s`'
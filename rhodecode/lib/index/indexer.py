@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Incremental indexer for the whoosh full text search.
+
+Pushes are recorded as pending repositories in the index location by
+:func:`push_event_handler`, the ``index-daemon`` paster command indexes them.
+A watermark per repository stores the last indexed commit and the commit
+whose files have been indexed, only the commits after it and the files
+changed since then are added to the indexes.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from whoosh import query as query_lib
+
+import rhodecode
+from rhodecode.lib.index.whoosh import (
+    get_searcher_pool, FILE_INDEX_NAME, FILE_SCHEMA, COMMIT_INDEX_NAME,
+    COMMIT_SCHEMA)
+from rhodecode.lib.utils2 import (
+    datetime_to_time, safe_int, safe_str, safe_unicode, str2bool)
+from rhodecode.lib.vcs.exceptions import (
+    CommitDoesNotExistError, NodeDoesNotExistError, RepositoryError)
+from rhodecode.model import meta
+from rhodecode.model.db import Repository
+
+log = logging.getLogger(__name__)
+
+PENDING_DIR = 'pending'
+WATERMARKS_DIR = 'watermarks'
+
+# number of commits or files written to an index at once
+BATCH_SIZE = 200
+# seconds to wait for the write lock of an index
+WRITER_TIMEOUT = 600
+# content of bigger files is not indexed
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+
+
+def _write_atomic(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _paths(nodes):
+    paths = getattr(nodes, 'current_paths', None)
+    if paths is None:
+        paths = [node.path for node in nodes]
+    return paths
+
+
+def schedule_repository(location, repo_name):
+    """
+    Marks the repository `repo_name` to be indexed by the indexer daemon.
+    """
+    name = hashlib.sha1(safe_str(repo_name)).hexdigest()
+    _write_atomic(
+        os.path.join(location, PENDING_DIR, name), safe_str(repo_name))
+
+
+def take_pending_repositories(location):
+    """
+    Returns the names of the repositories which have been scheduled and
+    removes their marks, pushes during the indexing mark them again.
+    """
+    directory = os.path.join(location, PENDING_DIR)
+    if not os.path.isdir(directory):
+        return []
+
+    repo_names = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('.'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'rb') as f:
+                repo_name = f.read()
+            os.remove(path)
+        except (IOError, OSError):
+            # taken by another daemon
+            continue
+        repo_names.append(safe_unicode(repo_name))
+    return repo_names
+
+
+def push_event_handler(event):
+    """
+    Schedules the pushed repository of a `RepoPushEvent`, if the incremental
+    indexer is enabled.
+    """
+    from rhodecode import events
+
+    config = rhodecode.CONFIG
+    if not isinstance(event, events.RepoPushEvent):
+        return
+    if not str2bool(config.get('search.incremental_indexer')):
+        return
+    location = config.get('search.location')
+    if not location:
+        return
+
+    try:
+        schedule_repository(location, event.repo.repo_name)
+    except (IOError, OSError):
+        log.exception('Failed to schedule indexing of %s', event.repo)
+
+
+class Watermarks(object):
+    """
+    Stores the indexing state of each repository in `location`.
+    """
+
+    def __init__(self, location):
+        self.directory = os.path.join(location, WATERMARKS_DIR)
+
+    def _path(self, repo_id):
+        return os.path.join(self.directory, '%s.json' % (repo_id, ))
+
+    def get(self, repo_id):
+        try:
+            with open(self._path(repo_id), 'rb') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, repo_id, watermark):
+        _write_atomic(self._path(repo_id), json.dumps(watermark))
+
+
+class RepositoryIndexer(object):
+    """
+    Adds the new commits and changed files of repositories to the commit and
+    file index in `location`.
+    """
+
+    def __init__(self, location, max_file_size=DEFAULT_MAX_FILE_SIZE,
+                 batch_size=BATCH_SIZE):
+        self.location = location
+        self.max_file_size = max_file_size
+        self.batch_size = batch_size
+        self.watermarks = Watermarks(location)
+        self.commit_index = get_searcher_pool(
+            location, COMMIT_INDEX_NAME, COMMIT_SCHEMA).index
+        self.file_index = get_searcher_pool(
+            location, FILE_INDEX_NAME, FILE_SCHEMA).index
+
+    def index_repository(self, repo_name, full=False):
+        """
+        Indexes the changes of the repository `repo_name` since the last run,
+        or all of it if `full` is set or the history has been rewritten.
+
+        Returns the number of indexed commits and files.
+        """
+        repo = Repository.get_by_repo_name(repo_name)
+        if repo is None:
+            log.warning('Repository %s does not exist, not indexing it',
+                        repo_name)
+            return {'repo_name': repo_name, 'commits': 0, 'files': 0}
+        scm_repo = repo.scm_instance(cache=False)
+
+        watermark = self.watermarks.get(repo.repo_id)
+        if full or not self._is_valid(watermark, repo, scm_repo):
+            log.info('Indexing repository %s from scratch', repo_name)
+            names = set([repo.repo_name])
+            if watermark:
+                names.add(watermark['repo_name'])
+            self._delete_repository(names)
+            watermark = {
+                'repo_name': repo.repo_name,
+                'commit_id': None,
+                'commit_idx': -1,
+                'file_commit_id': None,
+            }
+
+        return {
+            'repo_name': repo_name,
+            'commits': self._index_commits(repo, scm_repo, watermark),
+            'files': self._index_files(repo, scm_repo, watermark),
+        }
+
+    def _is_valid(self, watermark, repo, scm_repo):
+        """
+        Checks that the commits of the `watermark` are still part of the
+        repository at the same position.
+        """
+        if not watermark or watermark.get('repo_name') != repo.repo_name:
+            return False
+        commit_idx = watermark['commit_idx']
+        if commit_idx >= 0:
+            commit_ids = scm_repo.commit_ids
+            if (commit_idx >= len(commit_ids) or
+                    commit_ids[commit_idx] != watermark['commit_id']):
+                return False
+        if watermark['file_commit_id']:
+            try:
+                scm_repo.get_commit(commit_id=watermark['file_commit_id'])
+            except (CommitDoesNotExistError, RepositoryError):
+                return False
+        return True
+
+    def _delete_repository(self, repo_names):
+        for index in (self.commit_index, self.file_index):
+            writer = index.writer(timeout=WRITER_TIMEOUT)
+            try:
+                for repo_name in repo_names:
+                    writer.delete_by_term(
+                        'repository', safe_unicode(repo_name))
+            except Exception:
+                writer.cancel()
+                raise
+            writer.commit()
+
+    def _write(self, index, delete_queries, documents):
+        writer = index.writer(timeout=WRITER_TIMEOUT)
+        try:
+            for query in delete_queries:
+                writer.delete_by_query(query)
+            # the schemas contain more than one unique field, so
+            # update_document would delete other documents of the repository
+            for document in documents:
+                writer.add_document(**document)
+        except Exception:
+            writer.cancel()
+            raise
+        writer.commit()
+
+    def _index_commits(self, repo, scm_repo, watermark):
+        commit_ids = scm_repo.commit_ids
+        start = watermark['commit_idx'] + 1
+        count = 0
+
+        for batch in _batches(commit_ids[start:], self.batch_size):
+            documents = [
+                self._commit_document(
+                    repo, scm_repo.get_commit(commit_id=commit_id))
+                for commit_id in batch]
+            # a batch may have been written before the watermark was stored,
+            # forks share commit ids, so only the documents of this
+            # repository are replaced
+            repo_term = query_lib.Term(
+                'repository', safe_unicode(repo.repo_name))
+            self._write(
+                self.commit_index,
+                [query_lib.And([
+                    repo_term,
+                    query_lib.Term('commit_id', safe_unicode(commit_id))])
+                 for commit_id in batch],
+                documents)
+
+            count += len(batch)
+            watermark['commit_idx'] = start + count - 1
+            watermark['commit_id'] = batch[-1]
+            self.watermarks.set(repo.repo_id, watermark)
+        return count
+
+    def _commit_document(self, repo, commit):
+        return {
+            'commit_id': safe_unicode(commit.raw_id),
+            'repository': safe_unicode(repo.repo_name),
+            'repository_id': repo.repo_id,
+            'commit_idx': commit.idx,
+            'commit_idx_sort': u'%012d' % (commit.idx, ),
+            'date': int(datetime_to_time(commit.date) or 0),
+            'owner': safe_unicode(repo.user.username),
+            'author': safe_unicode(commit.author),
+            'message': safe_unicode(commit.message),
+            'parents': u' '.join(
+                safe_unicode(parent.raw_id) for parent in commit.parents),
+            'added': u' '.join(map(safe_unicode, _paths(commit.added))),
+            'removed': u' '.join(map(safe_unicode, _paths(commit.removed))),
+            'changed': u' '.join(map(safe_unicode, _paths(commit.changed))),
+        }
+
+    def _index_files(self, repo, scm_repo, watermark):
+        if scm_repo.is_empty():
+            return 0
+        commit = scm_repo.get_commit()
+        if watermark['file_commit_id'] == commit.raw_id:
+            return 0
+
+        if watermark['file_commit_id']:
+            old_commit = scm_repo.get_commit(
+                commit_id=watermark['file_commit_id'])
+            paths = self._changed_paths(scm_repo, old_commit, commit)
+        else:
+            paths = (
+                node.path for __, __, files in commit.walk('/')
+                for node in files)
+
+        count = 0
+        for batch in _batches(paths, self.batch_size):
+            documents = []
+            for path in batch:
+                node = self._get_file_node(commit, path)
+                if node is not None:
+                    documents.append(
+                        self._file_document(repo, scm_repo, commit, node))
+            self._write(
+                self.file_index,
+                [query_lib.Term('fileid', self._file_id(scm_repo, path))
+                 for path in batch],
+                documents)
+            count += len(batch)
+
+        watermark['file_commit_id'] = commit.raw_id
+        self.watermarks.set(repo.repo_id, watermark)
+        return count
+
+    def _changed_paths(self, scm_repo, old_commit, commit):
+        diff = scm_repo.get_diff(old_commit, commit, context=0)
+        paths = set()
+        for chunk in diff.chunks():
+            paths.update(
+                path for path in (chunk.header.get('a_path'),
+                                  chunk.header.get('b_path'))
+                if path)
+        return sorted(paths)
+
+    def _get_file_node(self, commit, path):
+        try:
+            node = commit.get_node(path)
+        except (NodeDoesNotExistError, CommitDoesNotExistError):
+            return None
+        if not node.is_file():
+            return None
+        return node
+
+    def _file_id(self, scm_repo, path):
+        return safe_unicode(os.path.join(scm_repo.path, path))
+
+    def _file_document(self, repo, scm_repo, commit, node):
+        size = node.size
+        content = u''
+        md5 = u''
+        if size <= self.max_file_size and not node.is_binary:
+            raw_content = node.content
+            content = safe_unicode(raw_content)
+            md5 = safe_unicode(hashlib.md5(raw_content).hexdigest())
+
+        file_id = self._file_id(scm_repo, node.path)
+        return {
+            'fileid': file_id,
+            'repository': safe_unicode(repo.repo_name),
+            'repository_id': repo.repo_id,
+            'repo_name': safe_unicode(repo.repo_name),
+            'owner': safe_unicode(repo.user.username),
+            'path': file_id,
+            'content': content,
+            'modtime': int(datetime_to_time(commit.date) or 0),
+            'md5': md5,
+            'extension': safe_unicode(node.extension),
+            'commit_id': safe_unicode(commit.raw_id),
+            'size': size,
+            'mimetype': safe_unicode(node.mimetype),
+            'lines': len(content.splitlines()),
+        }
+
+
+def index_repository(location, repo_name, full=False, max_file_size=None):
+    """
+    Indexes the repository `repo_name`, used as the task of the worker
+    processes of the indexer daemon. Errors are logged, so that one broken
+    repository does not stop the others.
+    """
+    if max_file_size is None:
+        max_file_size = DEFAULT_MAX_FILE_SIZE
+    try:
+        indexer = RepositoryIndexer(location, max_file_size=max_file_size)
+        return indexer.index_repository(repo_name, full=full)
+    except Exception:
+        log.exception('Failed to index repository %s', repo_name)
+        return None
+    finally:
+        meta.Session.remove()
+
+
+def get_max_file_size(config):
+    return safe_int(
+        config.get('search.indexer_max_file_size'), DEFAULT_MAX_FILE_SIZE)
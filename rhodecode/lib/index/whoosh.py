@@ -23,19 +23,24 @@ Index schema for RhodeCode
 """
 
 from __future__ import absolute_import
+import hashlib
 import logging
 import os
 import re
+import threading
 
 from pylons.i18n.translation import _
+from repoze.lru import LRUCache
 
 from whoosh import query as query_lib, sorting
+from whoosh.idsets import BitSet
 from whoosh.highlight import HtmlFormatter, ContextFragmenter
 from whoosh.index import create_in, open_dir, exists_in, EmptyIndexError
 from whoosh.qparser import QueryParser, QueryParserError
 
 import rhodecode.lib.helpers as h
 from rhodecode.lib.index import BaseSearch
+from rhodecode.lib.utils2 import safe_int, safe_str
 
 log = logging.getLogger(__name__)
 
@@ -59,38 +64,166 @@ FRAGMENTER = ContextFragmenter(200)
 
 log = logging.getLogger(__name__)
 
+# number of idle searchers kept open per index
+DEFAULT_POOL_SIZE = 8
+# number of repository filters kept per index
+DEFAULT_FILTER_CACHE_SIZE = 64
 
 
-class Search(BaseSearch):
+class SearcherPool(object):
+    """
+    Keeps searchers of the index `index_name` in `location` open, so that
+    following searches do not have to open the index files again.
 
-    name = 'whoosh'
+    A searcher is used by one thread at a time, it is taken from the pool
+    with :meth:`acquire` and returned with :meth:`release`. Idle searchers
+    are refreshed when the index generation changed, which re-uses the
+    readers of the unchanged segments.
 
-    def __init__(self, config):
-        self.config = config
-        if not os.path.isdir(self.config['location']):
-            os.makedirs(self.config['location'])
+    The pool also caches the document numbers of the repositories a user
+    may search in, see :meth:`get_repo_filter`.
+    """
 
-        opener = create_in
-        if exists_in(self.config['location'], indexname=FILE_INDEX_NAME):
-            opener = open_dir
-        file_index = opener(self.config['location'], schema=FILE_SCHEMA,
-                            indexname=FILE_INDEX_NAME)
+    def __init__(self, location, index_name, schema, size=DEFAULT_POOL_SIZE,
+                 filter_cache_size=DEFAULT_FILTER_CACHE_SIZE):
+        self.location = location
+        self.index_name = index_name
+        self.size = size
+        self._filters = LRUCache(max(filter_cache_size, 1))
 
+        if not os.path.isdir(location):
+            os.makedirs(location)
         opener = create_in
-        if exists_in(self.config['location'], indexname=COMMIT_INDEX_NAME):
+        if exists_in(location, indexname=index_name):
             opener = open_dir
-        changeset_index = opener(self.config['location'], schema=COMMIT_SCHEMA,
-                                 indexname=COMMIT_INDEX_NAME)
+        self.index = opener(location, schema=schema, indexname=index_name)
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<SearcherPool(%s, %s, idle=%s)>' % (
+            self.location, self.index_name, len(self._idle))
+
+    def acquire(self):
+        searcher = None
+        with self._lock:
+            if self._idle:
+                searcher = self._idle.pop()
+
+        if searcher is not None:
+            try:
+                return searcher.refresh()
+            except Exception:
+                log.exception('Failed to refresh searcher of %s', self)
+                searcher.close()
+        return self.index.searcher()
+
+    def release(self, searcher):
+        if searcher.is_closed:
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(searcher)
+                return
+        searcher.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for searcher in idle:
+            searcher.close()
+
+    def get_repo_filter(self, searcher, repo_names):
+        """
+        Returns the numbers of the documents of `searcher` which belong to
+        one of the repositories `repo_names` as a `BitSet`.
+
+        The sets are cached by the contents of the index and the set of
+        repository names, users with the same permissions share them. A change
+        of the permissions or of the index leads to a different key.
+        """
+        names = sorted(set(safe_str(name) for name in repo_names))
+        key = (_reader_key(searcher.reader()),
+               hashlib.sha1('\n'.join(names)).hexdigest())
+        docs = self._filters.get(key)
+        if docs is None:
+            repo_query = query_lib.Or(
+                [query_lib.Term('repository', name.decode('utf-8'))
+                 for name in names])
+            docs = BitSet(searcher.docs_for_query(repo_query),
+                          size=searcher.doc_count_all())
+            self._filters.put(key, docs)
+        return docs
+
+
+def _reader_key(reader):
+    """
+    Returns a key for the documents of `reader`. The generation alone is not
+    enough, it starts again if the index is deleted and created again. The
+    segment ids are random, so the key differs for every new index.
+    """
+    segment_ids = []
+    for leaf_reader, __ in reader.leaf_readers():
+        segment = leaf_reader.segment()
+        segment_ids.append(segment.segment_id() if segment else None)
+    return reader.generation(), tuple(segment_ids)
+
+
+_searcher_pools = {}
+_searcher_pools_lock = threading.Lock()
+
+
+def get_searcher_pool(location, index_name, schema, size=DEFAULT_POOL_SIZE,
+                      filter_cache_size=DEFAULT_FILTER_CACHE_SIZE):
+    """
+    Returns the process wide `SearcherPool` of the index `index_name` in
+    `location`, the index is created if it does not exist.
+    """
+    key = (os.path.abspath(location), index_name)
+    with _searcher_pools_lock:
+        pool = _searcher_pools.get(key)
+        if pool is None:
+            pool = SearcherPool(location, index_name, schema, size=size,
+                                filter_cache_size=filter_cache_size)
+            _searcher_pools[key] = pool
+    return pool
+
+
+class Search(BaseSearch):
+
+    name = 'whoosh'
+
+    def __init__(self, config):
+        self.config = config
+        pool_kwargs = {
+            'size': safe_int(
+                self.config.get('searcher_pool_size'), DEFAULT_POOL_SIZE),
+            'filter_cache_size': safe_int(
+                self.config.get('filter_cache_size'),
+                DEFAULT_FILTER_CACHE_SIZE),
+        }
+        self._pools = {
+            FILE_INDEX_NAME: get_searcher_pool(
+                self.config['location'], FILE_INDEX_NAME, FILE_SCHEMA,
+                **pool_kwargs),
+            COMMIT_INDEX_NAME: get_searcher_pool(
+                self.config['location'], COMMIT_INDEX_NAME, COMMIT_SCHEMA,
+                **pool_kwargs),
+        }
 
         self.commit_schema = COMMIT_SCHEMA
-        self.commit_index = changeset_index
+        self.commit_index = self._pools[COMMIT_INDEX_NAME].index
         self.file_schema = FILE_SCHEMA
-        self.file_index = file_index
+        self.file_index = self._pools[FILE_INDEX_NAME].index
         self.searcher = None
+        self._searcher_pool = None
 
     def cleanup(self):
         if self.searcher:
-            self.searcher.close()
+            self._searcher_pool.release(self.searcher)
+            self.searcher = None
+            self._searcher_pool = None
 
     def _extend_query(self, query):
         hashes = re.compile('([0-9a-f]{5,40})').findall(query)
@@ -132,13 +265,24 @@ class Search(BaseSearch):
                         sortedby = 'date'
                         reverse = True
 
+                if allowed_repos_filter is not None and \
+                        not allowed_repos_filter:
+                    # whoosh ignores empty filters, there is nothing the
+                    # user is allowed to find
+                    return result
+
+                # only the hits up to the requested page are scored and
+                # sorted, the pages before it are sliced off by the caller
+                limit = max(safe_int(requested_page, 1), 1) * page_limit
                 whoosh_results = self.searcher.search(
-                    query, filter=allowed_repos_filter, limit=None,
+                    query, filter=allowed_repos_filter, limit=limit,
                     sortedby=sortedby, reverse=reverse)
 
                 # fixes for 32k limit that whoosh uses for highlight
                 whoosh_results.fragmenter.charlimit = None
-                res_ln = whoosh_results.scored_length()
+                # counts all matches without scoring them, the estimates of
+                # whoosh do not take the repository filter into account
+                res_ln = len(whoosh_results)
                 result['runtime'] = whoosh_results.runtime
                 result['count'] = res_ln
                 result['results'] = WhooshResultWrapper(
@@ -175,26 +319,24 @@ class Search(BaseSearch):
         return stats
 
     def _get_repo_filter(self, auth_user, repo_name):
-
-        allowed_to_search = [
-            repo for repo, perm in
-            auth_user.permissions['repositories'].items()
-            if perm != 'repository.none']
-
+        """
+        Returns the document numbers the current searcher may return for
+        `auth_user` or ``None`` if all documents may be returned.
+        """
         if repo_name:
-            repo_filter = [query_lib.Term('repository', repo_name)]
+            allowed_to_search = [repo_name]
 
         elif 'hg.admin' in auth_user.permissions.get('global', []):
             return None
 
         else:
-            repo_filter = [query_lib.Term('repository', _rn)
-                           for _rn in allowed_to_search]
-            # in case we're not allowed to search anywhere, it's a trick
-            # to tell whoosh we're filtering, on ALL results
-            repo_filter = repo_filter or [query_lib.Term('repository', '')]
+            allowed_to_search = [
+                repo for repo, perm in
+                auth_user.permissions['repositories'].items()
+                if perm != 'repository.none']
 
-        return query_lib.Or(repo_filter)
+        return self._searcher_pool.get_repo_filter(
+            self.searcher, allowed_to_search)
 
     def _prepare_for_search(self, cur_type):
         search_type = {
@@ -221,8 +363,9 @@ class Search(BaseSearch):
         return search_type, index_name, schema_defn
 
     def _init_searcher(self, index_name):
-        idx = open_dir(self.config['location'], indexname=index_name)
-        self.searcher = idx.searcher()
+        self.cleanup()
+        self._searcher_pool = self._pools[index_name]
+        self.searcher = self._searcher_pool.acquire()
         return self.searcher
 
 
@@ -252,7 +395,8 @@ class WhooshResultWrapper(object):
 
     def __getitem__(self, key):
         """
-        Slicing of resultWrapper
+        Slicing of resultWrapper, only the hits up to the limit of the search
+        are available.
         """
         i, j = key.start, key.stop
         for hit in self.results[i:j]:
@@ -23,6 +23,7 @@ Implementation of the scm_app interface using raw HTTP communication.
 """
 
 import base64
+import itertools
 import logging
 import urlparse
 import wsgiref.util
@@ -32,10 +33,14 @@ import requests
 import webob.request
 
 import rhodecode
+from rhodecode.lib.utils2 import safe_int
 
 
 log = logging.getLogger(__name__)
 
+# Size of the blocks in which request and response bodies are forwarded
+CHUNK_SIZE = 64 * 1024
+
 
 def create_git_wsgi_app(repo_path, repo_name, config):
     url = _vcs_streaming_url() + 'git/'
@@ -94,7 +99,12 @@ class VcsHttpProxy(object):
             'X-RC-Repo-Config': base64.b64encode(config),
         })
 
-        data = environ['wsgi.input'].read()
+        # The body is streamed, requests sets the Content-Length or the
+        # chunked Transfer-Encoding depending on the kind of data
+        data = _request_body(environ)
+        request_headers = dict(
+            (h, v) for h, v in request_headers.items()
+            if h.lower() not in ('content-length', 'transfer-encoding'))
         method = environ['REQUEST_METHOD']
 
         # Preserve the query string
@@ -121,14 +131,73 @@ class VcsHttpProxy(object):
         return _maybe_stream(response)
 
 
+def _request_body(environ):
+    """
+    Returns the body of the request as a file-like object or an iterator,
+    so that it is forwarded in blocks instead of being read into memory.
+    """
+    wsgi_input = environ['wsgi.input']
+    length = safe_int(environ.get('CONTENT_LENGTH'))
+    if length is not None:
+        return _LimitedInput(wsgi_input, length) if length > 0 else ''
+
+    # Without a Content-Length the input has to be read until its end, e.g.
+    # a decompressed request. It is forwarded chunked, unless it is empty.
+    first_chunk = wsgi_input.read(CHUNK_SIZE)
+    if not first_chunk:
+        return ''
+    return itertools.chain([first_chunk], _read_chunks(wsgi_input))
+
+
+def _read_chunks(wsgi_input):
+    while True:
+        chunk = wsgi_input.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+class _LimitedInput(object):
+    """
+    File-like object which reads `length` bytes from `wsgi_input`.
+
+    The `len` attribute makes requests send it with a Content-Length.
+    """
+
+    def __init__(self, wsgi_input, length):
+        self._input = wsgi_input
+        self.len = length
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        if not size:
+            return ''
+        data = self._input.read(size)
+        self._remaining -= len(data)
+        if not data:
+            self._remaining = 0
+        return data
+
+    def __iter__(self):
+        return _read_chunks(self)
+
+
 def _maybe_stream(response):
     """
-    Try to generate chunks from the response if it is chunked.
+    Generate the chunks of the response if it is chunked, otherwise blocks of
+    `CHUNK_SIZE` bytes, so that the response is never read into memory.
     """
     if _is_chunked(response):
-        return response.raw.read_chunked()
+        chunks = response.raw.read_chunked()
     else:
-        return [response.content]
+        chunks = response.raw.stream(CHUNK_SIZE, decode_content=False)
+    try:
+        for chunk in chunks:
+            yield chunk
+    finally:
+        response.close()
 
 
 def _is_chunked(response):
@@ -18,17 +18,16 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
-import gzip
-import shutil
 import logging
-import tempfile
 import urlparse
+import zlib
 
 import rhodecode
 from rhodecode.lib.middleware.appenlight import wrap_in_appenlight_if_enabled
 from rhodecode.lib.middleware.simplegit import SimpleGit, GIT_PROTO_PAT
 from rhodecode.lib.middleware.simplehg import SimpleHg
 from rhodecode.lib.middleware.simplesvn import SimpleSvn
+from rhodecode.lib.utils2 import safe_int
 
 
 log = logging.getLogger(__name__)
@@ -84,6 +83,100 @@ def is_svn(environ):
     return is_svn_path
 
 
+class GunzipStream(object):
+    """
+    File-like object which decompresses the gzip-encoded `fileobj` while it
+    is read. Unlike :class:`gzip.GzipFile` it does not need `seek` and `tell`
+    on `fileobj`, and it reads at most `length` bytes from it.
+    """
+
+    # accept the gzip header and trailer
+    WBITS = 16 + zlib.MAX_WBITS
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fileobj, length=None):
+        self._fileobj = fileobj
+        self._remaining = length
+        self._decompressor = zlib.decompressobj(self.WBITS)
+        self._pending = b''
+        self._in_member = False
+        self._buffer = b''
+        self._eof = False
+
+    def _read_compressed(self):
+        size = self.CHUNK_SIZE
+        if self._remaining is not None:
+            size = min(size, self._remaining)
+            if not size:
+                return b''
+        data = self._fileobj.read(size)
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        return data
+
+    def _decompress_next(self):
+        """
+        Decompresses the next block of the input into the buffer. The output
+        of a single block is bounded, so that a highly compressed input does
+        not end up in memory at once.
+        """
+        data, self._pending = self._pending, b''
+        if not data:
+            data = self._decompressor.unconsumed_tail
+        if not data:
+            data = self._read_compressed()
+        if not data:
+            if self._in_member and not self._member_finished():
+                raise IOError('Compressed file ended before the '
+                              'end-of-stream marker was reached')
+            self._eof = True
+            return
+        if not self._in_member:
+            # like GzipFile, skip the zero padding after the last member
+            data = data.lstrip(b'\0')
+            if not data:
+                return
+            self._in_member = True
+        self._buffer += self._decompressor.decompress(data, self.CHUNK_SIZE)
+        if self._decompressor.unused_data:
+            # The member ended and the input continues with another gzip
+            # member. Python 2 has no `eof` attribute and leaves a stale
+            # `unconsumed_tail` behind, so the rest of the input is taken
+            # from `unused_data` only and fed to a new decompressor.
+            self._pending = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(self.WBITS)
+            self._in_member = False
+
+    def _member_finished(self):
+        eof = getattr(self._decompressor, 'eof', None)
+        if eof is not None:
+            return eof
+        # a finished decompressor passes any further input on as unused data
+        try:
+            self._decompressor.decompress(b'\0')
+        except zlib.error:
+            return False
+        return bool(self._decompressor.unused_data)
+
+    def read(self, size=-1):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._decompress_next()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while (not self._eof and b'\n' not in self._buffer and
+               (size < 0 or len(self._buffer) < size)):
+            self._decompress_next()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, size)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+
 class GunzipMiddleware(object):
     """
     WSGI middleware that unzips gzip-encoded requests before
@@ -98,24 +191,15 @@ class GunzipMiddleware(object):
 
         if b'gzip' in accepts_encoding_header:
             log.debug('gzip detected, now running gunzip wrapper')
-            wsgi_input = environ['wsgi.input']
-
-            if not hasattr(environ['wsgi.input'], 'seek'):
-                # The gzip implementation in the standard library of Python 2.x
-                # requires the '.seek()' and '.tell()' methods to be available
-                # on the input stream.  Read the data into a temporary file to
-                # work around this limitation.
-
-                wsgi_input = tempfile.SpooledTemporaryFile(64 * 1024 * 1024)
-                shutil.copyfileobj(environ['wsgi.input'], wsgi_input)
-                wsgi_input.seek(0)
-
-            environ['wsgi.input'] = gzip.GzipFile(fileobj=wsgi_input, mode='r')
+            # the input is decompressed while it is read by the application
+            environ['wsgi.input'] = GunzipStream(
+                environ['wsgi.input'],
+                length=safe_int(environ.get('CONTENT_LENGTH')))
             # since we "Ungzipped" the content we say now it's no longer gzip
             # content encoding
             del environ['HTTP_CONTENT_ENCODING']
 
-            # content length has changes ? or i'm not sure
+            # the length of the decompressed content is not known
             if 'CONTENT_LENGTH' in environ:
                 del environ['CONTENT_LENGTH']
         else:
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+commit graph index paster command for RhodeCode
+"""
+
+import logging
+import logging.config
+import os
+import sys
+
+from paste.deploy import loadapp
+
+from rhodecode.lib.utils import BasePasterCommand
+
+# fix rhodecode import
+from os.path import dirname as dn
+rc_path = dn(dn(dn(os.path.realpath(__file__))))
+sys.path.append(rc_path)
+
+log = logging.getLogger(__name__)
+
+
+class Command(BasePasterCommand):
+
+    max_args = 1
+    min_args = 1
+
+    usage = "CONFIG_FILE"
+    group_name = "RhodeCode"
+    takes_config_file = -1
+    parser = BasePasterCommand.standard_parser(verbose=True)
+    summary = "Build the commit graph index of repositories"
+
+    parser.add_option(
+        '--repo', action='append', dest='repo_names', default=[],
+        help='Build the index of this repository, can be given more than '
+             'once, by default the indexes of all repositories are built')
+
+    def update_parser(self):
+        pass
+
+    def command(self):
+        logging.config.fileConfig(self.path_to_ini_file)
+        loadapp('config:' + self.path_to_ini_file)
+
+        import rhodecode
+        from rhodecode.lib.commit_graph import build_commit_graph
+        from rhodecode.model.db import Repository
+
+        if not rhodecode.CONFIG.get('commit_graph_dir'):
+            log.error('The commit graph index is not enabled, set '
+                      '`commit_graph_dir` in the config file')
+            sys.exit(1)
+
+        if self.options.repo_names:
+            repos = [Repository.get_by_repo_name(repo_name)
+                     for repo_name in self.options.repo_names]
+        else:
+            repos = Repository.getAll()
+
+        failed = False
+        for repo in repos:
+            if repo is None:
+                continue
+            try:
+                commit_graph = build_commit_graph(
+                    repo.scm_instance(cache=False), rhodecode.CONFIG)
+                if commit_graph is None:
+                    log.info('Skipped %s, the commit graph index of git '
+                             'repositories needs `git_commit_index_dir`',
+                             repo.repo_name)
+                    continue
+                log.info('Built commit graph index of %s with %s commits',
+                         repo.repo_name, len(commit_graph))
+            except Exception:
+                log.exception('Failed to build the commit graph index of %s',
+                              repo.repo_name)
+                failed = True
+        if failed:
+            sys.exit(1)
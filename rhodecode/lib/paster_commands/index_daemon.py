@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+incremental full text search indexer paster command for RhodeCode
+"""
+
+import logging
+import logging.config
+import multiprocessing
+import os
+import sys
+import time
+
+from paste.deploy import loadapp
+
+from rhodecode.lib.utils import BasePasterCommand
+
+# fix rhodecode import
+from os.path import dirname as dn
+rc_path = dn(dn(dn(os.path.realpath(__file__))))
+sys.path.append(rc_path)
+
+log = logging.getLogger(__name__)
+
+
+def bootstrap(path_to_ini_file):
+    """
+    Loads the application, which initializes the configuration, the database
+    and the connection to the vcs server. Used for the worker processes.
+    """
+    loadapp('config:' + path_to_ini_file)
+
+
+def _index_task(args):
+    from rhodecode.lib.index.indexer import index_repository
+    return index_repository(*args)
+
+
+class Command(BasePasterCommand):
+
+    max_args = 1
+    min_args = 1
+
+    usage = "CONFIG_FILE"
+    group_name = "RhodeCode"
+    takes_config_file = -1
+    parser = BasePasterCommand.standard_parser(verbose=True)
+    summary = "Incremental full text search indexer"
+
+    parser.add_option(
+        '--processes', action='store', dest='processes', type='int',
+        default=None,
+        help='Number of worker processes, by default '
+             '`search.indexer_processes` of the config file')
+    parser.add_option(
+        '--interval', action='store', dest='interval', type='float',
+        default=10, help='Seconds between checks for pushed repositories')
+    parser.add_option(
+        '--once', action='store_true', dest='once', default=False,
+        help='Index the pending repositories once and exit')
+    parser.add_option(
+        '--repo', action='append', dest='repo_names', default=[],
+        help='Index this repository, can be given more than once')
+    parser.add_option(
+        '--all', action='store_true', dest='all_repos', default=False,
+        help='Index all repositories')
+    parser.add_option(
+        '--full', action='store_true', dest='full', default=False,
+        help='Index the given repositories from scratch')
+
+    def update_parser(self):
+        pass
+
+    def command(self):
+        from pylons import config
+        from rhodecode.lib.utils2 import safe_int
+
+        logging.config.fileConfig(self.path_to_ini_file)
+        processes = self.options.processes or safe_int(
+            config.get('search.indexer_processes'), 2)
+
+        # the workers are started before the database and the vcs server
+        # are connected, so that they do not share the connections
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(
+                processes, initializer=bootstrap,
+                initargs=(self.path_to_ini_file, ))
+        try:
+            bootstrap(self.path_to_ini_file)
+            self._run(pool)
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def _run(self, pool):
+        import rhodecode
+        from rhodecode.lib.index import indexer
+        from rhodecode.model.db import Repository
+
+        location = rhodecode.CONFIG['search.location']
+        max_file_size = indexer.get_max_file_size(rhodecode.CONFIG)
+
+        repo_names = list(self.options.repo_names)
+        if self.options.all_repos:
+            repo_names.extend(repo.repo_name for repo in Repository.getAll())
+        full = self.options.full
+
+        while True:
+            repo_names.extend(indexer.take_pending_repositories(location))
+            if repo_names:
+                tasks = [
+                    (location, repo_name, full, max_file_size)
+                    for repo_name in sorted(set(repo_names))]
+                if pool is not None:
+                    results = pool.map(_index_task, tasks)
+                else:
+                    results = map(_index_task, tasks)
+                for result in results:
+                    if result:
+                        log.info('Indexed %(commits)s commits and %(files)s '
+                                 'files of %(repo_name)s', result)
+
+            if self.options.once:
+                break
+            repo_names, full = [], False
+            time.sleep(self.options.interval)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Cache of calculated permission trees, shared by all worker processes.
+
+The cache uses the beaker region `permissions`, it is only active if this
+region is configured. The region has to use a backend shared by all
+processes, e.g. ``file``, ``dbm`` or ``ext:memcached``.
+
+Entries are never deleted. Instead every cache key contains a token of the
+user and a global token. Once the database changes in a way that affects
+permissions, the tokens of the affected users (or the global token) are
+replaced after the transaction has been committed, so that the stale entries
+are not used anymore.
+"""
+
+import logging
+import time
+import uuid
+
+import sqlalchemy
+from beaker.cache import cache_regions
+
+from rhodecode.lib import caches
+from rhodecode.lib.cache_utils import CacheStats, ProcessWideInstances
+from rhodecode.model.db import (
+    Permission, RepoGroup, Repository, User, UserGroup, UserGroupMember,
+    UserGroupRepoGroupToPerm, UserGroupRepoToPerm, UserGroupToPerm,
+    UserGroupUserGroupToPerm, UserRepoGroupToPerm, UserRepoToPerm,
+    UserToPerm, UserUserGroupToPerm)
+
+log = logging.getLogger(__name__)
+
+REGION = 'permissions'
+NAMESPACE = 'cache_permission_trees'
+GLOBAL_TOKEN = 'token_global'
+
+# changes of these objects affect the user they belong to
+USER_PERMISSION_MODELS = (
+    UserRepoToPerm, UserRepoGroupToPerm, UserUserGroupToPerm, UserToPerm,
+    UserGroupMember)
+
+# changes of these objects affect all members of the user group
+USER_GROUP_PERMISSION_MODELS = (
+    UserGroupRepoToPerm, UserGroupRepoGroupToPerm, UserGroupUserGroupToPerm,
+    UserGroupToPerm)
+
+# changes of these attributes may affect any user
+GLOBAL_ATTRIBUTES = {
+    Repository: ('_repo_name', 'user', 'user_id', 'private', 'group',
+                 'group_id'),
+    RepoGroup: ('group_name', 'user', 'user_id', 'parent_group',
+                'group_parent_id'),
+    UserGroup: ('users_group_name', 'users_group_active',
+                'inherit_default_permissions', 'user', 'user_id'),
+    Permission: ('permission_name', ),
+}
+
+_PENDING_KEY = 'permission_cache_invalidation'
+
+
+class PermissionCache(object):
+    """
+    Stores permission trees in `cache_manager`.
+    """
+
+    def __init__(self, cache_manager):
+        self._cache = cache_manager
+        self._stats = CacheStats('compute_time', 'invalidations')
+
+    def get_stats(self):
+        return self._stats.get_stats()
+
+    def _get(self, key):
+        if self._cache.has_key(key):
+            try:
+                return self._cache.get(key)
+            except KeyError:
+                # expired in the meantime
+                pass
+        return None
+
+    def _get_token(self, token_key):
+        token = self._get(token_key)
+        if token is None:
+            token = self._new_token(token_key)
+        return token
+
+    def _new_token(self, token_key):
+        # random tokens, an expired token must never be re-used
+        token = uuid.uuid4().hex
+        self._cache.put(token_key, token)
+        return token
+
+    def get_permissions(self, user_id, params, compute_func):
+        """
+        Returns the permission tree of `user_id` for the given `params`, it
+        is calculated by calling `compute_func` if it is not cached.
+
+        :param params: all values which influence the calculation, e.g. the
+            scope and the algorithm.
+        """
+        key = caches.compute_key_from_params(
+            user_id, self._get_token(GLOBAL_TOKEN),
+            self._get_token(_user_token_key(user_id)), *params)
+        result = self._get(key)
+        if result is not None:
+            self._stats.count('hits')
+            return result
+
+        self._stats.count('misses')
+        start = time.time()
+        result = compute_func()
+        self._stats.count('compute_time', time.time() - start)
+        self._cache.put(key, result)
+        return result
+
+    def invalidate(self, user_ids=(), everything=False):
+        if everything:
+            log.debug('Invalidating permission cache of all users')
+            self._new_token(GLOBAL_TOKEN)
+        else:
+            log.debug('Invalidating permission cache of users %s', user_ids)
+            for user_id in user_ids:
+                self._new_token(_user_token_key(user_id))
+        self._stats.count('invalidations')
+
+
+def _user_token_key(user_id):
+    return 'token_user_%s' % (user_id, )
+
+
+_permission_caches = ProcessWideInstances(
+    lambda: PermissionCache(caches.get_cache_manager(REGION, NAMESPACE)))
+
+
+def get_permission_cache():
+    """
+    Returns the process wide `PermissionCache` or ``None`` if the `permissions`
+    cache region is not configured.
+    """
+    if REGION not in cache_regions:
+        return None
+    return _permission_caches.get()
+
+
+def _has_changes(obj, attributes):
+    state = sqlalchemy.inspect(obj)
+    return any(
+        state.attrs[attr].history.has_changes() for attr in attributes)
+
+
+def _collect_changes(session, flush_context):
+    """
+    Remembers which users are affected by the objects which are flushed.
+    """
+    user_ids, user_group_ids = set(), set()
+    everything = False
+
+    dirty = session.dirty
+    for obj in session.new | dirty | session.deleted:
+        if isinstance(obj, USER_PERMISSION_MODELS):
+            user_ids.add(obj.user_id)
+        elif isinstance(obj, USER_GROUP_PERMISSION_MODELS):
+            user_group_ids.add(obj.users_group_id)
+        elif isinstance(obj, tuple(GLOBAL_ATTRIBUTES)):
+            if obj in dirty:
+                everything = everything or _has_changes(
+                    obj, GLOBAL_ATTRIBUTES[type(obj)])
+            else:
+                everything = True
+
+    if not (user_ids or user_group_ids or everything):
+        return
+
+    if user_group_ids and not everything:
+        with session.no_autoflush:
+            members = session.query(UserGroupMember.user_id)\
+                .filter(UserGroupMember.users_group_id.in_(user_group_ids))
+            user_ids.update(member.user_id for member in members)
+
+    # permissions of the default user apply to everybody
+    if user_ids and not everything:
+        with session.no_autoflush:
+            default_user = User.get_default_user(cache=True)
+        everything = default_user.user_id in user_ids
+
+    pending = session.info.setdefault(
+        _PENDING_KEY, {'user_ids': set(), 'everything': False})
+    pending['user_ids'].update(user_ids)
+    pending['everything'] = pending['everything'] or everything
+
+
+def _invalidate_committed(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    permission_cache = get_permission_cache()
+    if pending and permission_cache:
+        permission_cache.invalidate(
+            user_ids=pending['user_ids'], everything=pending['everything'])
+
+
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def register_invalidation_events(session):
+    """
+    Registers the listeners which invalidate the cache once a transaction of
+    `session` changed permissions.
+    """
+    if sqlalchemy.event.contains(session, 'after_flush', _collect_changes):
+        return
+    sqlalchemy.event.listen(session, 'after_flush', _collect_changes)
+    sqlalchemy.event.listen(session, 'after_commit', _invalidate_committed)
+    sqlalchemy.event.listen(session, 'after_rollback', _discard_pending)
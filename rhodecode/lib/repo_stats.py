@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Incremental statistics of the files in a commit.
+
+The statistics (total size, amount of files and both per extension) of a
+commit are stored in the `repo_cache_long` cache region. Statistics of a new
+commit are derived from the ones of its first parent by looking only at the
+files changed in the commit, the full tree is only walked if no statistics
+of a close enough ancestor are known.
+"""
+
+import copy
+import logging
+
+from rhodecode.lib import caches
+from rhodecode.lib.vcs.exceptions import NodeDoesNotExistError
+
+log = logging.getLogger(__name__)
+
+# amount of first parents which are checked for known statistics, before
+# falling back to walk the full tree
+MAX_INCREMENTAL_COMMITS = 100
+
+
+def _empty_stats():
+    return {'size': 0, 'files': 0, 'extensions': {}}
+
+
+def _get_extension(path):
+    # same as `FileNode.extension`
+    return path.split('/')[-1].split('.')[-1].lower()
+
+
+def _add_file(stats, path, size):
+    stats['size'] += size
+    stats['files'] += 1
+    ext_stats = stats['extensions'].setdefault(
+        _get_extension(path), {'count': 0, 'size': 0})
+    ext_stats['count'] += 1
+    ext_stats['size'] += size
+
+
+def _remove_file(stats, path, size):
+    stats['size'] -= size
+    stats['files'] -= 1
+    ext = _get_extension(path)
+    ext_stats = stats['extensions'][ext]
+    ext_stats['count'] -= 1
+    ext_stats['size'] -= size
+    if not ext_stats['count']:
+        del stats['extensions'][ext]
+
+
+def _get_file_size(commit, path):
+    """
+    Returns the size of the file `path` in `commit` or ``None`` if there is
+    no such file.
+    """
+    try:
+        node = commit.get_node(path)
+    except NodeDoesNotExistError:
+        return None
+    if not node.is_file():
+        return None
+    return node.size
+
+
+def compute_stats(commit):
+    """
+    Computes the statistics of `commit` by walking its full tree.
+    """
+    stats = _empty_stats()
+    for node in commit.get_filenodes_generator():
+        _add_file(stats, node.path, node.size)
+    return stats
+
+
+def apply_commit(parent_stats, parent, commit):
+    """
+    Returns the statistics of `commit` based on the statistics of its first
+    `parent`, only the changed files are looked up.
+    """
+    stats = copy.deepcopy(parent_stats)
+    for path in commit.get_first_parent_changes():
+        old_size = _get_file_size(parent, path)
+        new_size = _get_file_size(commit, path)
+        if old_size is not None:
+            _remove_file(stats, path, old_size)
+        if new_size is not None:
+            _add_file(stats, path, new_size)
+    return stats
+
+
+class RepoStats(object):
+    """
+    Provides the statistics of commits of the repository `repo_name`.
+    """
+
+    def __init__(self, repo_name, max_incremental=MAX_INCREMENTAL_COMMITS):
+        self.repo_name = repo_name
+        self.max_incremental = max_incremental
+        namespace = caches.get_repo_namespace_key(
+            caches.REPO_STATS, repo_name)
+        self._cache = caches.get_cache_manager('repo_cache_long', namespace)
+
+    def _get_cached(self, commit_id):
+        if self._cache.has_key(commit_id):
+            try:
+                return self._cache.get(commit_id)
+            except KeyError:
+                # expired in the meantime
+                pass
+        return None
+
+    def _store(self, commit_id, stats):
+        self._cache.put(commit_id, stats)
+
+    def get_stats(self, commit):
+        """
+        Returns the statistics of `commit` as a dict with the keys ``size``,
+        ``files`` and ``extensions``. The latter maps the lower case
+        extension to the ``count`` and ``size`` of its files.
+        """
+        stats = self._get_cached(commit.raw_id)
+        if stats is not None:
+            return stats
+
+        # find the closest first parent with known statistics
+        chain = [commit]
+        base_stats = None
+        while len(chain) <= self.max_incremental:
+            parents = chain[-1].parents
+            if not parents:
+                break
+            base_stats = self._get_cached(parents[0].raw_id)
+            if base_stats is not None:
+                break
+            chain.append(parents[0])
+
+        if base_stats is None:
+            log.debug('Computing statistics of %s in %s from the full tree',
+                      commit, self.repo_name)
+            stats = compute_stats(commit)
+            self._store(commit.raw_id, stats)
+            return stats
+
+        log.debug('Computing statistics of %s in %s from %s commits',
+                  commit, self.repo_name, len(chain))
+        stats = base_stats
+        for child in reversed(chain):
+            stats = apply_commit(stats, child.parents[0], child)
+            self._store(child.raw_id, stats)
+        return stats
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Incremental computation of the size of directory trees, e.g. repositories.
+
+Walking a repository and getting the size of every file is slow for
+repositories with many loose objects. The files of the object and pack
+directories of git are never changed once they are written, new files are
+renamed into place. So the total size of the files of such a directory only
+changes together with the mtime of the directory, and it is cached per
+directory keyed by the mtime. The other directories are scanned every time,
+including directories of the same name outside of a git repository, e.g. in
+the store of Mercurial whose files are appended to in place.
+"""
+
+import logging
+import os
+import re
+import stat
+import time
+
+from repoze.lru import LRUCache
+
+from rhodecode.lib.cache_utils import CacheStats, ProcessWideInstances
+from rhodecode.lib.utils2 import safe_str
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+log = logging.getLogger(__name__)
+
+# directories whose files are immutable, if they belong to a git object store
+CACHED_DIRS = re.compile(r'[/\\]objects[/\\]([0-9a-f]{2}|pack)$')
+
+# A directory changed less than this many seconds ago may still change
+# within the resolution of its mtime, it is not cached yet.
+RACY_INTERVAL = 2
+
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def _is_git_dir(path):
+    """
+    Checks if `path` looks like a git repository, either bare or ``.git``.
+    """
+    return (os.path.isfile(os.path.join(path, 'HEAD')) and
+            os.path.isdir(os.path.join(path, 'refs')))
+
+
+def _scan_dir(path):
+    """
+    Returns the total size of the files of `path` and the paths of its sub
+    directories.
+    """
+    files_size = 0
+    dirs = []
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                else:
+                    files_size += entry.stat().st_size
+            except OSError:
+                pass
+    else:
+        for name in os.listdir(path):
+            entry_path = os.path.join(path, name)
+            try:
+                if stat.S_ISDIR(os.lstat(entry_path).st_mode):
+                    dirs.append(entry_path)
+                else:
+                    files_size += os.path.getsize(entry_path)
+            except OSError:
+                pass
+    return files_size, dirs
+
+
+class SizeTracker(object):
+    """
+    Computes the size of directory trees, caching the totals of the
+    directories matching `cached_dirs` within a git repository.
+    """
+
+    def __init__(self, cached_dirs=CACHED_DIRS,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self._cached_dirs = cached_dirs
+        self._cache = LRUCache(max_entries)
+        self._stats = CacheStats('scans')
+
+    def get_stats(self):
+        return self._stats.get_stats()
+
+    def _is_cached_dir(self, path):
+        return (self._cached_dirs.search(path) is not None and
+                _is_git_dir(os.path.dirname(os.path.dirname(path))))
+
+    def _get_dir(self, path):
+        if not self._is_cached_dir(path):
+            self._stats.count('scans')
+            return _scan_dir(path)
+
+        mtime = os.stat(path).st_mtime
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            self._stats.count('hits')
+            return cached[1:]
+
+        self._stats.count('misses')
+        files_size, dirs = _scan_dir(path)
+        if time.time() - mtime > RACY_INTERVAL:
+            self._cache.put(path, (mtime, files_size, dirs))
+        return files_size, dirs
+
+    def iter_sizes(self, root_path):
+        """
+        Yields the path and the total size of the files of `root_path` and of
+        every directory below it.
+        """
+        stack = [safe_str(root_path)]
+        while stack:
+            path = stack.pop()
+            try:
+                files_size, dirs = self._get_dir(path)
+            except OSError:
+                log.debug('Failed to get the size of %s', path)
+                continue
+            yield path, files_size
+            stack.extend(dirs)
+
+    def get_size(self, root_path):
+        """
+        Returns the total size of the files below `root_path`.
+        """
+        return sum(size for __, size in self.iter_sizes(root_path))
+
+
+_size_trackers = ProcessWideInstances(SizeTracker)
+
+
+def get_size_tracker():
+    """
+    Returns the process wide `SizeTracker`.
+    """
+    return _size_trackers.get()
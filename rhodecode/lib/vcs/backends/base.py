@@ -24,12 +24,17 @@ Base module for all VCS systems
 
 import collections
 import datetime
+import hashlib
+import heapq
 import itertools
 import logging
 import os
+import threading
 import time
 import warnings
+from cStringIO import StringIO
 
+from repoze.lru import LRUCache
 from zope.cachedescriptors.property import Lazy as LazyProperty
 
 from rhodecode.lib.utils2 import safe_str, safe_unicode
@@ -56,6 +61,22 @@ MergeResponse = collections.namedtuple(
     ('possible', 'executed', 'merge_commit_id', 'failure_reason'))
 
 
+_last_commits_cache = None
+_last_commits_cache_lock = threading.Lock()
+
+
+def _get_last_commits_cache():
+    """
+    Returns the process wide cache of the last commit ids of paths, keyed by
+    the repository, the commit and the paths.
+    """
+    global _last_commits_cache
+    with _last_commits_cache_lock:
+        if _last_commits_cache is None:
+            _last_commits_cache = LRUCache(settings.LAST_COMMITS_CACHE_SIZE)
+    return _last_commits_cache
+
+
 class MergeFailureReason(object):
     """
     Enumeration with all the reasons why the server side merge could fail.
@@ -243,6 +264,16 @@ class BaseRepository(object):
         for commit_id in self.commit_ids:
             yield self.get_commit(commit_id=commit_id)
 
+    def _get_commits(self, commit_ids, pre_load=None):
+        """
+        Returns a list of commits for the given `commit_ids`.
+
+        Backends can override this to load the commits with fewer remote
+        calls than one `get_commit` per commit.
+        """
+        return [self.get_commit(commit_id=commit_id, pre_load=pre_load)
+                for commit_id in commit_ids]
+
     def get_commits(
             self, start_id=None, end_id=None, start_date=None, end_date=None,
             branch_name=None, pre_load=None):
@@ -776,6 +807,26 @@ class BaseCommit(object):
         """
         raise NotImplementedError
 
+    def get_file_contents(self, paths):
+        """
+        Returns a list with the contents of the files at the given `paths`.
+
+        Backends may override this to fetch the contents in fewer round trips.
+        """
+        return [self.get_file_content(path) for path in paths]
+
+    def _get_archive_files(self, paths):
+        """
+        Returns a list of ``(mode, is_link, content)`` of the files at the
+        given `paths`, used to write archives.
+
+        Backends may override this to fetch the files in fewer round trips.
+        """
+        contents = self.get_file_contents(paths)
+        return [
+            (self.get_file_mode(path), self.is_link(path), content)
+            for path, content in zip(paths, contents)]
+
     def get_file_size(self, path):
         """
         Returns size of the file at the given `path`.
@@ -790,6 +841,79 @@ class BaseCommit(object):
         """
         return self.get_file_history(path, limit=1, pre_load=pre_load)[0]
 
+    def get_last_commits(self, paths, pre_load=None):
+        """
+        Returns a dict with the last commit of each of the given `paths`, as
+        :meth:`get_file_commit` returns it for a single path.
+
+        The history is walked once for all `paths` and a path is retired as
+        soon as a commit changing it is found. For merges which resolve a path
+        differently than their parents the result can differ from the one of
+        :meth:`get_file_commit`. Paths not found within
+        ``settings.LAST_COMMITS_WALK_LIMIT`` commits are looked up one by one.
+
+        :param pre_load: Optional. List of commit attributes to load.
+        """
+        paths = [safe_str(path) for path in paths]
+        if not paths:
+            return {}
+
+        cache = _get_last_commits_cache()
+        key = hashlib.sha1('\0'.join(
+            [safe_str(self.repository.path), self.raw_id] + sorted(paths)))
+        key = key.hexdigest()
+        commit_ids = cache.get(key)
+        if commit_ids is None:
+            commit_ids = self._find_last_commit_ids(paths)
+            cache.put(key, commit_ids)
+
+        commits = dict(
+            (commit.raw_id, commit) for commit in
+            self._get_last_commits_by_id(set(commit_ids.values()), pre_load))
+        return dict(
+            (path, commits[commit_id])
+            for path, commit_id in commit_ids.iteritems())
+
+    def _find_last_commit_ids(self, paths):
+        remaining = set(paths)
+        commit_ids = {}
+        for commit_id, changed_paths in self._walk_changed_paths(paths):
+            found = remaining.intersection(changed_paths)
+            for path in found:
+                commit_ids[path] = commit_id
+            remaining -= found
+            if not remaining:
+                break
+
+        for path in remaining:
+            commit_ids[path] = self.get_file_commit(path).raw_id
+        return commit_ids
+
+    def _walk_changed_paths(self, paths):
+        """
+        Yields the id and the changed paths of the ancestors of this commit,
+        starting with this commit, most recent first.
+
+        Every walked commit costs about as much as looking up the last commit
+        of one path, so at most as many commits as `paths` are walked.
+        """
+        limit = min(settings.LAST_COMMITS_WALK_LIMIT, len(paths))
+        seen = set([self.raw_id])
+        heap = [(-self.idx, self)]
+        while heap and limit > 0:
+            limit -= 1
+            __, commit = heapq.heappop(heap)
+            yield commit.raw_id, map(safe_str, commit.affected_files)
+            for parent in commit.parents:
+                if parent.raw_id not in seen:
+                    seen.add(parent.raw_id)
+                    heapq.heappush(heap, (-parent.idx, parent))
+
+    def _get_last_commits_by_id(self, commit_ids, pre_load):
+        return [
+            self.repository.get_commit(commit_id=commit_id, pre_load=pre_load)
+            for commit_id in commit_ids]
+
     def get_file_history(self, path, limit=None, pre_load=None):
         """
         Returns history of file as reversed list of :class:`BaseCommit`
@@ -821,6 +945,16 @@ class BaseCommit(object):
         """
         raise NotImplementedError
 
+    def get_tree_id(self, path):
+        """
+        Returns the id of the content of the directory at `path`, it is the
+        same for all commits in which the directory has the same content.
+        Returns ``None`` if the backend has no such ids.
+
+        :raises ``CommitError``: if there is no directory at the given `path`
+        """
+        return None
+
     def get_node(self, path):
         """
         Returns ``Node`` object from the given ``path``.
@@ -883,6 +1017,80 @@ class BaseCommit(object):
 
         connection.Hg.archive_repo(file_path, mtime, file_info, kind)
 
+    def archive_repo_stream(self, kind='tgz', subrepos=None, prefix=None,
+                            write_metadata=False, mtime=None,
+                            buffer_size=None, batch_size=None):
+        """
+        Returns a generator which yields the archive of this commit in chunks.
+
+        Contrary to :meth:`archive_repo` the archive is written incrementally
+        on this side of the connection. File contents are fetched from the
+        VCSServer in batches of `batch_size` files, so the memory used is
+        bounded by `buffer_size` and the biggest files of one batch instead
+        of by the size of the whole tree.
+
+        :param buffer_size: amount of bytes buffered before a chunk is
+            yielded, defaults to ``settings.ARCHIVE_STREAM_BUFFER_SIZE``.
+        :param batch_size: amount of files fetched at once, defaults to
+            ``settings.ARCHIVE_STREAM_BATCH_SIZE``.
+
+        :raise VCSError: If prefix has a problem.
+        """
+        from rhodecode.lib.vcs.utils.archive import stream_archive
+
+        allowed_kinds = settings.ARCHIVE_SPECS.keys()
+        if kind not in allowed_kinds:
+            raise ImproperArchiveTypeError(
+                'Archive kind (%s) not supported use one of %s' %
+                (kind, allowed_kinds))
+
+        prefix = self._validate_archive_prefix(prefix)
+        mtime = mtime or time.time()
+        buffer_size = buffer_size or settings.ARCHIVE_STREAM_BUFFER_SIZE
+        batch_size = batch_size or settings.ARCHIVE_STREAM_BATCH_SIZE
+
+        file_info = self._iter_archive_file_info(
+            prefix, write_metadata, mtime, batch_size)
+        return stream_archive(file_info, kind, mtime, buffer_size=buffer_size)
+
+    def _iter_archive_file_info(self, prefix, write_metadata, mtime,
+                                batch_size):
+        """
+        Lazily yields ``(path, mode, is_link, content)`` for every file.
+
+        The content is read straight from the commit and not via
+        `FileNode.raw_bytes`, so that it is not kept alive by the nodes
+        cached inside of the directory nodes.
+        """
+        cur_rev = self.repository.get_commit(commit_id=self.raw_id)
+
+        def fetch(batch):
+            files = cur_rev._get_archive_files(batch)
+            for f_path, (mode, is_link, content) in zip(batch, files):
+                yield (os.path.join(prefix, f_path), mode, is_link, content)
+
+        batch = []
+        for _r, _d, files in cur_rev.walk('/'):
+            for f in files:
+                batch.append(safe_str(f.path))
+                if len(batch) >= batch_size:
+                    for info in fetch(batch):
+                        yield info
+                    batch = []
+        for info in fetch(batch):
+            yield info
+
+        if write_metadata:
+            metadata = [
+                ('repo_name', self.repository.name),
+                ('rev', self.raw_id),
+                ('create_time', mtime),
+                ('branch', self.branch),
+                ('tags', ','.join(self.tags)),
+            ]
+            meta = ["%s:%s" % (f_name, value) for f_name, value in metadata]
+            yield ('.archival.txt', 0644, False, safe_str('\n'.join(meta)))
+
     def _validate_archive_prefix(self, prefix):
         if prefix is None:
             prefix = self._ARCHIVE_PREFIX_TEMPLATE.format(
@@ -968,6 +1176,14 @@ class BaseCommit(object):
         """
         raise NotImplementedError
 
+    def get_first_parent_changes(self):
+        """
+        Returns the set of paths which may differ between this commit and its
+        first parent. For merges this may be a superset, e.g. the changes
+        against all parents.
+        """
+        return set(self.affected_files)
+
     @LazyProperty
     def size(self):
         """
@@ -1393,16 +1609,21 @@ class CollectionGenerator(object):
         return self.commit_ids.__len__()
 
     def __iter__(self):
-        for commit_id in self.commit_ids:
+        # commits are created in chunks, so that backends can load them
+        # with a few batched remote calls
+        batch_size = settings.REMOTE_BATCH_SIZE
+        commit_ids = self.commit_ids
+        for start in xrange(0, len(commit_ids), batch_size):
             # TODO: johbo: Mercurial passes in commit indices or commit ids
-            yield self._commit_factory(commit_id)
+            chunk = commit_ids[start:start + batch_size]
+            for commit in self._commits_factory(chunk):
+                yield commit
 
-    def _commit_factory(self, commit_id):
+    def _commits_factory(self, commit_ids):
         """
         Allows backends to override the way commits are generated.
         """
-        return self.repo.get_commit(commit_id=commit_id,
-                                    pre_load=self.pre_load)
+        return self.repo._get_commits(commit_ids, pre_load=self.pre_load)
 
     def __getslice__(self, i, j):
         """
@@ -1426,6 +1647,15 @@ class Config(object):
 
     def __init__(self):
         self._values = {}
+        self._version = 0
+
+    @property
+    def version(self):
+        """
+        Counter which is increased on every modification, it allows to cache
+        the serialized form of this config.
+        """
+        return self._version
 
     def copy(self):
         clone = Config()
@@ -1445,9 +1675,11 @@ class Config(object):
     def set(self, section, option, value):
         section_values = self._values.setdefault(section, {})
         section_values[option] = value
+        self._version += 1
 
     def clear_section(self, section):
         self._values[section] = {}
+        self._version += 1
 
     def serialize(self):
         """
@@ -1470,32 +1702,50 @@ class Diff(object):
     """
 
     _header_re = None
+    _chunk_start = 'diff --git'
 
     def __init__(self, raw_diff):
         self.raw = raw_diff
 
+    def _iter_lines(self):
+        if isinstance(self.raw, str):
+            return StringIO(self.raw)
+        return _split_lines(self.raw)
+
     def chunks(self):
         """
-        split the diff in chunks of separate --git a/file b/file chunks
-        to make diffs consistent we must prepend with \n, and make sure
-        we can detect last chunk as this was also has special rule
+        Returns a generator of `DiffChunk` objects, one per file. Each chunk
+        starts at a line beginning with ``diff --git``, the chunks are split
+        off one by one instead of splitting the whole diff at once.
         """
-        chunks = ('\n' + self.raw).split('\ndiff --git')[1:]
-        total_chunks = len(chunks)
-        return (DiffChunk(chunk, self, cur_chunk == total_chunks)
-                for cur_chunk, chunk in enumerate(chunks, start=1))
+        chunk_lines = None
+        for line in self._iter_lines():
+            if line.startswith(self._chunk_start):
+                if chunk_lines is not None:
+                    yield DiffChunk(''.join(chunk_lines), self)
+                chunk_lines = [line[len(self._chunk_start):]]
+            elif chunk_lines is not None:
+                chunk_lines.append(line)
+        if chunk_lines is not None:
+            yield DiffChunk(''.join(chunk_lines), self)
 
 
-class DiffChunk(object):
+def _split_lines(text):
+    """
+    Returns the lines of `text`, keeping the line endings. Unlike
+    `splitlines` only ``\\n`` ends a line.
+    """
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start) + 1 or len(text)
+        yield text[start:end]
+        start = end
 
-    def __init__(self, chunk, diff, last_chunk):
-        self._diff = diff
 
-        # since we split by \ndiff --git that part is lost from original diff
-        # we need to re-apply it at the end, EXCEPT ! if it's last chunk
-        if not last_chunk:
-            chunk += '\n'
+class DiffChunk(object):
 
+    def __init__(self, chunk, diff):
+        self._diff = diff
         match = self._diff._header_re.match(chunk)
         self.header = match.groupdict()
         self.diff = chunk[match.end():]
@@ -22,12 +22,15 @@
 GIT commit module
 """
 
+import posixpath
 import re
 import stat
+import threading
 from ConfigParser import ConfigParser
 from itertools import chain
 from StringIO import StringIO
 
+from repoze.lru import LRUCache
 from zope.cachedescriptors.property import Lazy as LazyProperty
 
 from rhodecode.lib.datelib import utcdate_fromtimestamp
@@ -42,6 +45,28 @@ from rhodecode.lib.vcs.nodes import (
     RemovedFileNodesGenerator)
 
 
+# ls-tree reports submodules as commits, the remote tree items as links
+_LS_TREE_TYPES = {'commit': 'link'}
+
+_tree_cache = None
+_tree_cache_lock = threading.Lock()
+
+
+def _get_tree_cache():
+    """
+    Returns the process wide cache of parsed trees. Trees are immutable, so
+    the entries never get stale and can be shared by all repositories.
+
+    Complete trees are stored by their id, single entries of a tree by the
+    tuple of the tree id and the entry name.
+    """
+    global _tree_cache
+    with _tree_cache_lock:
+        if _tree_cache is None:
+            _tree_cache = LRUCache(settings.GIT_TREE_CACHE_SIZE)
+    return _tree_cache
+
+
 class GitCommit(base.BaseCommit):
     """
     Represents state of the repository at single commit id.
@@ -81,15 +106,29 @@ class GitCommit(base.BaseCommit):
         self.nodes = {}
         self._submodules = None
 
+    @classmethod
+    def _get_bulk_attributes(cls, pre_load):
+        """
+        Returns the attributes of `pre_load` which can be loaded in bulk.
+        """
+        return [entry for entry in pre_load or []
+                if entry not in cls._filter_pre_load]
+
     def _set_bulk_properties(self, pre_load):
-        if not pre_load:
-            return
-        pre_load = [entry for entry in pre_load
-                    if entry not in self._filter_pre_load]
+        pre_load = self._get_bulk_attributes(pre_load)
         if not pre_load:
             return
 
         result = self._remote.bulk_request(self.raw_id, pre_load)
+        self._apply_bulk_properties(result)
+
+    def _apply_bulk_properties(self, result, parents=None):
+        """
+        Sets the attributes returned from a ``bulk_request`` call.
+
+        :param parents: optional mapping of commit id to already created
+            parent commits, avoids to look up the parents one by one.
+        """
         for attr, value in result.items():
             if attr in ["author", "message"]:
                 if value:
@@ -97,7 +136,10 @@ class GitCommit(base.BaseCommit):
             elif attr == "date":
                 value = utcdate_fromtimestamp(*value)
             elif attr == "parents":
-                value = self._make_commits(value)
+                if parents is not None:
+                    value = [parents[commit_id] for commit_id in value]
+                else:
+                    value = self._make_commits(value)
             self.__dict__[attr] = value
 
     @LazyProperty
@@ -172,48 +214,88 @@ class GitCommit(base.BaseCommit):
             return data
 
         parts = path.split('/')
-        dirs, name = parts[:-1], parts[-1]
+        tree_cache = _get_tree_cache()
         cur_dir = ''
-
-        # initially extract things from root dir
-        tree_items = self._remote.tree_items(tree_id)
-        self._process_tree_items(tree_items, cur_dir)
-
-        for dir in dirs:
-            if cur_dir:
-                cur_dir = '/'.join((cur_dir, dir))
+        for depth, part in enumerate(parts):
+            entries = tree_cache.get(tree_id)
+            if entries is not None:
+                entry = entries.get(part)
             else:
-                cur_dir = dir
-            dir_id = None
-            for item, stat_, id_, type_ in tree_items:
-                if item == dir:
-                    dir_id = id_
+                # single entries of the tree may be known from `_resolve_path`
+                entry = tree_cache.get((tree_id, part))
+                if entry is None:
+                    # unknown tree, resolve the rest of the path in one go
+                    self._resolve_path(path)
                     break
-            if dir_id:
+
+            cur_dir = '/'.join((cur_dir, part)) if cur_dir else part
+            if entry is None:
+                break
+            stat_, id_, type_ = entry
+            self._paths[cur_dir] = [id_, type_]
+            self._stat_modes[cur_dir] = stat_
+            if depth < len(parts) - 1:
                 if type_ != "tree":
                     raise CommitError('%s is not a directory' % cur_dir)
-                # update tree
-                tree_items = self._remote.tree_items(dir_id)
-            else:
-                raise CommitError('%s have not been found' % cur_dir)
-
-            # cache all items from the given traversed tree
-            self._process_tree_items(tree_items, cur_dir)
+                tree_id = id_
 
         if path not in self._paths:
+            self._check_parent_dirs(parts)
             raise self.no_node_at_path(path)
 
         return self._paths[path]
 
-    def _process_tree_items(self, items, cur_dir):
-        for item, stat_, id_, type_ in items:
-            if cur_dir:
-                name = '/'.join((cur_dir, item))
-            else:
-                name = item
+    def _resolve_path(self, path):
+        """
+        Looks up `path` and all its parent directories with one remote call.
+
+        The found entries are shared with other commits through the tree
+        cache, keyed by the id of their tree and their name, as ``ls-tree``
+        does not list the other entries of the trees.
+        """
+        output, __ = self.repository.run_git_command(
+            ['--literal-pathspecs', 'ls-tree', '-t', '-z', '--full-tree',
+             self.raw_id, '--', path])
+        tree_cache = _get_tree_cache()
+        for line in output.split('\0'):
+            if not line:
+                continue
+            info, name = line.split('\t', 1)
+            mode, type_, id_ = info.split(' ')
+            stat_ = int(mode, 8)
+            type_ = _LS_TREE_TYPES.get(type_, type_)
             self._paths[name] = [id_, type_]
             self._stat_modes[name] = stat_
 
+            # parent directories are listed before their entries
+            parent_dir, __, base_name = name.rpartition('/')
+            parent_id = self._paths[parent_dir][0] if parent_dir else (
+                self._tree_id)
+            tree_cache.put((parent_id, base_name), (stat_, id_, type_))
+
+    def _check_parent_dirs(self, parts):
+        cur_dir = ''
+        for part in parts[:-1]:
+            cur_dir = '/'.join((cur_dir, part)) if cur_dir else part
+            if cur_dir not in self._paths:
+                raise CommitError('%s have not been found' % cur_dir)
+            if self._paths[cur_dir][1] != "tree":
+                raise CommitError('%s is not a directory' % cur_dir)
+
+    def _get_tree_entries(self, tree_id):
+        """
+        Returns the entries of the tree `tree_id` as a dict which maps the
+        name to ``(stat, id, type)``.
+        """
+        tree_cache = _get_tree_cache()
+        entries = tree_cache.get(tree_id)
+        if entries is None:
+            entries = dict(
+                (name, (stat_, id_, type_))
+                for name, stat_, id_, type_ in self._remote.tree_items(tree_id))
+            tree_cache.put(tree_id, entries)
+        return entries
+
     def _get_kind(self, path):
         path_id, type_ = self._get_id_for_path(path)
         if type_ == 'blob':
@@ -262,8 +344,7 @@ class GitCommit(base.BaseCommit):
         return self._make_commits(child_ids)
 
     def _make_commits(self, commit_ids):
-        return [self.repository.get_commit(commit_id=commit_id)
-                for commit_id in commit_ids]
+        return self.repository._get_commits(commit_ids)
 
     def get_file_mode(self, path):
         """
@@ -284,6 +365,16 @@ class GitCommit(base.BaseCommit):
         id_, _ = self._get_id_for_path(path)
         return self._remote.blob_as_pretty_string(id_)
 
+    def get_file_contents(self, paths):
+        """
+        Returns the contents of the files at the given `paths`, they are
+        fetched in one batch of remote calls.
+        """
+        ids = [self._get_id_for_path(path)[0] for path in paths]
+        with self._remote.batch() as batch:
+            calls = [batch.blob_as_pretty_string(id_) for id_ in ids]
+        return [call.result for call in calls]
+
     def get_file_size(self, path):
         """
         Returns size of the file at given `path`.
@@ -329,6 +420,29 @@ class GitCommit(base.BaseCommit):
             self.repository.get_commit(commit_id=commit_id, pre_load=pre_load)
             for commit_id in commit_ids]
 
+    def _walk_changed_paths(self, paths):
+        """
+        Walks the history of the directories of `paths` with a single
+        `git log` call.
+        """
+        dirnames = sorted(set(posixpath.dirname(path) for path in paths))
+        cmd = ['log', '--format=%x01%H', '-c', '--name-only', '-z',
+               '-n', str(settings.LAST_COMMITS_WALK_LIMIT), self.raw_id]
+        if '' not in dirnames:
+            cmd.append('--')
+            cmd.extend(dirnames)
+
+        output, __ = self.repository.run_git_command(cmd)
+        # every record is the commit id followed by the NUL separated names
+        # of the changed files, merges are only listed with the files which
+        # differ from all their parents
+        for record in output.split('\x01')[1:]:
+            names = record[40:].lstrip('\0\n').split('\0')
+            yield record[:40], [name for name in names if name]
+
+    def _get_last_commits_by_id(self, commit_ids, pre_load):
+        return self.repository._get_commits(list(commit_ids), pre_load)
+
     def get_file_annotate(self, path, pre_load=None):
         """
         Returns a generator of four element tuples with
@@ -353,18 +467,26 @@ class GitCommit(base.BaseCommit):
                                                    pre_load=pre_load),
                 line)
 
+    def get_tree_id(self, path):
+        if self._get_kind(path) != NodeKind.DIR:
+            raise CommitError(
+                "Directory does not exist for commit %s at "
+                " '%s'" % (self.raw_id, path))
+        tree_id, _ = self._get_id_for_path(self._fix_path(path))
+        return tree_id
+
     def get_nodes(self, path):
         if self._get_kind(path) != NodeKind.DIR:
             raise CommitError(
                 "Directory does not exist for commit %s at "
                 " '%s'" % (self.raw_id, path))
         path = self._fix_path(path)
-        id_, _ = self._get_id_for_path(path)
-        tree_id = self._remote[id_]['id']
+        tree_id, _ = self._get_id_for_path(path)
         dirnodes = []
         filenodes = []
         alias = self.repository.alias
-        for name, stat_, id_, type_ in self._remote.tree_items(tree_id):
+        for name, (stat_, id_, type_) in self._get_tree_entries(
+                tree_id).iteritems():
             if type_ == 'link':
                 url = self._get_submodule_url('/'.join((path, name)))
                 dirnodes.append(SubModuleNode(
@@ -375,7 +497,8 @@ class GitCommit(base.BaseCommit):
                 obj_path = '/'.join((path, name))
             else:
                 obj_path = name
-            if obj_path not in self._stat_modes:
+            if obj_path not in self._paths:
+                self._paths[obj_path] = [id_, type_]
                 self._stat_modes[obj_path] = stat_
 
             if type_ == 'tree':
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Commit id index of a git repository.
+
+The index keeps the binary commit ids in commit order and sorted, together
+with the commit index of each sorted id. Lookups of full ids and of prefixes
+are binary searches. If `GIT_COMMIT_INDEX_DIR` is set the index is stored
+there and memory mapped, it is updated incrementally based on the ref tips
+which have been indexed last.
+
+File layout, all numbers are native 32 bit unsigned integers::
+
+    header (magic, format version, commit count, length of the tips)
+    indexed ref tips, separated by new lines
+    binary commit ids in commit order
+    binary commit ids, sorted
+    commit index of each sorted commit id
+"""
+
+import array
+import binascii
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from rhodecode.lib.vcs.conf import settings
+from rhodecode.lib.vcs.exceptions import RepositoryError
+
+log = logging.getLogger(__name__)
+
+MAGIC = 'RCCI'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('=4sIII')
+ID_SIZE = 20
+POSITION = struct.Struct('=I')
+
+# refs which are part of the repository history
+REV_FILTER = ['--branches', '--tags']
+
+
+def _to_binary(commit_id):
+    if len(commit_id) != ID_SIZE * 2:
+        return None
+    try:
+        return binascii.unhexlify(commit_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _serialize(commit_ids, tips):
+    binary_ids = [binascii.unhexlify(commit_id) for commit_id in commit_ids]
+    order = sorted(xrange(len(binary_ids)), key=binary_ids.__getitem__)
+    tips = '\n'.join(tips)
+    return ''.join((
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(binary_ids), len(tips)),
+        tips,
+        ''.join(binary_ids),
+        ''.join(binary_ids[idx] for idx in order),
+        array.array('I', order).tostring(),
+    ))
+
+
+class CommitIndex(object):
+    """
+    Read only index over the serialized data `data`, which is either a string
+    or a memory map.
+    """
+
+    def __init__(self, data, path=None):
+        self._data = data
+        self.path = path
+        magic, version, self.count, tips_len = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Unsupported commit index %s' % (path, ))
+        tips = data[HEADER.size:HEADER.size + tips_len]
+        self.tips = tips.split('\n') if tips else []
+        self._ids_pos = HEADER.size + tips_len
+        self._sorted_pos = self._ids_pos + self.count * ID_SIZE
+        self._positions_pos = self._sorted_pos + self.count * ID_SIZE
+
+    @classmethod
+    def from_commit_ids(cls, commit_ids, tips=()):
+        return cls(_serialize(commit_ids, tips))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data, path=path)
+
+    def __repr__(self):
+        return '<CommitIndex(%s, count=%s)>' % (self.path, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, commit_id):
+        return self.get(commit_id) is not None
+
+    def __getitem__(self, commit_id):
+        idx = self.get(commit_id)
+        if idx is None:
+            raise KeyError(commit_id)
+        return idx
+
+    def _sorted_id(self, position):
+        start = self._sorted_pos + position * ID_SIZE
+        return self._data[start:start + ID_SIZE]
+
+    def _position(self, key):
+        """
+        Returns the first position in the sorted ids which is not lower than
+        the binary `key`.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._sorted_id(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _idx(self, position):
+        return POSITION.unpack_from(
+            self._data, self._positions_pos + position * POSITION.size)[0]
+
+    def get(self, commit_id, default=None):
+        """
+        Returns the commit index of the full `commit_id`.
+        """
+        key = _to_binary(commit_id)
+        if key is None:
+            return default
+        position = self._position(key)
+        if position < self.count and self._sorted_id(position) == key:
+            return self._idx(position)
+        return default
+
+    def commit_id(self, idx):
+        start = self._ids_pos + idx * ID_SIZE
+        return binascii.hexlify(self._data[start:start + ID_SIZE])
+
+    def commit_ids(self):
+        """
+        Returns the list of all commit ids in commit order.
+        """
+        data = binascii.hexlify(
+            self._data[self._ids_pos:self._sorted_pos])
+        return [data[start:start + ID_SIZE * 2]
+                for start in xrange(0, len(data), ID_SIZE * 2)]
+
+    def lookup_prefix(self, prefix, limit=None):
+        """
+        Returns the commit ids starting with the hexadecimal `prefix`, in
+        sorted order and at most `limit` of them.
+        """
+        prefix = prefix.lower()
+        try:
+            key = binascii.unhexlify(prefix[:len(prefix) // 2 * 2])
+            if len(prefix) % 2:
+                key += chr(int(prefix[-1], 16) << 4)
+        except (TypeError, ValueError):
+            return []
+
+        result = []
+        for position in xrange(self._position(key), self.count):
+            commit_id = binascii.hexlify(self._sorted_id(position))
+            if not commit_id.startswith(prefix) or len(result) == limit:
+                break
+            result.append(commit_id)
+        return result
+
+    def close(self):
+        if self.path:
+            self._data.close()
+
+
+def _write(path, commit_ids, tips):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_serialize(commit_ids, tips))
+        # readers have the old file mapped, so it is replaced atomically
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _get_tips(repo):
+    output, __ = repo.run_git_command(['rev-parse'] + REV_FILTER)
+    return sorted(set(output.split()))
+
+
+def _rev_list(repo, revs):
+    if not revs:
+        return []
+    output, __ = repo.run_git_command(
+        ['rev-list', '--reverse', '--date-order'] + revs)
+    return output.splitlines()
+
+
+def _get_new_commit_ids(repo, commit_index, tips):
+    """
+    Returns the ids of the commits added since `commit_index` was written or
+    ``None`` if indexed commits are not reachable anymore.
+    """
+    try:
+        output, __ = repo.run_git_command(
+            ['rev-list', '--count'] + commit_index.tips + ['--not'] + tips)
+    except RepositoryError:
+        # the old tips do not exist anymore
+        return None
+    if int(output.strip() or 0):
+        return None
+    return _rev_list(repo, tips + ['--not'] + commit_index.tips)
+
+
+def update_commit_index(repo, path, commit_index=None, tips=None):
+    """
+    Updates the index at `path` for the git repository `repo` and returns it.
+
+    Only the commits added since the existing `commit_index` are looked up.
+    The new commits are appended, so the commit index of a commit does not
+    change. If the history was rewritten the index is built from scratch.
+    """
+    if tips is None:
+        tips = _get_tips(repo)
+
+    new_commit_ids = None
+    if commit_index is not None and commit_index.tips:
+        new_commit_ids = _get_new_commit_ids(repo, commit_index, tips)
+
+    if new_commit_ids is None:
+        log.debug('Building commit index of %s', repo)
+        commit_ids = _rev_list(repo, tips)
+    else:
+        log.debug('Adding %s commits to the commit index of %s',
+                  len(new_commit_ids), repo)
+        commit_ids = commit_index.commit_ids() + new_commit_ids
+
+    _write(path, commit_ids, tips)
+    return CommitIndex.from_file(path)
+
+
+def get_commit_index_path(repo):
+    """
+    Returns the path of the index for the git repository `repo` or ``None``
+    if the persistent commit index is not enabled.
+    """
+    index_dir = settings.GIT_COMMIT_INDEX_DIR
+    if not index_dir:
+        return None
+    name = hashlib.sha1(repo.path).hexdigest()
+    return os.path.join(index_dir, '%s.git' % (name, ))
+
+
+def get_commit_index(repo):
+    """
+    Returns the up to date stored `CommitIndex` of the git repository `repo`.
+
+    ``None`` is returned if the persistent commit index is not enabled or
+    could not be created, callers have to list the commits instead.
+    """
+    path = get_commit_index_path(repo)
+    if not path:
+        return None
+
+    try:
+        tips = _get_tips(repo)
+    except RepositoryError:
+        log.exception('Failed to read the refs of %s', repo)
+        return None
+
+    commit_index = None
+    if os.path.isfile(path):
+        try:
+            commit_index = CommitIndex.from_file(path)
+        except Exception:
+            log.exception('Failed to read commit index %s', path)
+    if commit_index is not None and commit_index.tips == tips:
+        return commit_index
+
+    try:
+        return update_commit_index(
+            repo, path, commit_index=commit_index, tips=tips)
+    except Exception:
+        log.exception('Failed to update commit index %s', path)
+        return None
@@ -38,6 +38,8 @@ from rhodecode.lib.vcs.backends.base import (
     BaseRepository, CollectionGenerator, Config, MergeResponse,
     MergeFailureReason)
 from rhodecode.lib.vcs.backends.git.commit import GitCommit
+from rhodecode.lib.vcs.backends.git.commit_index import (
+    CommitIndex, get_commit_index)
 from rhodecode.lib.vcs.backends.git.diff import GitDiff
 from rhodecode.lib.vcs.backends.git.inmemory import GitInMemoryCommit
 from rhodecode.lib.vcs.conf import settings
@@ -70,7 +72,7 @@ class GitRepository(BaseRepository):
         self._init_repo(create, src_url, update_after_clone, bare)
 
         # caches
-        self._commit_ids = {}
+        self._commit_ids = CommitIndex.from_commit_ids([])
 
         self.bookmarks = {}
 
@@ -88,13 +90,17 @@ class GitRepository(BaseRepository):
         Returns list of commit ids, in ascending order.  Being lazy
         attribute allows external tools to inject commit ids from cache.
         """
+        commit_index = get_commit_index(self)
+        if commit_index is not None:
+            self._commit_ids = commit_index
+            return commit_index.commit_ids()
+
         commit_ids = self._get_all_commit_ids()
         self._rebuild_cache(commit_ids)
         return commit_ids
 
     def _rebuild_cache(self, commit_ids):
-        self._commit_ids = dict((commit_id, index)
-                                for index, commit_id in enumerate(commit_ids))
+        self._commit_ids = CommitIndex.from_commit_ids(commit_ids)
 
     def run_git_command(self, cmd, **opts):
         """
@@ -220,6 +226,7 @@ class GitRepository(BaseRepository):
 
         if commit_id_or_idx in (None, '', 'tip', 'HEAD', 'head', -1):
             return self.commit_ids[-1]
+        commit_index = self._get_commit_index()
 
         is_bstr = isinstance(commit_id_or_idx, (str, unicode))
         if ((is_bstr and commit_id_or_idx.isdigit() and len(commit_id_or_idx) < 12)
@@ -237,16 +244,21 @@ class GitRepository(BaseRepository):
             if ref_id:  # and ref_id[1] in ['H', 'RH', 'T']:
                 return ref_id[0]
 
-            tag_ids = self.tags.values()
+            if commit_id_or_idx in commit_index:
+                return commit_id_or_idx
+
             # maybe it's a tag ? we don't have them in self.commit_ids
-            if commit_id_or_idx in tag_ids:
+            if commit_id_or_idx in self.tags.values():
                 return commit_id_or_idx
 
-            elif (not SHA_PATTERN.match(commit_id_or_idx) or
-                    commit_id_or_idx not in self.commit_ids):
+            matches = []
+            if SHA_PATTERN.match(commit_id_or_idx):
+                matches = commit_index.lookup_prefix(commit_id_or_idx, limit=2)
+            if len(matches) != 1:
                 msg = "Commit %s does not exist for %s" % (
                     commit_id_or_idx, self)
                 raise CommitDoesNotExistError(msg)
+            commit_id_or_idx = matches[0]
 
         # Ensure we return full id
         if not SHA_PATTERN.match(str(commit_id_or_idx)):
@@ -254,6 +266,16 @@ class GitRepository(BaseRepository):
                 "Given commit id %s not recognized" % commit_id_or_idx)
         return commit_id_or_idx
 
+    def _get_commit_index(self):
+        """
+        Returns the `CommitIndex` matching `commit_ids`.
+        """
+        commit_ids = self.commit_ids
+        if len(self._commit_ids) != len(commit_ids):
+            # commit ids have been injected from outside
+            self._rebuild_cache(commit_ids)
+        return self._commit_ids
+
     def get_hook_location(self):
         """
         returns absolute path to location where hooks are stored
@@ -406,6 +428,52 @@ class GitRepository(BaseRepository):
 
         return GitCommit(self, commit_id, idx, pre_load=pre_load)
 
+    def _get_commits(self, commit_ids, pre_load=None):
+        """
+        Returns `GitCommit` objects for the given `commit_ids`.
+
+        The lookup of all commits and their pre loaded attributes is done
+        in one batch of remote calls if the VCSServer supports batch
+        requests. Contrary to `get_commit` only full commit ids are supported.
+        """
+        if not settings.REMOTE_BATCH_CALLS:
+            return super(GitRepository, self)._get_commits(
+                commit_ids, pre_load=pre_load)
+
+        bulk_attributes = GitCommit._get_bulk_attributes(pre_load)
+        with self._remote.batch() as batch:
+            lookups = [(batch.get_object(commit_id),
+                        bulk_attributes and batch.bulk_request(
+                            commit_id, bulk_attributes))
+                       for commit_id in commit_ids]
+
+        commits = []
+        for commit_id, (obj, properties) in zip(commit_ids, lookups):
+            try:
+                commit_id = obj.result["commit_id"]
+                idx = self._commit_ids[commit_id]
+            except KeyError:
+                raise RepositoryError(
+                    "Cannot get object with id %s" % commit_id)
+            commits.append(
+                (GitCommit(self, commit_id, idx),
+                 properties.result if properties else None))
+
+        # the parents of all commits are looked up together as well
+        parents = None
+        if 'parents' in bulk_attributes:
+            parent_ids = set()
+            for _commit, result in commits:
+                parent_ids.update(result['parents'])
+            parents = dict(
+                (parent.raw_id, parent)
+                for parent in self._get_commits(sorted(parent_ids)))
+
+        for commit, result in commits:
+            if result:
+                commit._apply_bulk_properties(result, parents=parents)
+        return [commit for commit, _result in commits]
+
     def get_commits(
             self, start_id=None, end_id=None, start_date=None, end_date=None,
             branch_name=None, pre_load=None):
@@ -219,6 +219,31 @@ class MercurialCommit(base.BaseCommit):
         path = self._get_filectx(path)
         return self._remote.fctx_data(self.idx, path)
 
+    def get_file_contents(self, paths):
+        """
+        Returns the contents of the files at the given ``paths``, they are
+        fetched in one batch of remote calls.
+        """
+        paths = [self._get_filectx(path) for path in paths]
+        with self._remote.batch() as batch:
+            calls = [batch.fctx_data(self.idx, path) for path in paths]
+        return [call.result for call in calls]
+
+    def _get_archive_files(self, paths):
+        paths = [self._get_filectx(path) for path in paths]
+        with self._remote.batch() as batch:
+            calls = [(batch.fctx_flags(self.idx, path),
+                      batch.fctx_data(self.idx, path)) for path in paths]
+
+        files = []
+        for flags, data in calls:
+            if 'x' in flags.result:
+                mode = base.FILEMODE_EXECUTABLE
+            else:
+                mode = base.FILEMODE_DEFAULT
+            files.append((mode, 'l' in flags.result, data.result))
+        return files
+
     def get_file_size(self, path):
         """
         Returns size of the file at given ``path``.
@@ -340,6 +365,11 @@ class MercurialCommit(base.BaseCommit):
         """
         return self._remote.ctx_files(self.idx)
 
+    def get_first_parent_changes(self):
+        # the status is relative to the first parent, also for merges
+        modified, added, removed = self.status[:3]
+        return set(modified + added + removed)
+
     @property
     def added(self):
         """
@@ -791,6 +791,7 @@ class MercurialRepository(BaseRepository):
 
 class MercurialIndexBasedCollectionGenerator(CollectionGenerator):
 
-    def _commit_factory(self, commit_id):
-        return self.repo.get_commit(
-            commit_idx=commit_id, pre_load=self.pre_load)
+    def _commits_factory(self, commit_ids):
+        return [
+            self.repo.get_commit(commit_idx=commit_id, pre_load=self.pre_load)
+            for commit_id in commit_ids]
@@ -38,6 +38,7 @@ from pyramid.threadlocal import get_current_request
 from Pyro4.errors import CommunicationError, ConnectionClosedError, DaemonError
 
 from rhodecode.lib.vcs import exceptions
+from rhodecode.lib.vcs.client_http import RemoteBatch, _call_sequentially
 from rhodecode.lib.vcs.conf import settings
 
 log = logging.getLogger(__name__)
@@ -300,6 +301,17 @@ class RemoteRepo(object):
         same API for client.RemoteRepo and client_http.RemoteRepo classes.
         """
 
+    def batch(self):
+        """
+        Returns a `RemoteBatch`, the pyro4 backend performs the collected
+        calls one by one, so that the same API as in
+        `client_http.RemoteRepo` is available.
+        """
+        return RemoteBatch(self)
+
+    def _call_batch(self, calls):
+        _call_sequentially(self, calls)
+
 
 def _get_proxy_method(proxy, name):
     try:
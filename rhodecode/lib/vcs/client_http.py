@@ -29,8 +29,9 @@ This client implementation shall eventually replace the Pyro4 based
 implementation.
 """
 
-import copy
+import itertools
 import logging
+import os
 import threading
 import urllib2
 import urlparse
@@ -40,6 +41,7 @@ import msgpack
 import requests
 
 from . import exceptions, CurlSession
+from rhodecode.lib.vcs.conf import settings
 
 
 log = logging.getLogger(__name__)
@@ -52,6 +54,14 @@ EXCEPTIONS_MAP = {
     'URLError': urllib2.URLError,
 }
 
+_call_ids = itertools.count()
+
+# Parts of the payload which are the same for all calls, see `_pack_payload`
+_PAYLOAD_MAP_HEADER = msgpack.Packer().pack_map_header(3)
+_PACKED_KEYS = dict(
+    (key, msgpack.packb(key))
+    for key in ('id', 'method', 'params', 'wire', 'args', 'kwargs'))
+
 
 class RepoMaker(object):
 
@@ -74,7 +84,7 @@ class RepoMaker(object):
     @exceptions.map_vcs_exceptions
     def _call(self, name, *args, **kwargs):
         payload = {
-            'id': str(uuid.uuid4()),
+            'id': _new_call_id(),
             'method': name,
             'params': {'args': args, 'kwargs': kwargs}
         }
@@ -82,18 +92,61 @@ class RepoMaker(object):
             self.url, payload, EXCEPTIONS_MAP, self._session_factory())
 
 
+class WireDict(dict):
+    """
+    Holds the wire of a `RemoteRepo`.
+
+    Counts its modifications, so that the serialized wire can be cached.
+    """
+
+    version = 0
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.version += 1
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.version += 1
+
+    def pop(self, *args):
+        value = dict.pop(self, *args)
+        self.version += 1
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self.version += 1
+        return item
+
+    def setdefault(self, key, default=None):
+        value = dict.setdefault(self, key, default)
+        self.version += 1
+        return value
+
+    def clear(self):
+        dict.clear(self)
+        self.version += 1
+
+
 class RemoteRepo(object):
 
     def __init__(self, path, config, url, session, with_wire=None):
         self.url = url
         self._session = session
-        self._wire = {
+        self._wire = WireDict({
             "path": path,
             "config": config,
             "context": self._create_vcs_cache_context(),
-        }
+        })
         if with_wire:
             self._wire.update(with_wire)
+        self._packed_wire = None
+        self._packed_wire_version = None
 
         # johbo: Trading complexity for performance. Avoiding the call to
         # log.debug brings a few percent gain even if is is not active.
@@ -105,23 +158,76 @@ class RemoteRepo(object):
             return self._call(name, *args, **kwargs)
         return f
 
+    def _get_packed_wire(self):
+        """
+        Returns the serialized wire, it is only re-created if the wire or
+        the config object have been changed, e.g. in hooking scenarios.
+        """
+        config = self._wire["config"]
+        version = (self._wire.version, getattr(config, 'version', None))
+        if version[1] is None or version != self._packed_wire_version:
+            wire = dict(self._wire)
+            wire["config"] = config.serialize()
+            self._packed_wire = msgpack.packb(wire)
+            self._packed_wire_version = version
+        return self._packed_wire
+
     @exceptions.map_vcs_exceptions
     def _call(self, name, *args, **kwargs):
-        # TODO: oliver: This is currently necessary pre-call since the
-        # config object is being changed for hooking scenarios
-        wire = copy.deepcopy(self._wire)
-        wire["config"] = wire["config"].serialize()
-        payload = {
-            'id': str(uuid.uuid4()),
-            'method': name,
-            'params': {'wire': wire, 'args': args, 'kwargs': kwargs}
-        }
-        return _remote_call(self.url, payload, EXCEPTIONS_MAP, self._session)
+        payload = _pack_payload(name, args, kwargs, self._get_packed_wire())
+        return _remote_call_packed(
+            self.url, payload, EXCEPTIONS_MAP, self._session)
 
     def _call_with_logging(self, name, *args, **kwargs):
         log.debug('Calling %s@%s', self.url, name)
         return RemoteRepo._call(self, name, *args, **kwargs)
 
+    def batch(self):
+        """
+        Returns a `RemoteBatch` which collects calls to this repository.
+        """
+        return RemoteBatch(self)
+
+    def _call_batch(self, calls):
+        if not settings.REMOTE_BATCH_CALLS or len(calls) == 1:
+            _call_sequentially(self, calls)
+            return
+
+        log.debug('Calling %s@batch of %s calls', self.url, len(calls))
+        packed_wire = self._get_packed_wire()
+        payload = msgpack.Packer().pack_array_header(len(calls)) + ''.join(
+            _pack_payload(call.name, call.args, call.kwargs, packed_wire)
+            for call in calls)
+
+        try:
+            response = self._session.post(self.url, data=payload)
+            responses = msgpack.unpackb(response.content)
+        except Exception as e:
+            for call in calls:
+                call._set_error(e)
+            return
+
+        if isinstance(responses, dict):
+            # the whole batch failed, e.g. not supported by the server
+            log.warning('Batch request to %s failed, calling one by one: %s',
+                        self.url, responses.get('error'))
+            _call_sequentially(self, calls)
+            return
+
+        if len(responses) != len(calls):
+            error = exceptions.VCSError(
+                'Got %s responses for a batch of %s calls' % (
+                    len(responses), len(calls)))
+            for call in calls:
+                call._set_error(error)
+            return
+
+        for call, response in zip(calls, responses):
+            try:
+                call._set_result(_handle_response(response, EXCEPTIONS_MAP))
+            except Exception as e:
+                call._set_error(e)
+
     def __getitem__(self, key):
         return self.revision(key)
 
@@ -160,7 +266,7 @@ class RemoteObject(object):
     @exceptions.map_vcs_exceptions
     def _call(self, name, *args, **kwargs):
         payload = {
-            'id': str(uuid.uuid4()),
+            'id': _new_call_id(),
             'method': name,
             'params': {'args': args, 'kwargs': kwargs}
         }
@@ -171,9 +277,131 @@ class RemoteObject(object):
         return RemoteObject._call(self, name, *args, **kwargs)
 
 
+class BatchedCall(object):
+    """
+    Placeholder for the outcome of a call queued in a `RemoteBatch`.
+    """
+
+    _NOT_SET = object()
+
+    def __init__(self, name, args, kwargs):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self._result = self._NOT_SET
+        self._error = None
+
+    def __repr__(self):
+        return '<BatchedCall(%s)>' % (self.name, )
+
+    def _set_result(self, result):
+        self._result = result
+
+    def _set_error(self, error):
+        self._error = error
+
+    @exceptions.map_vcs_exceptions
+    def _get_result(self):
+        if self._error is not None:
+            raise self._error
+        if self._result is self._NOT_SET:
+            raise RuntimeError('%r has not been sent yet' % (self, ))
+        return self._result
+
+    result = property(
+        _get_result, doc='Result of the call, raises the remote error.')
+
+
+class RemoteBatch(object):
+    """
+    Collects calls to a remote repository and sends them at once.
+
+    Calls made on the batch return a `BatchedCall` whose `result` is
+    available once the batch has been flushed, which happens automatically
+    when the ``with`` block is left::
+
+        with repo._remote.batch() as batch:
+            message = batch.commit_attribute(commit_id, 'message')
+            parents = batch.commit_attribute(commit_id, 'parents')
+        print message.result, parents.result
+
+    Errors are reported per call when accessing `result`.
+    """
+
+    def __init__(self, remote):
+        self._remote = remote
+        self._calls = []
+
+    def __getattr__(self, name):
+        def f(*args, **kwargs):
+            call = BatchedCall(name, args, kwargs)
+            self._calls.append(call)
+            return call
+        return f
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def flush(self):
+        calls, self._calls = self._calls, []
+        if calls:
+            self._remote._call_batch(calls)
+
+
+def _call_sequentially(remote, calls):
+    """
+    Fallback to perform the batched `calls` one by one on `remote`.
+    """
+    for call in calls:
+        try:
+            call._set_result(
+                getattr(remote, call.name)(*call.args, **call.kwargs))
+        except Exception as e:
+            call._set_error(e)
+
+
+def _new_call_id():
+    """
+    Returns a unique id for a remote call, cheaper than a `uuid.uuid4`.
+    """
+    return '%s-%s' % (os.getpid(), next(_call_ids))
+
+
+def _pack_payload(name, args, kwargs, packed_wire):
+    """
+    Serializes the payload of a remote call into msgpack.
+
+    The result is the same as packing the dict ``{'id': ..., 'method': name,
+    'params': {'wire': wire, 'args': args, 'kwargs': kwargs}}``, but the
+    already serialized `packed_wire` is re-used.
+    """
+    return ''.join((
+        _PAYLOAD_MAP_HEADER,
+        _PACKED_KEYS['id'], msgpack.packb(_new_call_id()),
+        _PACKED_KEYS['method'], msgpack.packb(name),
+        _PACKED_KEYS['params'], _PAYLOAD_MAP_HEADER,
+        _PACKED_KEYS['wire'], packed_wire,
+        _PACKED_KEYS['args'], msgpack.packb(args),
+        _PACKED_KEYS['kwargs'], msgpack.packb(kwargs),
+    ))
+
+
 def _remote_call(url, payload, exceptions_map, session):
-    response = session.post(url, data=msgpack.packb(payload))
+    return _remote_call_packed(
+        url, msgpack.packb(payload), exceptions_map, session)
+
+
+def _remote_call_packed(url, data, exceptions_map, session):
+    response = session.post(url, data=data)
     response = msgpack.unpackb(response.content)
+    return _handle_response(response, exceptions_map)
+
+
+def _handle_response(response, exceptions_map):
     error = response.get('error')
     if error:
         type_ = error.get('type', 'Exception')
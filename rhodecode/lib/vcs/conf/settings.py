@@ -29,6 +29,31 @@ DEFAULT_ENCODINGS = ['utf8']
 # It can also be ['--branches', '--tags']
 GIT_REV_FILTER = ['--all']
 
+GIT_TREE_CACHE_SIZE = 4096
+"""
+Amount of parsed git trees which are kept in memory, they are shared by all
+commits and repositories of the process.
+"""
+
+LAST_COMMITS_WALK_LIMIT = 1000
+"""
+Maximum amount of commits which are walked to find the last commits of the
+files of a directory at once. The files which were not changed within them
+are looked up one by one.
+"""
+
+LAST_COMMITS_CACHE_SIZE = 512
+"""
+Amount of directory listings of which the last commits of the files are kept
+in memory, they are shared by all repositories of the process.
+"""
+
+GIT_COMMIT_INDEX_DIR = None
+"""
+Directory in which an index of the commit ids is stored per git repository.
+If set, the commit ids are not listed with a full ``git rev-list`` anymore.
+"""
+
 # Compatibility version when creating SVN repositories. None means newest.
 # Other available options are: pre-1.4-compatible, pre-1.5-compatible,
 # pre-1.6-compatible, pre-1.8-compatible
@@ -49,6 +74,28 @@ ARCHIVE_SPECS = {
     'zip': ('application/zip', '.zip'),
 }
 
+ARCHIVE_STREAM_BUFFER_SIZE = 1024 * 1024
+"""
+Amount of bytes buffered before a chunk of a streamed archive is handed out.
+"""
+
+ARCHIVE_STREAM_BATCH_SIZE = 64
+"""
+Amount of files which are fetched at once when streaming an archive.
+"""
+
+REMOTE_BATCH_CALLS = False
+"""
+Send the calls collected by ``RemoteRepo.batch()`` as one request to the
+VCSServer. Requires a VCSServer which accepts batch requests, otherwise the
+calls are sent one by one.
+"""
+
+REMOTE_BATCH_SIZE = 50
+"""
+Maximum amount of commits which are loaded with one batch request.
+"""
+
 PYRO_PORT = 9900
 
 PYRO_GIT = 'git_remote'
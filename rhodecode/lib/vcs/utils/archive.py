@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Incremental archive writer used to stream repository archives.
+
+The archive is produced entry by entry into an in-memory buffer which is
+drained as soon as it grows beyond a configured size, so the amount of memory
+used does not depend on the size of the repository.
+"""
+
+import stat
+import tarfile
+import time
+import zipfile
+from cStringIO import StringIO
+
+from rhodecode.lib.vcs.exceptions import ImproperArchiveTypeError
+
+
+# zip files can't store dates before 1980-01-01
+ZIP_EPOCH = 315532800
+
+TAR_MODES = {
+    'tgz': 'w|gz',
+    'tbz2': 'w|bz2',
+}
+
+
+class ChunkBuffer(object):
+    """
+    Write only file-like object which collects written data until drained.
+
+    Tracks the write position, which is all that `tarfile` in stream mode and
+    `zipfile` (when only `writestr` is used) require from the target file.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._size = 0
+        self._pos = 0
+
+    @property
+    def size(self):
+        """
+        Amount of bytes which are buffered and not yet drained.
+        """
+        return self._size
+
+    def write(self, data):
+        if data:
+            self._chunks.append(data)
+            self._size += len(data)
+            self._pos += len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self):
+        data = ''.join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        return data
+
+
+def _tar_entry(f_path, mode, is_link, content, mtime):
+    info = tarfile.TarInfo(f_path)
+    info.mtime = mtime
+    info.mode = mode & 0777
+    if is_link:
+        info.type = tarfile.SYMTYPE
+        info.mode = 0777
+        info.linkname = content
+        info.size = 0
+        return info, None
+    info.size = len(content)
+    return info, content
+
+
+def _zip_entry(f_path, mode, is_link, content, mtime):
+    date_time = time.gmtime(max(mtime, ZIP_EPOCH))[:6]
+    info = zipfile.ZipInfo(f_path, date_time)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    # unix attributes, same as hg archival does
+    info.create_system = 3
+    if is_link:
+        mode = stat.S_IFLNK | 0777
+    else:
+        mode = stat.S_IFREG | (mode & 0777)
+    info.external_attr = mode << 16L
+    return info, content
+
+
+def stream_archive(file_info, kind, mtime, buffer_size=64 * 1024):
+    """
+    Generator which writes an archive of `kind` and yields it as chunks.
+
+    :param file_info: iterable of ``(path, mode, is_link, content)`` tuples,
+        it is consumed lazily, one entry at a time.
+    :param kind: one of ``"tbz2"``, ``"tgz"``, ``"zip"``.
+    :param mtime: modification time stored for all entries.
+    :param buffer_size: size in bytes after which the buffered archive data
+        is handed out to the caller.
+    """
+    buf = ChunkBuffer()
+    mtime = int(mtime)
+
+    if kind in TAR_MODES:
+        archive = tarfile.open(
+            mode=TAR_MODES[kind], fileobj=buf, format=tarfile.GNU_FORMAT)
+
+        def add_entry(*args):
+            info, content = _tar_entry(*args)
+            archive.addfile(info, StringIO(content) if content else None)
+    elif kind == 'zip':
+        archive = zipfile.ZipFile(
+            buf, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+
+        def add_entry(*args):
+            info, content = _zip_entry(*args)
+            archive.writestr(info, content)
+    else:
+        raise ImproperArchiveTypeError(
+            'Archive kind (%s) not supported' % (kind, ))
+
+    for f_path, mode, is_link, content in file_info:
+        add_entry(f_path, mode, is_link, content, mtime)
+        if buf.size >= buffer_size:
+            yield buf.drain()
+
+    archive.close()
+    data = buf.drain()
+    if data:
+        yield data
+
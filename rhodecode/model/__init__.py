@@ -64,6 +64,9 @@ def init_model(engine, encryption_key=None):
     meta.Base.metadata.bind = engine
     db.ENCRYPTION_KEY = encryption_key
 
+    from rhodecode.lib.permission_cache import register_invalidation_events
+    register_invalidation_events(meta.Session)
+
 
 def init_model_encryption(migration_models):
     migration_models.ENCRYPTION_KEY = get_encryption_key(config)
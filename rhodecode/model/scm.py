@@ -99,11 +99,12 @@ class SimpleCachedRepoList(object):
         return '<%s (%s)>' % (self.__class__.__name__, self.__len__())
 
     def __iter__(self):
+        # check permissions of all repositories at once
+        allowed = set(HasRepoPermissionAny(*self.perm_set).filter_allowed(
+            [dbr.repo_name for dbr in self.db_repo_list],
+            'SimpleCachedRepoList check'))
         for dbr in self.db_repo_list:
-            # check permission at this level
-            has_perm = HasRepoPermissionAny(*self.perm_set)(
-                dbr.repo_name, 'SimpleCachedRepoList check')
-            if not has_perm:
+            if dbr.repo_name not in allowed:
                 continue
 
             tmp_d = {
@@ -142,10 +143,13 @@ class _PermCheckIterator(object):
 
     def __iter__(self):
         checker = self.perm_checker(*self.perm_set)
-        for db_obj in self.obj_list:
-            # check permission at this level
-            name = getattr(db_obj, self.obj_attr, None)
-            if not checker(name, self.__class__.__name__, **self.extra_kwargs):
+        names = [getattr(db_obj, self.obj_attr, None)
+                 for db_obj in self.obj_list]
+        # check permissions of all objects at once
+        allowed = set(checker.filter_allowed(
+            names, self.__class__.__name__, **self.extra_kwargs))
+        for db_obj, name in zip(self.obj_list, names):
+            if name not in allowed:
                 continue
 
             yield db_obj
@@ -451,16 +455,26 @@ class ScmModel(BaseModel):
             f_path = os.path.normpath(f_path)
         return f_path
 
+    def preload_last_commits(self, commit, dir_node):
+        """
+        Sets the `last_commit` of the file nodes of `dir_node` and returns
+        them. The last commits are looked up with one walk of the history
+        instead of one per file.
+        """
+        file_nodes = [node for node in dir_node if node.is_file()]
+        last_commits = commit.get_last_commits(
+            [node.path for node in file_nodes],
+            pre_load=["author", "date", "message"])
+        for node in file_nodes:
+            node.__dict__['last_commit'] = last_commits[safe_str(node.path)]
+        return file_nodes
+
     def get_dirnode_metadata(self, commit, dir_node):
         if not dir_node.is_dir():
             return []
 
         data = []
-        for node in dir_node:
-            if not node.is_file():
-                # we skip file-nodes
-                continue
-
+        for node in self.preload_last_commits(commit, dir_node):
             last_commit = node.last_commit
             last_commit_date = last_commit.date
             data.append({
@@ -887,6 +901,11 @@ class ScmModel(BaseModel):
         import pkg_resources
         from rhodecode.model.meta import Base as sql_base, Session
         from sqlalchemy.engine import url
+        from rhodecode.lib.archive_cache import get_archive_cache
+        from rhodecode.lib.diff_cache import get_diff_cache
+        from rhodecode.lib.file_tree_cache import get_file_tree_cache
+        from rhodecode.lib.permission_cache import get_permission_cache
+        from rhodecode.lib.size_tracker import get_size_tracker
         from rhodecode.lib.base import get_server_ip_addr, get_server_port
         from rhodecode.lib.vcs.backends.git import discover_git_version
         from rhodecode.model.gist import GIST_STORE_LOC
@@ -937,19 +956,7 @@ class ScmModel(BaseModel):
         mods = dict([(p.project_name, p.version)
                      for p in pkg_resources.working_set])
 
-        def get_storage_size(storage_path):
-            sizes = []
-            for file_ in os.listdir(storage_path):
-                storage_file = os.path.join(storage_path, file_)
-                if os.path.isfile(storage_file):
-                    try:
-                        sizes.append(os.path.getsize(storage_file))
-                    except OSError:
-                        log.exception('Failed to get size of storage file %s',
-                                      storage_file)
-                        pass
-
-            return sum(sizes)
+        size_tracker = get_size_tracker()
 
         # archive cache storage
         _disk_archive = {'percent': 0, 'used': 0, 'total': 0}
@@ -957,7 +964,7 @@ class ScmModel(BaseModel):
             archive_storage_path_exists = os.path.isdir(
                 archive_storage_path)
             if archive_storage_path and archive_storage_path_exists:
-                used = get_storage_size(archive_storage_path)
+                used = size_tracker.get_size(archive_storage_path)
                 _disk_archive.update({
                     'used': used,
                     'total': used,
@@ -966,13 +973,27 @@ class ScmModel(BaseModel):
             log.exception('failed to fetch archive cache storage')
             _disk_archive['error'] = str(e)
 
+        archive_cache = get_archive_cache(rhodecode.CONFIG)
+        _archive_cache_stats = archive_cache.get_stats() if archive_cache else {}
+
+        diff_cache = get_diff_cache(rhodecode.CONFIG)
+        _diff_cache_stats = diff_cache.get_stats() if diff_cache else {}
+
+        permission_cache = get_permission_cache()
+        _permission_cache_stats = (
+            permission_cache.get_stats() if permission_cache else {})
+
+        file_tree_cache = get_file_tree_cache(rhodecode.CONFIG)
+        _file_tree_cache_stats = (
+            file_tree_cache.get_stats() if file_tree_cache else {})
+
         # search index storage
         _disk_index = {'percent': 0, 'used': 0, 'total': 0}
         try:
             search_index_storage_path_exists = os.path.isdir(
                 search_index_storage_path)
             if search_index_storage_path_exists:
-                used = get_storage_size(search_index_storage_path)
+                used = size_tracker.get_size(search_index_storage_path)
                 _disk_index.update({
                     'percent': 100,
                     'used': used,
@@ -987,15 +1008,12 @@ class ScmModel(BaseModel):
         try:
             items_count = 0
             used = 0
-            for root, dirs, files in os.walk(safe_str(gist_storage_path)):
-                if root == gist_storage_path:
-                    items_count = len(dirs)
-
-                for f in files:
-                    try:
-                        used += os.path.getsize(os.path.join(root, f))
-                    except OSError:
-                        pass
+            gist_path = safe_str(gist_storage_path)
+            if os.path.isdir(gist_path):
+                items_count = len([
+                    name for name in os.listdir(gist_path)
+                    if os.path.isdir(os.path.join(gist_path, name))])
+                used = size_tracker.get_size(gist_path)
             _disk_gist.update({
                 'percent': 100,
                 'used': used,
@@ -1069,6 +1087,11 @@ class ScmModel(BaseModel):
             'memory': _memory,
             'disk': _disk,
             'disk_archive': _disk_archive,
+            'archive_cache_stats': _archive_cache_stats,
+            'diff_cache_stats': _diff_cache_stats,
+            'permission_cache_stats': _permission_cache_stats,
+            'file_tree_cache_stats': _file_tree_cache_stats,
+            'size_tracker_stats': size_tracker.get_stats(),
             'disk_gist': _disk_gist,
             'disk_index': _disk_index,
         }
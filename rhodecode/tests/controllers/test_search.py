@@ -55,6 +55,144 @@ def test_search_finds_results(
     assert results[0]['repository'] == repo.repo_name
 
 
+def test_searcher_pool_reuses_searchers(tmpdir):
+    search_location = tmpdir.strpath
+    create_commit_index_with_one_document(search_location, repo_name='repo')
+    pool = whoosh.SearcherPool(
+        search_location, whoosh.COMMIT_INDEX_NAME, whoosh.COMMIT_SCHEMA)
+
+    searcher = pool.acquire()
+    pool.release(searcher)
+
+    assert pool.acquire() is searcher
+    assert searcher.doc_count() == 1
+
+
+def test_searcher_pool_refreshes_changed_index(tmpdir):
+    search_location = tmpdir.strpath
+    create_commit_index_with_one_document(search_location, repo_name='repo')
+    pool = whoosh.SearcherPool(
+        search_location, whoosh.COMMIT_INDEX_NAME, whoosh.COMMIT_SCHEMA)
+    pool.release(pool.acquire())
+
+    writer = pool.index.writer()
+    writer.add_document(commit_id="second_commit_id", repository='repo')
+    writer.commit()
+
+    assert pool.acquire().doc_count() == 2
+
+
+def test_searcher_pool_limits_idle_searchers(tmpdir):
+    search_location = tmpdir.strpath
+    create_commit_index_with_one_document(search_location, repo_name='repo')
+    pool = whoosh.SearcherPool(
+        search_location, whoosh.COMMIT_INDEX_NAME, whoosh.COMMIT_SCHEMA,
+        size=1)
+    first, second = pool.acquire(), pool.acquire()
+
+    pool.release(first)
+    pool.release(second)
+
+    assert not first.is_closed
+    assert second.is_closed
+
+
+def test_searchers_share_the_pool(tmpdir):
+    create_commit_index_with_one_document(tmpdir.strpath, repo_name='repo')
+    config = {'location': tmpdir.strpath}
+    first, second = whoosh.Search(config), whoosh.Search(config)
+    first._init_searcher(whoosh.COMMIT_INDEX_NAME)
+    searcher = first.searcher
+    first.cleanup()
+
+    assert second._init_searcher(whoosh.COMMIT_INDEX_NAME) is searcher
+    assert first.commit_index is second.commit_index
+
+
+def test_search_scores_only_the_requested_pages(tmpdir):
+    search_location = tmpdir.strpath
+    test_index = index.create_in(
+        search_location, whoosh.COMMIT_SCHEMA,
+        indexname=whoosh.COMMIT_INDEX_NAME)
+    writer = test_index.writer()
+    for idx in xrange(30):
+        writer.add_document(
+            commit_id="commit_%s" % idx, commit_idx=idx, date=idx,
+            repository="repo_%s" % (idx % 2), message="Test Message")
+    writer.commit()
+    auth_user = mock.Mock(permissions={
+        'global': [], 'repositories': {'repo_0': 'repository.read'}})
+    searcher = whoosh.Search({'location': search_location})
+
+    search_result = searcher.search(
+        "Test", document_type='commit', search_user=auth_user,
+        requested_page=2, page_limit=5, sort='newfirst')
+    results = search_result['results']
+
+    assert search_result['count'] == 15
+    assert results.results.scored_length() == 10
+    assert [r['commit_id'] for r in results[5:10]] == [
+        "commit_%s" % idx for idx in (18, 16, 14, 12, 10)]
+    searcher.cleanup()
+
+
+def test_repo_filter_is_cached(tmpdir):
+    search_location = tmpdir.strpath
+    create_commit_index_with_one_document(search_location, repo_name='repo')
+    auth_user = mock.Mock(permissions={
+        'global': [], 'repositories': {'repo': 'repository.read'}})
+    searcher = whoosh.Search({'location': search_location})
+    searcher._init_searcher(whoosh.COMMIT_INDEX_NAME)
+
+    repo_filter = searcher._get_repo_filter(auth_user, None)
+
+    assert list(repo_filter) == [0]
+    assert searcher._get_repo_filter(auth_user, None) is repo_filter
+    auth_user.permissions['repositories']['other'] = 'repository.read'
+    assert searcher._get_repo_filter(auth_user, None) is not repo_filter
+    searcher.cleanup()
+
+
+def test_repo_filter_of_recreated_index(tmpdir):
+    search_location = tmpdir.strpath
+    create_commit_index_with_one_document(search_location, repo_name='repo')
+    pool = whoosh.SearcherPool(
+        search_location, whoosh.COMMIT_INDEX_NAME, whoosh.COMMIT_SCHEMA)
+    searcher = pool.acquire()
+    assert list(pool.get_repo_filter(searcher, ['repo'])) == [0]
+
+    # the generation of the new index is the same as the one of the old
+    test_index = index.create_in(
+        search_location, whoosh.COMMIT_SCHEMA,
+        indexname=whoosh.COMMIT_INDEX_NAME)
+    writer = test_index.writer()
+    writer.add_document(commit_id="other_commit_id", repository='other')
+    writer.add_document(commit_id="repo_commit_id", repository='repo')
+    writer.commit()
+    new_searcher = test_index.searcher()
+
+    assert (new_searcher.reader().generation() ==
+            searcher.reader().generation())
+    assert list(pool.get_repo_filter(new_searcher, ['repo'])) == [1]
+    new_searcher.close()
+    searcher.close()
+
+
+def test_search_without_allowed_documents(tmpdir):
+    search_location = tmpdir.strpath
+    create_commit_index_with_one_document(search_location, repo_name='repo')
+    auth_user = mock.Mock(permissions={
+        'global': [], 'repositories': {'other': 'repository.read'}})
+    searcher = whoosh.Search({'location': search_location})
+
+    search_result = searcher.search(
+        "Test", document_type='commit', search_user=auth_user)
+
+    assert search_result['count'] == 0
+    assert list(search_result['results']) == []
+    searcher.cleanup()
+
+
 def create_commit_index_with_one_document(search_location, repo_name):
     """
     Provides a test index based on our search schema.
@@ -23,6 +23,7 @@ import os
 import mock
 import pytest
 
+import rhodecode
 from rhodecode.controllers.files import FilesController
 from rhodecode.lib import helpers as h
 from rhodecode.lib.compat import OrderedDict
@@ -420,6 +421,24 @@ class TestRepositoryArchival:
                 del response.response.headers['Set-Cookie']
             assert response.response.headers == headers
 
+    @pytest.mark.parametrize('arch_ext', ['.tar.gz', '.tar.bz2', '.zip'])
+    def test_archival_streaming(self, backend, arch_ext):
+        backend.enable_downloads()
+        commit = backend.repo.get_commit(commit_idx=173)
+        fname = commit.raw_id + arch_ext
+        filename = '%s-%s%s' % (backend.repo_name, commit.short_id, arch_ext)
+
+        with mock.patch.dict(rhodecode.CONFIG, {'archive_streaming': 'true'}):
+            response = self.app.get(url(controller='files',
+                                        action='archivefile',
+                                        repo_name=backend.repo_name,
+                                        fname=fname))
+
+        assert response.status == '200 OK'
+        assert response.headers['Content-Disposition'] == (
+            'attachment; filename=%s' % filename)
+        assert response.body
+
     def test_archival_wrong_ext(self, backend):
         backend.enable_downloads()
         commit = backend.repo.get_commit(commit_idx=173)
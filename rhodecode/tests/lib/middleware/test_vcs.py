@@ -18,6 +18,13 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import gzip
+import hashlib
+import shutil
+import tempfile
+from StringIO import StringIO
+
+import pytest
 from mock import patch, Mock
 
 import rhodecode
@@ -132,3 +139,130 @@ class TestVCSMiddleware(object):
 
         assert svn_mock.call_count == 0
         assert app is None
+
+
+def _gzip(data):
+    compressed = StringIO()
+    gzip_file = gzip.GzipFile(fileobj=compressed, mode='wb')
+    gzip_file.write(data)
+    gzip_file.close()
+    return compressed.getvalue()
+
+
+class StreamingInput(object):
+    """
+    Non seekable `wsgi.input`, like the one of a WSGI server.
+    """
+
+    def __init__(self, data):
+        self._data = StringIO(data)
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+
+@pytest.fixture
+def payload():
+    # compresses roughly like a pack of text files
+    return ''.join(
+        '%s %d\n' % (hashlib.sha1(str(idx)).hexdigest(), idx % 97)
+        for idx in xrange(20000))
+
+
+class TestGunzipStream(object):
+
+    @pytest.mark.parametrize('size', [1, 1000, 64 * 1024, -1])
+    def test_read(self, payload, size):
+        stream = vcs.GunzipStream(StreamingInput(_gzip(payload)))
+        chunks = iter(lambda: stream.read(size), '')
+
+        assert ''.join(chunks) == payload
+
+    def test_read_bounds_decompressed_blocks(self):
+        stream = vcs.GunzipStream(StreamingInput(_gzip('x' * 10000000)))
+        stream.read(1)
+
+        assert len(stream._buffer) < 2 * vcs.GunzipStream.CHUNK_SIZE
+
+    def test_read_multiple_members(self):
+        stream = vcs.GunzipStream(
+            StreamingInput(_gzip('first\n') + _gzip('second\n')))
+
+        assert stream.read() == 'first\nsecond\n'
+
+    def test_read_multiple_members_larger_than_chunk_size(self):
+        chunk_size = vcs.GunzipStream.CHUNK_SIZE
+        first = 'x' * (chunk_size + 4464)
+        compressed = _gzip(first) + _gzip('second') + _gzip('third')
+        stream = vcs.GunzipStream(
+            StreamingInput(compressed), length=len(compressed))
+
+        assert stream.read(chunk_size) == first[:chunk_size]
+        assert stream.read() == first[chunk_size:] + 'secondthird'
+
+    def test_read_stops_at_length(self):
+        compressed = _gzip('content')
+        stream = vcs.GunzipStream(
+            StreamingInput(compressed + 'trailing'), length=len(compressed))
+
+        assert stream.read() == 'content'
+
+    @pytest.mark.parametrize('missing', [1, 4, 8, 1000])
+    def test_read_truncated_input(self, payload, missing):
+        compressed = _gzip(payload)
+        stream = vcs.GunzipStream(StreamingInput(compressed[:-missing]))
+
+        with pytest.raises(IOError):
+            stream.read()
+
+    def test_read_skips_zero_padding(self):
+        compressed = _gzip('first\n') + _gzip('second\n') + '\0' * 1000
+        stream = vcs.GunzipStream(StreamingInput(compressed))
+
+        assert stream.read() == 'first\nsecond\n'
+
+    def test_read_empty_input(self):
+        assert vcs.GunzipStream(StreamingInput('')).read() == ''
+
+    def test_readline(self):
+        stream = vcs.GunzipStream(StreamingInput(_gzip('first\nsecond')))
+
+        assert stream.readline() == 'first\n'
+        assert stream.readline(3) == 'sec'
+        assert stream.readline() == 'ond'
+        assert stream.readline() == ''
+
+
+def test_gunzip_middleware(payload):
+    compressed = _gzip(payload)
+    environ = {
+        'HTTP_CONTENT_ENCODING': 'gzip',
+        'CONTENT_LENGTH': str(len(compressed)),
+        'wsgi.input': StreamingInput(compressed),
+    }
+    app = Mock(side_effect=lambda environ, start_response: [
+        environ['wsgi.input'].read()])
+
+    result = vcs.GunzipMiddleware(app)(environ, Mock())
+
+    assert result == [payload]
+    assert 'HTTP_CONTENT_ENCODING' not in environ
+    assert 'CONTENT_LENGTH' not in environ
+
+
+def _spooled_gzip_file(wsgi_input):
+    # the former implementation of the GunzipMiddleware
+    spooled = tempfile.SpooledTemporaryFile(64 * 1024 * 1024)
+    shutil.copyfileobj(wsgi_input, spooled)
+    spooled.seek(0)
+    return gzip.GzipFile(fileobj=spooled, mode='r')
+
+
+@pytest.mark.parametrize('gunzip', [vcs.GunzipStream, _spooled_gzip_file])
+def test_gunzip_large_upload(repeat, payload, gunzip):
+    data = payload * max(repeat / 10, 1)
+    stream = gunzip(StreamingInput(_gzip(data)))
+
+    size = sum(len(chunk) for chunk in iter(lambda: stream.read(65536), ''))
+
+    assert size == len(data)
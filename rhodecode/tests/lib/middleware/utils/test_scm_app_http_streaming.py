@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+"""
+Checking that the VcsHttpProxy streams request and response bodies
+"""
+
+import resource
+import threading
+import wsgiref.simple_server
+
+import pytest
+
+from rhodecode.lib.middleware.utils import scm_app_http
+
+
+BLOCK = 'x' * scm_app_http.CHUNK_SIZE
+
+
+class SyntheticInput(object):
+    """
+    File-like `wsgi.input` which generates `size` bytes without holding them
+    in memory.
+    """
+
+    def __init__(self, size):
+        self._remaining = size
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self._remaining
+        size = min(size, self._remaining, len(BLOCK))
+        self._remaining -= size
+        return BLOCK[:size]
+
+
+class StubVcsServer(object):
+    """
+    WSGI application standing in for the VCSServer. It consumes the request
+    body and responds with as many bytes as the `size` query parameter asks.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, environ, start_response):
+        received = 0
+        for chunk in _read_body(environ):
+            received += len(chunk)
+        self.requests.append({
+            'content_length': environ.get('CONTENT_LENGTH') or None,
+            'transfer_encoding': environ.get('HTTP_TRANSFER_ENCODING'),
+            'received': received,
+        })
+
+        size = 0
+        if environ.get('QUERY_STRING', '').startswith('size='):
+            size = int(environ['QUERY_STRING'][len('size='):])
+        start_response('200 OK', [('Content-Length', str(size))])
+        return _generate(size)
+
+
+def _read_body(environ):
+    wsgi_input = environ['wsgi.input']
+    if environ.get('HTTP_TRANSFER_ENCODING') == 'chunked':
+        # wsgiref does not decode chunked requests
+        while True:
+            size = int(wsgi_input.readline().split(';')[0], 16)
+            if not size:
+                wsgi_input.readline()
+                break
+            yield wsgi_input.read(size)
+            wsgi_input.readline()
+    elif environ.get('CONTENT_LENGTH'):
+        remaining = int(environ['CONTENT_LENGTH'])
+        while remaining:
+            chunk = wsgi_input.read(min(remaining, len(BLOCK)))
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _generate(size):
+    while size:
+        chunk = BLOCK[:min(size, len(BLOCK))]
+        size -= len(chunk)
+        yield chunk
+
+
+class QuietHandler(wsgiref.simple_server.WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def vcsserver_stub(request, available_port_factory):
+    """
+    Runs a `StubVcsServer` in a thread.
+    """
+    app = StubVcsServer()
+    server = wsgiref.simple_server.make_server(
+        '127.0.0.1', available_port_factory(), app,
+        handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    @request.addfinalizer
+    def stop_server():
+        server.shutdown()
+        server.server_close()
+
+    app.url = 'http://127.0.0.1:%s/' % (server.server_port, )
+    return app
+
+
+def _call_proxy(vcsserver_stub, size=0, method='POST', content_length=True,
+                query_string=''):
+    proxy = scm_app_http.VcsHttpProxy(
+        vcsserver_stub.url, 'stub_path', 'stub_name', {})
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': '/git-receive-pack',
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': SyntheticInput(size),
+    }
+    if content_length:
+        environ['CONTENT_LENGTH'] = str(size)
+    status = []
+
+    def start_response(status_, headers):
+        status.append(status_)
+
+    chunks = proxy(environ, start_response)
+    return status[0], chunks
+
+
+def test_request_body_is_streamed_with_content_length(vcsserver_stub):
+    status, chunks = _call_proxy(vcsserver_stub, size=1000000)
+    list(chunks)
+
+    assert status == '200'
+    assert vcsserver_stub.requests == [{
+        'content_length': '1000000',
+        'transfer_encoding': None,
+        'received': 1000000,
+    }]
+
+
+def test_request_body_without_content_length_is_chunked(vcsserver_stub):
+    status, chunks = _call_proxy(
+        vcsserver_stub, size=1000000, content_length=False)
+    list(chunks)
+
+    assert vcsserver_stub.requests == [{
+        'content_length': None,
+        'transfer_encoding': 'chunked',
+        'received': 1000000,
+    }]
+
+
+def test_empty_request_body(vcsserver_stub):
+    status, chunks = _call_proxy(
+        vcsserver_stub, method='GET', content_length=False)
+    list(chunks)
+
+    assert vcsserver_stub.requests == [{
+        'content_length': None,
+        'transfer_encoding': None,
+        'received': 0,
+    }]
+
+
+def test_response_is_streamed_in_blocks(vcsserver_stub):
+    size = scm_app_http.CHUNK_SIZE * 3 + 1
+    status, chunks = _call_proxy(
+        vcsserver_stub, method='GET', query_string='size=%s' % size)
+    chunk_sizes = map(len, chunks)
+
+    assert sum(chunk_sizes) == size
+    assert max(chunk_sizes) <= scm_app_http.CHUNK_SIZE
+
+
+def _max_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@pytest.mark.parametrize('direction', ['push', 'clone'])
+def test_large_pack_memory(repeat, vcsserver_stub, direction):
+    """
+    Sends a large synthetic pack through the proxy and checks that the memory
+    of the process does not grow with the size of the pack.
+    """
+    size = repeat * 4 * 1024 * 1024
+    max_rss = _max_rss()
+    if direction == 'push':
+        __, chunks = _call_proxy(vcsserver_stub, size=size)
+    else:
+        __, chunks = _call_proxy(
+            vcsserver_stub, method='GET', query_string='size=%s' % size)
+    transferred = sum(len(chunk) for chunk in chunks)
+
+    if direction == 'push':
+        assert vcsserver_stub.requests[0]['received'] == size
+    else:
+        assert transferred == size
+    assert _max_rss() - max_rss < size / 2
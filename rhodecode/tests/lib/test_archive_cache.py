@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import os
+import threading
+import time
+
+import pytest
+
+from rhodecode.lib.archive_cache import ArchiveCache, get_archive_cache
+
+
+@pytest.fixture
+def archive_cache(tmpdir):
+    return ArchiveCache(str(tmpdir.join('archives')), max_size=250)
+
+
+def _create_func(content, calls=None, delay=0):
+    def create(path):
+        if calls is not None:
+            calls.append(path)
+        time.sleep(delay)
+        with open(path, 'wb') as f:
+            f.write(content)
+    return create
+
+
+def test_get_or_create_builds_once(archive_cache):
+    calls = []
+    for x in xrange(3):
+        with archive_cache.get_or_create(
+                'repo-1.zip', _create_func('data', calls)) as f:
+            assert f.read() == 'data'
+
+    assert len(calls) == 1
+    stats = archive_cache.get_stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 2
+    assert stats['builds'] == 1
+
+
+def test_get_or_create_concurrent_requests_build_once(archive_cache):
+    calls = []
+    results = []
+    create = _create_func('data', calls, delay=0.2)
+
+    def request():
+        with archive_cache.get_or_create('repo-1.zip', create) as f:
+            results.append(f.read())
+
+    threads = [threading.Thread(target=request) for x in xrange(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['data'] * 5
+
+
+def test_get_or_create_failed_build_leaves_no_files(archive_cache):
+    def create(path):
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        archive_cache.get_or_create('repo-1.zip', create)
+
+    assert archive_cache._archives() == []
+    assert not [name for name in os.listdir(archive_cache.cache_dir)
+                if name.startswith('.tmp-')]
+
+
+def test_evict_removes_least_recently_used(archive_cache):
+    for name in ['a.zip', 'b.zip']:
+        archive_cache.get_or_create(name, _create_func('x' * 100)).close()
+        os.utime(archive_cache.get_path(name), (0, time.time() - 10))
+    # a hit marks the archive as recently used
+    archive_cache.get_or_create('a.zip', _create_func('x' * 100)).close()
+
+    archive_cache.get_or_create('c.zip', _create_func('x' * 100)).close()
+
+    stored = sorted(
+        os.path.basename(path) for _m, _s, path in archive_cache._archives())
+    assert stored == ['a.zip', 'c.zip']
+    assert archive_cache.get_stats()['evictions'] == 1
+
+
+def test_evict_keeps_new_archive_bigger_than_max_size(archive_cache):
+    archive_cache.get_or_create('a.zip', _create_func('x' * 500)).close()
+
+    assert os.path.isfile(archive_cache.get_path('a.zip'))
+
+
+def test_get_archive_cache_disabled_without_cache_dir():
+    assert get_archive_cache({}) is None
+
+
+def test_get_archive_cache_is_shared(tmpdir):
+    config = {'archive_cache_dir': str(tmpdir), 'archive_cache_max_size': '10'}
+    archive_cache = get_archive_cache(config)
+
+    assert archive_cache is get_archive_cache(config)
+    assert archive_cache.max_size == 10
+
+
+def test_get_or_stream_passes_chunks_on_while_storing(archive_cache):
+    archive_path = archive_cache.get_path('repo-1.zip')
+    stored = []
+
+    def stream_func():
+        yield 'ab'
+        stored.append(os.path.exists(archive_path))
+        yield 'cd'
+
+    chunks = list(archive_cache.get_or_stream('repo-1.zip', stream_func))
+
+    assert chunks == ['ab', 'cd']
+    assert stored == [False]
+    with open(archive_path, 'rb') as f:
+        assert f.read() == 'abcd'
+    stats = archive_cache.get_stats()
+    assert stats['misses'] == 1
+    assert stats['builds'] == 1
+
+
+def test_get_or_stream_reads_cached_archive(archive_cache):
+    list(archive_cache.get_or_stream('repo-1.zip', lambda: iter(['abcd'])))
+
+    def stream_func():
+        raise AssertionError('archive should be cached')
+
+    chunks = archive_cache.get_or_stream(
+        'repo-1.zip', stream_func, chunk_size=3)
+
+    assert list(chunks) == ['abc', 'd']
+    assert archive_cache.get_stats()['hits'] == 1
+
+
+def test_get_or_stream_aborted_stream_is_not_stored(archive_cache):
+    chunks = archive_cache.get_or_stream(
+        'repo-1.zip', lambda: iter(['ab', 'cd']))
+    assert next(chunks) == 'ab'
+    chunks.close()
+
+    assert archive_cache._archives() == []
+    assert not [name for name in os.listdir(archive_cache.cache_dir)
+                if name.startswith('.tmp-')]
+    assert archive_cache.get_stats()['builds'] == 0
+
+
+def test_get_or_stream_releases_lock_if_not_iterated(archive_cache):
+    archive_cache.get_or_stream(
+        'repo-1.zip', lambda: iter(['ab'])).close()
+
+    chunks = archive_cache.get_or_stream('repo-1.zip', lambda: iter(['cd']))
+
+    assert list(chunks) == ['cd']
+
+
+def test_get_or_stream_concurrent_requests_build_once(archive_cache):
+    streamed = []
+    results = []
+    started = threading.Event()
+
+    def stream_func():
+        streamed.append(1)
+        yield 'ab'
+        started.set()
+        time.sleep(0.2)
+        yield 'cd'
+
+    def request():
+        chunks = archive_cache.get_or_stream('repo-1.zip', stream_func)
+        results.append(''.join(chunks))
+
+    first = threading.Thread(target=request)
+    first.start()
+    started.wait()
+    threads = [threading.Thread(target=request) for x in xrange(4)]
+    for thread in threads:
+        thread.start()
+    for thread in [first] + threads:
+        thread.join()
+
+    assert len(streamed) == 1
+    assert results == ['abcd'] * 5
+    stats = archive_cache.get_stats()
+    assert (stats['misses'], stats['hits']) == (1, 4)
+
+
+def test_evict_removes_lock_files(archive_cache):
+    archive_cache.get_or_create('a.zip', _create_func('x' * 200)).close()
+    lock_path = archive_cache._get_lock('a.zip').filename
+    assert os.path.isfile(lock_path)
+
+    archive_cache.get_or_create('b.zip', _create_func('x' * 200)).close()
+
+    assert not os.path.exists(lock_path)
@@ -19,8 +19,10 @@
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
 import os
+import pickle
 from hashlib import sha1
 
+import mock
 import pytest
 from mock import patch
 
@@ -62,6 +64,18 @@ def test_perm_origin_dict():
         pod['thing'] = 'read'
 
 
+def test_perm_origin_dict_pickle():
+    pod = auth.PermOriginDict()
+    pod['thing'] = 'read', 'default'
+    pod['thing'] = 'write', 'admin'
+
+    restored = pickle.loads(pickle.dumps(pod, pickle.HIGHEST_PROTOCOL))
+
+    assert isinstance(restored, auth.PermOriginDict)
+    assert restored == {'thing': 'write'}
+    assert restored.perm_origin_stack == pod.perm_origin_stack
+
+
 def test_cached_perms_data(user_regular, backend_random):
     permissions = get_permissions(user_regular)
     repo_name = backend_random.repo.repo_name
@@ -580,3 +594,69 @@ class TestGenerateAuthToken(object):
             result = auth.generate_auth_token(user_name)
         expected_result = sha1(user_name + random_salt).hexdigest()
         assert result == expected_result
+
+
+def _user_with_permissions(permissions):
+    user = mock.Mock(spec=auth.AuthUser)
+    user.permissions = permissions
+    return user
+
+
+def test_filter_allowed_any_permission():
+    user = _user_with_permissions({'repositories': {
+        'a': 'repository.read', 'b': 'repository.none',
+        'c': 'repository.admin'}})
+    checker = auth.HasRepoPermissionAny('repository.read', 'repository.admin')
+
+    allowed = checker.filter_allowed(['c', 'b', 'a', 'missing'], user=user)
+
+    assert allowed == ['c', 'a']
+
+
+def test_filter_allowed_all_permissions():
+    user = _user_with_permissions({'repositories_groups': {
+        'a': 'group.read', 'b': 'group.admin'}})
+    checker = auth.HasRepoGroupPermissionAll('group.admin')
+
+    assert checker.filter_allowed(['a', 'b', 'missing'], user=user) == ['b']
+
+
+def test_filter_allowed_matches_single_checks():
+    user = _user_with_permissions({'user_groups': {
+        'a': 'usergroup.read', 'b': 'usergroup.write',
+        'c': 'usergroup.none'}})
+    perms = ['usergroup.write', 'usergroup.admin']
+    names = ['a', 'b', 'c', 'd']
+
+    expected = [name for name in names
+                if auth.HasUserGroupPermissionAny(*perms)(name, user=user)]
+
+    assert auth.HasUserGroupPermissionAny(*perms).filter_allowed(
+        names, user=user) == expected
+
+
+def test_filter_allowed_not_supported_for_global_permissions():
+    with pytest.raises(Exception):
+        auth.HasPermissionAny('hg.admin').filter_allowed(
+            ['a'], user=_user_with_permissions({}))
+
+
+@pytest.mark.parametrize('perm_cache', [None, mock.Mock()])
+def test_get_perms(perm_cache):
+    user = mock.Mock(user_id=1, is_admin=False,
+                     inherit_default_permissions=True)
+    permissions = {'global': set(['hg.create.repository'])}
+    if perm_cache is not None:
+        perm_cache.get_permissions.side_effect = (
+            lambda user_id, params, compute: compute())
+    auth_user = auth.AuthUser.__new__(auth.AuthUser)
+
+    with mock.patch.object(auth, 'get_permission_cache',
+                           return_value=perm_cache), \
+            mock.patch.object(auth, '_cached_perms_data',
+                              return_value=permissions) as compute:
+        assert auth_user.get_perms(user=user) == permissions
+
+    compute.assert_called_once_with(1, None, False, True, True, 'higherwin')
+    if perm_cache is not None:
+        assert perm_cache.get_permissions.call_count == 1
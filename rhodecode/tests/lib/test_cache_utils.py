@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+from rhodecode.lib.cache_utils import CacheStats, ProcessWideInstances
+
+
+def test_cache_stats():
+    stats = CacheStats('build_time')
+    stats.count('hits')
+    stats.count('misses', 3)
+    stats.count('build_time', 0.5)
+
+    assert stats.get_stats() == {
+        'hits': 1, 'misses': 3, 'build_time': 0.5, 'hit_rate': 0.25}
+
+
+def test_cache_stats_without_requests():
+    assert CacheStats().get_stats()['hit_rate'] == 0
+
+
+def test_process_wide_instances_are_recreated_with_new_args():
+    instances = ProcessWideInstances(lambda *args: object())
+    first = instances.get('a', 10)
+
+    assert instances.get('a', 10) is first
+    assert instances.get('b', 10) is not first
+    assert instances.get('a', 20) is not first
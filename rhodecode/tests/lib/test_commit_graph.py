@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import mock
+import pytest
+
+from rhodecode.lib import commit_graph
+
+
+# pylint: disable=protected-access
+
+
+class StubRepo(object):
+    alias = 'git'
+
+    def __init__(self, parents, path='/repos/stub'):
+        self.path = path
+        self.parents = parents
+        self.lookups = []
+
+    @property
+    def commit_ids(self):
+        return ['c%s' % idx for idx in xrange(len(self.parents))]
+
+    def get_parent_indexes(self, indexes):
+        self.lookups.append(list(indexes))
+        return [self.parents[idx] for idx in indexes]
+
+
+@pytest.fixture
+def stub_repo():
+    return StubRepo([[], [0], [0], [1, 2]])
+
+
+@pytest.fixture(autouse=True)
+def parent_lookup(request):
+    def get_parent_indexes_func(repo):
+        return repo.get_parent_indexes
+
+    patcher = mock.patch.object(
+        commit_graph, 'get_parent_indexes_func', get_parent_indexes_func)
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
+
+@pytest.fixture
+def config(tmpdir):
+    return {
+        'commit_graph_dir': str(tmpdir.join('commit_graph')),
+        'git_commit_index_dir': str(tmpdir.join('commit_index')),
+    }
+
+
+def test_get_commit_graph_disabled(stub_repo):
+    assert commit_graph.get_commit_graph(stub_repo, {}) is None
+
+
+def test_git_needs_commit_index(stub_repo, config):
+    del config['git_commit_index_dir']
+
+    assert commit_graph.build_commit_graph(stub_repo, config) is None
+    assert commit_graph.get_commit_graph(stub_repo, config) is None
+    assert stub_repo.lookups == []
+
+
+def test_hg_does_not_need_commit_index(stub_repo, config):
+    del config['git_commit_index_dir']
+    stub_repo.alias = 'hg'
+
+    assert len(commit_graph.build_commit_graph(stub_repo, config)) == 4
+
+
+@pytest.fixture(autouse=True)
+def failed_updates(request):
+    patcher = mock.patch.object(commit_graph, '_failed_updates', {})
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
+
+def test_build_commit_graph(stub_repo, config):
+    graph = commit_graph.build_commit_graph(stub_repo, config)
+
+    assert len(graph) == 4
+    assert [graph.parents(idx) for idx in xrange(4)] == [[], [0], [0], [1, 2]]
+    assert [graph.generation(idx) for idx in xrange(4)] == [1, 2, 2, 3]
+    assert graph.last_commit_id == 'c3'
+
+
+def test_get_commit_graph_does_not_build_index(stub_repo, config):
+    assert commit_graph.get_commit_graph(stub_repo, config) is None
+    assert stub_repo.lookups == []
+
+
+def test_get_commit_graph_reuses_stored_index(stub_repo, config):
+    commit_graph.build_commit_graph(stub_repo, config)
+    stub_repo.lookups = []
+
+    graph = commit_graph.get_commit_graph(stub_repo, config)
+
+    assert len(graph) == 4
+    assert stub_repo.lookups == []
+
+
+def test_get_commit_graph_looks_up_only_new_commits(stub_repo, config):
+    commit_graph.build_commit_graph(stub_repo, config)
+    stub_repo.lookups = []
+    stub_repo.parents.extend([[3], [4, 0]])
+
+    graph = commit_graph.get_commit_graph(stub_repo, config)
+
+    assert stub_repo.lookups == [[4, 5]]
+    assert graph.parents(5) == [4, 0]
+    assert graph.generation(5) == 5
+
+
+def test_get_commit_graph_limits_new_commits(stub_repo, config):
+    commit_graph.build_commit_graph(stub_repo, config)
+    stub_repo.lookups = []
+    stub_repo.parents.extend([[3], [4]])
+
+    with mock.patch.object(commit_graph, 'MAX_UPDATE_COUNT', 1):
+        assert commit_graph.get_commit_graph(stub_repo, config) is None
+    assert stub_repo.lookups == []
+
+
+def test_get_commit_graph_ignores_rewritten_history(stub_repo, config):
+    commit_graph.build_commit_graph(stub_repo, config)
+    stub_repo.lookups = []
+    stub_repo.parents[:] = [[], [0]]
+
+    assert commit_graph.get_commit_graph(stub_repo, config) is None
+    assert stub_repo.lookups == []
+
+    graph = commit_graph.build_commit_graph(stub_repo, config)
+    assert stub_repo.lookups == [[0, 1]]
+    assert len(graph) == 2
+
+
+def test_build_commit_graph_rejects_non_topological_order(config):
+    repo = StubRepo([[1], []])
+
+    with pytest.raises(ValueError):
+        commit_graph.build_commit_graph(repo, config)
+
+
+def test_failed_update_is_not_retried(stub_repo, config):
+    commit_graph.build_commit_graph(stub_repo, config)
+    stub_repo.lookups = []
+    stub_repo.parents.append([5])
+
+    assert commit_graph.get_commit_graph(stub_repo, config) is None
+    assert commit_graph.get_commit_graph(stub_repo, config) is None
+    assert stub_repo.lookups == [[4]]
+
+    stub_repo.parents.append([4])
+    commit_graph.get_commit_graph(stub_repo, config)
+    assert stub_repo.lookups == [[4], [4, 5]]
+
+
+def test_update_commit_graph_in_chunks(stub_repo, config):
+    path = commit_graph.get_commit_graph_path(stub_repo, config)
+    with mock.patch.object(commit_graph, 'UPDATE_CHUNK_SIZE', 3):
+        commit_graph.update_commit_graph(stub_repo, path)
+
+    assert stub_repo.lookups == [[0, 1, 2], [3]]
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import textwrap
+
+import mock
+import pytest
+
+import rhodecode
+from rhodecode.lib import diff_cache
+from rhodecode.lib.diffs import LimitedDiffContainer
+from rhodecode.lib.vcs.backends.git.diff import GitDiff
+
+
+RAW_DIFF = textwrap.dedent('''
+    diff --git a/setup.py b/setup.py
+    index 5b36422..cfd698e 100755
+    --- a/setup.py
+    +++ b/setup.py
+    @@ -1,3 +1,3 @@
+     #!/usr/bin/python
+    -# Setup file for X
+    +# Setup file for Y
+     # Copyright (C) No one
+''')
+
+
+class StubRepo(object):
+
+    def __init__(self, alias='git'):
+        self.alias = alias
+        self.path = '/repos/%s' % (alias, )
+        self.calls = []
+
+    def get_diff(self, commit1, commit2, **kwargs):
+        self.calls.append((commit1.raw_id, commit2.raw_id, kwargs))
+        return GitDiff(RAW_DIFF)
+
+
+@pytest.fixture
+def enabled_diff_cache(request, tmpdir):
+    patcher = mock.patch.dict(
+        rhodecode.CONFIG, {'diff_cache_dir': str(tmpdir.join('diffs'))})
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
+
+@pytest.fixture
+def commits():
+    return mock.Mock(raw_id='a' * 40), mock.Mock(raw_id='b' * 40)
+
+
+def _parsed_lines(diff_processor):
+    return [
+        [line._values() for line in chunk]
+        for chunk in diff_processor.parsed_diff[0]['chunks']]
+
+
+def test_disabled_cache_parses_every_time(commits):
+    repo = StubRepo()
+    with mock.patch.dict(rhodecode.CONFIG, {'diff_cache_dir': ''}):
+        diff_cache.get_diff_processor(repo, *commits)
+        diff_processor = diff_cache.get_diff_processor(repo, *commits)
+
+    assert len(repo.calls) == 2
+    assert diff_processor.parsed_diff[0]['filename'] == 'setup.py'
+
+
+def test_cached_diff_is_parsed_once(enabled_diff_cache, commits):
+    repo = StubRepo()
+    first = diff_cache.get_diff_processor(repo, *commits, context=5)
+    second = diff_cache.get_diff_processor(repo, *commits, context=5)
+
+    assert len(repo.calls) == 1
+    assert repo.calls[0][2]['context'] == 5
+    assert second.parsed
+    assert second.parsed_diff[0]['stats'] == first.parsed_diff[0]['stats']
+    assert _parsed_lines(second) == _parsed_lines(first)
+
+
+def test_cache_key_contains_options(enabled_diff_cache, commits):
+    repo = StubRepo()
+    diff_cache.get_diff_processor(repo, *commits)
+    diff_cache.get_diff_processor(repo, *commits, ignore_whitespace=True)
+    diff_cache.get_diff_processor(repo, *commits, context=10)
+    diff_cache.get_diff_processor(repo, *reversed(commits))
+    diff_cache.get_diff_processor(
+        repo, *commits, diff_limit=10, show_full_diff=False)
+
+    assert len(repo.calls) == 5
+
+
+def test_limited_diff_is_restored(enabled_diff_cache, commits):
+    repo = StubRepo()
+    kwargs = {'diff_limit': 10, 'file_limit': 100, 'show_full_diff': False}
+    diff_cache.get_diff_processor(repo, *commits, **kwargs)
+    diff_processor = diff_cache.get_diff_processor(repo, *commits, **kwargs)
+
+    assert len(repo.calls) == 1
+    assert isinstance(diff_processor.parsed_diff, LimitedDiffContainer)
+    assert diff_processor.parsed_diff[0]['is_limited_diff']
+
+
+def test_subversion_diffs_are_not_cached(enabled_diff_cache, commits):
+    repo = StubRepo(alias='svn')
+    diff_cache.get_diff_processor(repo, *commits)
+    diff_cache.get_diff_processor(repo, *commits)
+
+    assert len(repo.calls) == 2
+
+
+def test_timed_out_inline_diff_is_not_cached(enabled_diff_cache, commits):
+    parse = diff_cache._parse
+
+    def parse_timed_out(get_diff, processor_kwargs):
+        diff_processor = parse(get_diff, processor_kwargs)
+        diff_processor.inline_diff_timed_out = True
+        return diff_processor
+
+    repo = StubRepo()
+    with mock.patch.object(diff_cache, '_parse', parse_timed_out):
+        diff_processor = diff_cache.get_diff_processor(repo, *commits)
+    diff_cache.get_diff_processor(repo, *commits)
+    diff_cache.get_diff_processor(repo, *commits)
+
+    assert len(repo.calls) == 2
+    assert diff_processor.parsed_diff[0]['filename'] == 'setup.py'
+
+
+def test_custom_get_diff(enabled_diff_cache, commits):
+    get_diff = mock.Mock(return_value=GitDiff(RAW_DIFF))
+    repo = StubRepo()
+    diff_cache.get_diff_processor(repo, *commits, get_diff=get_diff)
+    diff_cache.get_diff_processor(repo, *commits, get_diff=get_diff)
+
+    assert get_diff.call_count == 1
+    assert repo.calls == []
@@ -18,12 +18,17 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import difflib
+import pickle
+import sys
 import textwrap
 
+import mock
 import pytest
 
+import rhodecode
 from rhodecode.lib.diffs import (
-    DiffProcessor, wrapped_diff,
+    Action, DiffLine, DiffProcessor, wrapped_diff, myers_opcodes,
     NEW_FILENODE, DEL_FILENODE, MOD_FILENODE, RENAMED_FILENODE,
     CHMOD_FILENODE, BIN_FILENODE, COPIED_FILENODE)
 from rhodecode.tests.fixture import Fixture
@@ -731,6 +736,187 @@ def test_diff_lib(diff_fixture):
     assert expected_data == data
 
 
+def test_diffprocessor_skips_files_after_diff_limit():
+    raw_diff = textwrap.dedent('''
+        diff --git a/a.txt b/a.txt
+        index 5b36422..cfd698e 100644
+        --- a/a.txt
+        +++ b/a.txt
+        @@ -1,1 +1,1 @@
+        -a
+        +b
+        diff --git a/b.txt b/b.txt
+        index 5b36422..cfd698e 100644
+        --- a/b.txt
+        +++ b/b.txt
+        @@ -1,1 +1,1 @@
+        -a
+        +b
+    ''')
+    processor = DiffProcessor(
+        GitDiff(raw_diff), diff_limit=10, file_limit=1000,
+        show_full_diff=False)
+
+    files = processor.prepare()
+
+    assert [f['filename'] for f in files] == ['a.txt', 'b.txt']
+    assert [f['is_limited_diff'] for f in files] == [True, True]
+    assert processor.limited_diff
+    # only the first line of the first file has been read
+    assert processor.cur_diff_size == len('@@ -1,1 +1,1 @@\n')
+
+
+def test_diff_line_supports_dict_access():
+    line = DiffLine(1, '', Action.DELETE, 'text')
+
+    assert line['action'] == line.action == Action.DELETE
+    line['line'] = 'changed'
+    assert line.line == 'changed'
+    with pytest.raises(KeyError):
+        line['unknown']
+
+
+def test_diff_line_pickle():
+    line = DiffLine(1, 2, Action.UNMODIFIED, u'text')
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+        assert pickle.loads(pickle.dumps(line, protocol)) == line
+
+
+def _generate_diff(lines):
+    diff_lines = [
+        'diff --git a/big.py b/big.py',
+        'index 5b36422..cfd698e 100644',
+        '--- a/big.py',
+        '+++ b/big.py',
+        '@@ -1,%d +1,%d @@' % (lines, lines),
+    ]
+    for idx in xrange(lines / 2):
+        diff_lines.append('-    value_%d = compute(%d)' % (idx, idx))
+        diff_lines.append('+    value_%d = compute(%d, fast=True)' % (idx, idx))
+    return '\n'.join(diff_lines) + '\n'
+
+
+def test_parsed_diff_lines_use_less_memory_than_dicts(repeat):
+    """
+    Parses a big diff and compares the memory used by the parsed lines to
+    the dicts which have been used before.
+    """
+    diff = GitDiff(_generate_diff(repeat * 50))
+    parsed = DiffProcessor(diff).prepare(inline_diff=False)
+
+    lines = [line for chunk in parsed[0]['chunks'] for line in chunk]
+    dict_lines = [
+        {'old_lineno': old_lineno, 'new_lineno': new_lineno,
+         'action': action, 'line': line}
+        for old_lineno, new_lineno, action, line in (
+            line._values() for line in lines)]
+
+    assert parsed[0]['stats']['added'] == repeat * 25
+    line_size = sum(sys.getsizeof(line) for line in lines)
+    dict_size = sum(sys.getsizeof(line) for line in dict_lines)
+    assert line_size < dict_size
+
+
+@pytest.mark.parametrize('old, new', [
+    ('', ''),
+    ('abc', 'abc'),
+    ('abc', ''),
+    ('', 'abc'),
+    ('abcdef', 'abXdef'),
+    ('abcdef', 'acdf'),
+    ('xabcy', 'zabcw'),
+])
+def test_myers_opcodes(old, new):
+    opcodes = myers_opcodes(list(old), list(new))
+
+    assert opcodes == difflib.SequenceMatcher(
+        None, list(old), list(new)).get_opcodes()
+
+
+def _highlighted_pair(old, new, **settings):
+    processor = DiffProcessor(None)
+    for name, value in settings.items():
+        setattr(processor, name, value)
+    old_line = DiffLine(1, '', Action.DELETE, old)
+    new_line = DiffLine('', 1, Action.ADD, new)
+    processor.differ(old_line, new_line)
+    return old_line.line, new_line.line
+
+
+@pytest.mark.parametrize('algorithm', ['myers', 'difflib'])
+def test_highlight_inline_changes(algorithm):
+    assert _highlighted_pair(
+        'value = compute(1)', 'value = compute(2, fast)',
+        inline_diff_algorithm=algorithm) == (
+        'value = compute(<del>1</del>)',
+        'value = compute(<ins>2, fast</ins>)')
+
+
+def test_highlight_inline_skips_long_lines():
+    assert _highlighted_pair(
+        'a b c d', 'a b x d', inline_diff_max_tokens=5) == (
+        'a b c d', 'a b x d')
+
+
+def test_highlight_inline_skips_lines_after_time_budget():
+    processor = DiffProcessor(None)
+    processor.inline_diff_max_tokens = 0
+    processor.inline_diff_time_budget = 0.01
+    old_line = DiffLine(1, '', Action.DELETE, ' '.join(['a'] * 3000))
+    new_line = DiffLine('', 1, Action.ADD, ' '.join(['b'] * 3000))
+    processor.differ(old_line, new_line)
+
+    assert '<del>' not in old_line.line
+    assert processor._inline_diff_time >= 0.01
+    assert processor.inline_diff_timed_out
+    assert processor._get_inline_opcodes(['a'], ['b']) is None
+
+
+def test_inline_diff_settings_from_config():
+    settings = {
+        'diff_inline_algorithm': 'difflib',
+        'diff_inline_max_tokens': '10',
+        'diff_inline_time_budget': '0.5',
+    }
+    with mock.patch.dict(rhodecode.CONFIG, settings):
+        processor = DiffProcessor(None)
+
+    assert processor.inline_diff_algorithm == 'difflib'
+    assert processor.inline_diff_max_tokens == 10
+    assert processor.inline_diff_time_budget == 0.5
+
+
+@pytest.mark.parametrize('algorithm', ['myers', 'difflib'])
+def test_inline_diff_of_long_minified_line(repeat, algorithm):
+    """
+    Highlights the changes of a long minified line without a time budget.
+    """
+    tokens = ['var_%d' % idx for idx in xrange(repeat * 2)]
+    changed = list(tokens)
+    changed[::10] = ['changed'] * len(changed[::10])
+    minified = GitDiff(textwrap.dedent('''\
+        diff --git a/app.min.js b/app.min.js
+        index 5b36422..cfd698e 100644
+        --- a/app.min.js
+        +++ b/app.min.js
+        @@ -1,1 +1,1 @@
+        -%s
+        +%s
+    ''') % (','.join(tokens), ','.join(changed)))
+    processor = DiffProcessor(minified)
+    processor.inline_diff_algorithm = algorithm
+    processor.inline_diff_time_budget = 0
+
+    parsed = processor.prepare()
+
+    old_line, new_line = [
+        line for line in parsed[0]['chunks'][-1]
+        if line.action in (Action.DELETE, Action.ADD)]
+    assert old_line.line.count('<del>') == len(changed[::10])
+    assert new_line.line.count('<ins>') == len(changed[::10])
+    assert not processor.inline_diff_timed_out
+
+
 @pytest.fixture(params=DIFF_FIXTURES_WITH_CONTENT)
 def diff_fixture_w_content(request):
     vcs, diff_fixture, expected = request.param
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import mock
+import pytest
+
+from rhodecode.lib import file_tree_cache
+from rhodecode.lib.file_tree_cache import COMMIT_ID_PLACEHOLDER, FileTreeCache
+
+
+class StubCommit(object):
+
+    def __init__(self, raw_id, tree_id=None, alias='git'):
+        self.raw_id = raw_id
+        self.tree_id = tree_id
+        self.repository = mock.Mock(alias=alias)
+
+    def get_tree_id(self, path):
+        return self.tree_id
+
+
+class StubRenderer(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, full_load):
+        self.calls.append(full_load)
+        return u'<a href="/repo/files/%s/dir">%s</a>' % (
+            COMMIT_ID_PLACEHOLDER, 'full' if full_load else 'partial')
+
+
+@pytest.fixture(autouse=True)
+def fresh_file_tree_cache(request):
+    file_tree_cache._file_tree_caches.clear()
+    request.addfinalizer(file_tree_cache._file_tree_caches.clear)
+
+
+@pytest.fixture
+def config():
+    return {'file_tree_cache_size': '10'}
+
+
+def _get_tree(commit, render_func, config, full_load=False, path='dir'):
+    return file_tree_cache.get_tree(
+        'repo', commit, path, full_load, render_func, config)
+
+
+def test_commit_id_is_filled_in(config):
+    html = _get_tree(StubCommit('a' * 40, 't1'), StubRenderer(), config)
+
+    assert html == u'<a href="/repo/files/%s/dir">partial</a>' % ('a' * 40)
+
+
+def test_partial_tree_is_shared_by_commits_with_same_tree(config):
+    render = StubRenderer()
+    _get_tree(StubCommit('a' * 40, 't1'), render, config)
+    html = _get_tree(StubCommit('b' * 40, 't1'), render, config)
+
+    assert render.calls == [False]
+    assert ('b' * 40) in html
+
+
+def test_changed_tree_is_rendered_again(config):
+    render = StubRenderer()
+    _get_tree(StubCommit('a' * 40, 't1'), render, config)
+    _get_tree(StubCommit('a' * 40, 't1'), render, config, path='other')
+    _get_tree(StubCommit('b' * 40, 't2'), render, config)
+
+    assert render.calls == [False, False, False]
+
+
+def test_full_tree_is_cached_per_commit(config):
+    render = StubRenderer()
+    _get_tree(StubCommit('a' * 40, 't1'), render, config, full_load=True)
+    _get_tree(StubCommit('b' * 40, 't1'), render, config, full_load=True)
+    html = _get_tree(StubCommit('a' * 40, 't1'), render, config)
+
+    assert render.calls == [True, True]
+    assert 'full' in html
+
+
+def test_trees_without_id_are_cached_per_commit(config):
+    render = StubRenderer()
+    _get_tree(StubCommit('a' * 40, alias='hg'), render, config)
+    _get_tree(StubCommit('a' * 40, alias='hg'), render, config)
+    _get_tree(StubCommit('b' * 40, alias='hg'), render, config)
+
+    assert render.calls == [False, False]
+
+
+def test_subversion_trees_are_not_cached(config):
+    render = StubRenderer()
+    _get_tree(StubCommit('1', alias='svn'), render, config)
+    _get_tree(StubCommit('1', alias='svn'), render, config)
+
+    assert render.calls == [False, False]
+
+
+def test_disabled_cache():
+    render = StubRenderer()
+    config = {'file_tree_cache_size': '0'}
+    _get_tree(StubCommit('a' * 40, 't1'), render, config)
+    _get_tree(StubCommit('a' * 40, 't1'), render, config)
+
+    assert file_tree_cache.get_file_tree_cache(config) is None
+    assert render.calls == [False, False]
+
+
+def test_stats_and_evictions():
+    cache = FileTreeCache(max_entries=2)
+    render = StubRenderer()
+    for tree_id in ('t1', 't1', 't2', 't3'):
+        cache.get_tree(
+            'repo', StubCommit('a' * 40, tree_id), 'dir', False, render)
+
+    stats = cache.get_stats()
+    assert len(render.calls) == 3
+    assert (stats['hits'], stats['misses']) == (1, 3)
+    assert stats['hit_rate'] == 0.25
+    assert stats['evictions'] == 1
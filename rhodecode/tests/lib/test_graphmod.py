@@ -18,7 +18,11 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import mock
+
 from rhodecode.lib import graphmod
+from rhodecode.lib.vcs.backends.git.commit_index import CommitIndex
+from rhodecode.lib.vcs.client_http import RemoteBatch, _call_sequentially
 
 
 # pylint: disable=protected-access
@@ -75,3 +79,61 @@ def test_colored_merged_branch():
         ((0, 2), []),
     ]
     assert list(graphmod._colored(dag)) == expected_result
+
+
+def test_grandparent_looks_up_parents_per_generation():
+    parents = {5: [4, 3], 4: [2], 3: [2], 2: [1], 1: [0]}
+    lookups = []
+
+    def parent_idx_func(indexes):
+        lookups.append(sorted(indexes))
+        return [parents[idx] for idx in indexes]
+
+    result = graphmod.grandparent(parent_idx_func, 1, set([1, 6]), 5)
+
+    assert result == [1]
+    assert lookups == [[5], [3, 4], [2]]
+
+
+def test_grandparent_stops_at_lowest_idx():
+    parents = {5: [4], 4: [3], 3: [2]}
+
+    def parent_idx_func(indexes):
+        return [parents[idx] for idx in indexes]
+
+    assert graphmod.grandparent(parent_idx_func, 4, set([2, 6]), 5) == []
+
+
+def test_dagwalker_uses_commit_graph():
+    parents = {4: [3, 1], 3: [2], 2: [0], 1: [0], 0: []}
+    generations = {4: 4, 3: 3, 2: 2, 1: 2, 0: 1}
+    commit_graph = mock.Mock()
+    commit_graph.parents.side_effect = lambda idx: parents[idx]
+    commit_graph.generation.side_effect = lambda idx: generations[idx]
+    repo = mock.Mock(alias='git')
+    commits = [mock.Mock(idx=idx) for idx in (4, 2)]
+
+    dag = list(graphmod._dagwalker(repo, commits, commit_graph=commit_graph))
+
+    assert dag == [(4, [2, 1]), (2, [0])]
+    assert not repo.method_calls
+
+
+def test_git_parent_indexes_use_commit_index():
+    commit_ids = ['%040x' % idx for idx in range(3)]
+    parents = {commit_ids[2]: commit_ids[:2], commit_ids[1]: commit_ids[:1]}
+    remote = mock.Mock()
+    remote.batch.side_effect = lambda: RemoteBatch(remote)
+    remote._call_batch.side_effect = lambda calls: _call_sequentially(
+        remote, calls)
+    remote.bulk_request.side_effect = lambda commit_id, attributes: {
+        'parents': parents[commit_id]}
+    repo = mock.Mock(alias='git', _remote=remote)
+    repo._get_commit_index.return_value = CommitIndex.from_commit_ids(
+        commit_ids)
+
+    get_parent_indexes = graphmod.get_parent_indexes_func(repo)
+
+    assert get_parent_indexes([2, 1]) == [[0, 1], [0]]
+    assert not remote.get_object.called
+    assert not repo.get_commit.called
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import mock
+import pytest
+
+import rhodecode
+from rhodecode import events
+from rhodecode.lib.index import indexer, whoosh
+from rhodecode.lib.vcs.nodes import FileNode
+
+
+@pytest.fixture
+def location(tmpdir):
+    return tmpdir.join('index').strpath
+
+
+def test_pending_repositories(location):
+    indexer.schedule_repository(location, u'repo')
+    indexer.schedule_repository(location, u'group/r\xe9po')
+    indexer.schedule_repository(location, u'repo')
+
+    assert sorted(indexer.take_pending_repositories(location)) == [
+        u'group/r\xe9po', u'repo']
+    assert indexer.take_pending_repositories(location) == []
+
+
+def test_push_event_handler(location):
+    event = mock.Mock(spec=events.RepoPushEvent)
+    event.repo = mock.Mock(repo_name=u'repo')
+    settings = {
+        'search.incremental_indexer': 'true',
+        'search.location': location,
+    }
+    with mock.patch.dict(rhodecode.CONFIG, settings):
+        indexer.push_event_handler(event)
+        indexer.push_event_handler(mock.Mock())
+
+    assert indexer.take_pending_repositories(location) == [u'repo']
+
+
+def test_push_event_handler_disabled(location):
+    event = mock.Mock(spec=events.RepoPushEvent)
+    settings = {
+        'search.incremental_indexer': 'false',
+        'search.location': location,
+    }
+    with mock.patch.dict(rhodecode.CONFIG, settings):
+        indexer.push_event_handler(event)
+
+    assert indexer.take_pending_repositories(location) == []
+
+
+def test_watermarks(location):
+    watermarks = indexer.Watermarks(location)
+    assert watermarks.get(1) is None
+
+    watermarks.set(1, {'commit_id': 'abc', 'commit_idx': 3})
+
+    assert watermarks.get(1) == {'commit_id': 'abc', 'commit_idx': 3}
+
+
+def _stub_repo(repo_id, repo_name):
+    return mock.Mock(
+        repo_id=repo_id, repo_name=repo_name,
+        user=mock.Mock(username=u'owner'))
+
+
+def _stub_scm_repo(commit_ids):
+    commits = dict(
+        (commit_id, mock.Mock(
+            raw_id=commit_id, idx=idx, date=None, author=u'author',
+            message=u'message', parents=[], added=[], removed=[],
+            changed=[]))
+        for idx, commit_id in enumerate(commit_ids))
+    return mock.Mock(
+        commit_ids=commit_ids,
+        get_commit=lambda commit_id: commits[commit_id])
+
+
+def test_forks_keep_shared_commits(location):
+    repo_indexer = indexer.RepositoryIndexer(location)
+    scm_repo = _stub_scm_repo(['a' * 40, 'b' * 40])
+    parent, fork = _stub_repo(1, u'parent'), _stub_repo(2, u'fork')
+
+    repo_indexer._index_commits(parent, scm_repo, {'commit_idx': -1})
+    repo_indexer._index_commits(fork, scm_repo, {'commit_idx': -1})
+    # the batch is written again, e.g. after an interrupted run
+    repo_indexer._index_commits(parent, scm_repo, {'commit_idx': -1})
+
+    assert _commit_count(location, u'parent') == 2
+    assert _commit_count(location, u'fork') == 2
+
+
+def _doc_count(location, index_name, schema, repo_name):
+    pool = whoosh.get_searcher_pool(location, index_name, schema)
+    searcher = pool.acquire()
+    try:
+        return len(list(searcher.documents(repository=repo_name)))
+    finally:
+        pool.release(searcher)
+
+
+def _commit_count(location, repo_name):
+    return _doc_count(location, whoosh.COMMIT_INDEX_NAME,
+                      whoosh.COMMIT_SCHEMA, repo_name)
+
+
+def _file_count(location, repo_name):
+    return _doc_count(location, whoosh.FILE_INDEX_NAME,
+                      whoosh.FILE_SCHEMA, repo_name)
+
+
+@pytest.mark.backends("git", "hg")
+class TestRepositoryIndexer(object):
+
+    def test_index_repository(self, backend, location):
+        repo = backend.create_repo(number_of_commits=3)
+
+        result = indexer.RepositoryIndexer(location).index_repository(
+            repo.repo_name)
+
+        assert result['commits'] == 3
+        assert result['files'] == 3
+        assert _commit_count(location, repo.repo_name) == 3
+        assert _file_count(location, repo.repo_name) == 3
+
+    def test_index_only_new_commits_and_changed_files(
+            self, backend, location):
+        repo = backend.create_repo(number_of_commits=3)
+        repo_indexer = indexer.RepositoryIndexer(location)
+        repo_indexer.index_repository(repo.repo_name)
+
+        backend._add_commits_to_repo(repo.scm_instance(), [
+            {'message': 'change', 'changed': [
+                FileNode('file_0', content='changed')]},
+            {'message': 'remove', 'removed': [FileNode('file_1')]},
+        ])
+        result = repo_indexer.index_repository(repo.repo_name)
+
+        assert result['commits'] == 2
+        assert result['files'] == 2
+        assert _commit_count(location, repo.repo_name) == 5
+        assert _file_count(location, repo.repo_name) == 2
+
+    def test_index_unchanged_repository(self, backend, location):
+        repo = backend.create_repo(number_of_commits=2)
+        repo_indexer = indexer.RepositoryIndexer(location)
+        repo_indexer.index_repository(repo.repo_name)
+
+        result = repo_indexer.index_repository(repo.repo_name)
+
+        assert (result['commits'], result['files']) == (0, 0)
+
+    def test_full_index_replaces_documents(self, backend, location):
+        repo = backend.create_repo(number_of_commits=2)
+        repo_indexer = indexer.RepositoryIndexer(location)
+        repo_indexer.index_repository(repo.repo_name)
+
+        result = repo_indexer.index_repository(repo.repo_name, full=True)
+
+        assert result['commits'] == 2
+        assert _commit_count(location, repo.repo_name) == 2
+        assert _file_count(location, repo.repo_name) == 2
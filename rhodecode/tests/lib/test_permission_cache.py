@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import uuid
+
+import mock
+import pytest
+
+from rhodecode.lib import caches, permission_cache
+from rhodecode.lib.permission_cache import PermissionCache
+from rhodecode.model.meta import Session
+from rhodecode.model.repo import RepoModel
+
+
+@pytest.fixture
+def perm_cache():
+    cache_manager = caches.get_cache_manager(
+        'permissions_test', 'perms_%s' % (uuid.uuid4(), ))
+    return PermissionCache(cache_manager)
+
+
+@pytest.fixture
+def enabled_perm_cache(request, perm_cache):
+    patcher = mock.patch.object(
+        permission_cache, 'get_permission_cache', return_value=perm_cache)
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+    return perm_cache
+
+
+def _compute(result, calls):
+    def compute():
+        calls.append(1)
+        return result
+    return compute
+
+
+def test_get_permissions_computes_once(perm_cache):
+    calls = []
+    for x in xrange(3):
+        result = perm_cache.get_permissions(
+            1, ('scope', True), _compute({'global': set()}, calls))
+        assert result == {'global': set()}
+
+    assert len(calls) == 1
+    stats = perm_cache.get_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_get_permissions_keyed_by_params(perm_cache):
+    calls = []
+    perm_cache.get_permissions(1, ('scope-a', ), _compute({}, calls))
+    perm_cache.get_permissions(1, ('scope-b', ), _compute({}, calls))
+    perm_cache.get_permissions(2, ('scope-a', ), _compute({}, calls))
+
+    assert len(calls) == 3
+
+
+def test_invalidate_user_only_affects_user(perm_cache):
+    calls = []
+    perm_cache.get_permissions(1, (), _compute({}, calls))
+    perm_cache.get_permissions(2, (), _compute({}, calls))
+
+    perm_cache.invalidate(user_ids=[1])
+    perm_cache.get_permissions(1, (), _compute({}, calls))
+    perm_cache.get_permissions(2, (), _compute({}, calls))
+
+    assert len(calls) == 3
+
+
+def test_invalidate_everything(perm_cache):
+    calls = []
+    perm_cache.get_permissions(1, (), _compute({}, calls))
+    perm_cache.get_permissions(2, (), _compute({}, calls))
+
+    perm_cache.invalidate(everything=True)
+    perm_cache.get_permissions(1, (), _compute({}, calls))
+    perm_cache.get_permissions(2, (), _compute({}, calls))
+
+    assert len(calls) == 4
+    assert perm_cache.get_stats()['invalidations'] == 1
+
+
+def test_granting_repo_permission_invalidates_user(
+        enabled_perm_cache, user_util, backend_random):
+    repo = backend_random.create_repo()
+    user = user_util.create_user()
+
+    with mock.patch.object(enabled_perm_cache, 'invalidate') as invalidate:
+        RepoModel().grant_user_permission(repo, user, 'repository.write')
+        assert not invalidate.called
+        Session().commit()
+
+    invalidate.assert_called_once_with(
+        user_ids=set([user.user_id]), everything=False)
+
+
+def test_renaming_user_group_invalidates_everything(
+        enabled_perm_cache, user_util):
+    user_group = user_util.create_user_group()
+
+    with mock.patch.object(enabled_perm_cache, 'invalidate') as invalidate:
+        user_group.users_group_name = user_group.users_group_name + '_renamed'
+        Session().add(user_group)
+        Session().commit()
+
+    invalidate.assert_called_once_with(user_ids=set(), everything=True)
+
+
+def test_rolled_back_changes_do_not_invalidate(
+        enabled_perm_cache, user_util, backend_random):
+    repo = backend_random.create_repo()
+    user = user_util.create_user()
+
+    with mock.patch.object(enabled_perm_cache, 'invalidate') as invalidate:
+        RepoModel().grant_user_permission(repo, user, 'repository.write')
+        Session().flush()
+        Session().rollback()
+
+    assert not invalidate.called
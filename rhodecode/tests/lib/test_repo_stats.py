@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import uuid
+
+import mock
+import pytest
+
+from rhodecode.lib.repo_stats import RepoStats
+from rhodecode.lib.vcs.exceptions import NodeDoesNotExistError
+
+
+class StubCommit(object):
+
+    def __init__(self, raw_id, files, parent=None):
+        self.raw_id = raw_id
+        self.files = files
+        self.parents = [parent] if parent else []
+        self.looked_up = []
+        self.walked = False
+
+    def get_first_parent_changes(self):
+        parent_files = self.parents[0].files if self.parents else {}
+        return set(path for path in set(self.files).union(parent_files)
+                   if self.files.get(path) != parent_files.get(path))
+
+    def get_node(self, path):
+        self.looked_up.append(path)
+        if path not in self.files:
+            raise NodeDoesNotExistError(path)
+        return mock.Mock(path=path, size=self.files[path])
+
+    def get_filenodes_generator(self):
+        self.walked = True
+        for path, size in self.files.items():
+            yield mock.Mock(path=path, size=size)
+
+
+@pytest.fixture
+def repo_stats():
+    return RepoStats('stats-repo-%s' % uuid.uuid4())
+
+
+def test_get_stats_walks_tree_without_known_parent(repo_stats):
+    commit = StubCommit('c1', {'a.py': 10, 'b.PY': 5, 'README': 3})
+
+    stats = repo_stats.get_stats(commit)
+
+    assert commit.walked
+    assert stats == {
+        'size': 18,
+        'files': 3,
+        'extensions': {
+            'py': {'count': 2, 'size': 15},
+            'readme': {'count': 1, 'size': 3},
+        },
+    }
+
+
+def test_get_stats_applies_changes_of_new_commits(repo_stats):
+    c1 = StubCommit('c1', {'a.py': 10, 'b.py': 5, 'c.js': 3})
+    repo_stats.get_stats(c1)
+    c2 = StubCommit('c2', {'a.py': 20, 'b.py': 5, 'c.js': 3}, parent=c1)
+    c3 = StubCommit('c3', {'a.py': 20, 'b.py': 5, 'd.rst': 7}, parent=c2)
+
+    stats = repo_stats.get_stats(c3)
+
+    assert not c3.walked
+    assert not c2.walked
+    assert sorted(c3.looked_up) == ['c.js', 'd.rst']
+    assert stats == {
+        'size': 32,
+        'files': 3,
+        'extensions': {
+            'py': {'count': 2, 'size': 25},
+            'rst': {'count': 1, 'size': 7},
+        },
+    }
+    # the commits in between are stored as well
+    assert repo_stats.get_stats(c2)['size'] == 28
+
+
+def test_get_stats_does_not_modify_parent_stats(repo_stats):
+    c1 = StubCommit('c1', {'a.py': 10})
+    repo_stats.get_stats(c1)
+    c2 = StubCommit('c2', {}, parent=c1)
+
+    assert repo_stats.get_stats(c2)['files'] == 0
+    assert repo_stats.get_stats(c1)['files'] == 1
+
+
+def test_get_stats_walks_tree_if_parents_too_far(repo_stats):
+    repo_stats.max_incremental = 1
+    c1 = StubCommit('c1', {'a.py': 10})
+    repo_stats.get_stats(c1)
+    c2 = StubCommit('c2', {'a.py': 11}, parent=c1)
+    c3 = StubCommit('c3', {'a.py': 12}, parent=c2)
+
+    assert repo_stats.get_stats(c3)['size'] == 12
+    assert c3.walked
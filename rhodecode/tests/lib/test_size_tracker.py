@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import os
+import time
+
+import mock
+import pytest
+
+from rhodecode.lib import size_tracker
+
+
+def _write(path, size):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write('x' * size)
+
+
+def _age(path, seconds=60):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def _walk_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, dirs, files in os.walk(path) for name in files)
+
+
+@pytest.fixture
+def repo_path(tmpdir):
+    path = tmpdir.join('repo').strpath
+    _write(os.path.join(path, 'HEAD'), 23)
+    _write(os.path.join(path, 'refs', 'heads', 'master'), 41)
+    for prefix in ['ab', 'cd']:
+        _write(os.path.join(path, 'objects', prefix, '0' * 38), 100)
+        _age(os.path.join(path, 'objects', prefix))
+    _write(os.path.join(path, 'objects', 'pack', 'pack-1.pack'), 1000)
+    _age(os.path.join(path, 'objects', 'pack'))
+    return path
+
+
+def test_get_size(repo_path):
+    tracker = size_tracker.SizeTracker()
+
+    assert tracker.get_size(repo_path) == _walk_size(repo_path)
+    assert tracker.get_size(os.path.join(repo_path, 'missing')) == 0
+
+
+def test_iter_sizes(repo_path):
+    tracker = size_tracker.SizeTracker()
+
+    sizes = dict(tracker.iter_sizes(repo_path))
+
+    assert sizes[repo_path] == 23
+    assert sizes[os.path.join(repo_path, 'refs', 'heads')] == 41
+    assert sizes[os.path.join(repo_path, 'objects', 'pack')] == 1000
+
+
+def test_object_dirs_are_cached(repo_path):
+    tracker = size_tracker.SizeTracker()
+    tracker.get_size(repo_path)
+
+    with mock.patch.object(
+            size_tracker, '_scan_dir',
+            wraps=size_tracker._scan_dir) as scan_dir:
+        assert tracker.get_size(repo_path) == _walk_size(repo_path)
+
+    scanned = [call[0][0] for call in scan_dir.call_args_list]
+    assert os.path.join(repo_path, 'objects', 'ab') not in scanned
+    assert os.path.join(repo_path, 'objects', 'pack') not in scanned
+    assert os.path.join(repo_path, 'objects') in scanned
+    stats = tracker.get_stats()
+    assert (stats['hits'], stats['misses']) == (3, 3)
+    assert stats['hit_rate'] == 0.5
+
+
+def test_changed_object_dir_is_rescanned(repo_path):
+    tracker = size_tracker.SizeTracker()
+    tracker.get_size(repo_path)
+
+    pack_dir = os.path.join(repo_path, 'objects', 'pack')
+    _write(os.path.join(pack_dir, 'pack-2.pack'), 500)
+    _age(pack_dir, seconds=30)
+
+    assert tracker.get_size(repo_path) == _walk_size(repo_path)
+
+
+def test_recently_changed_object_dir_is_not_cached(repo_path):
+    tracker = size_tracker.SizeTracker()
+    object_dir = os.path.join(repo_path, 'objects', 'ab')
+    _age(object_dir, seconds=1)
+    mtime = os.stat(object_dir).st_mtime
+    tracker.get_size(repo_path)
+
+    # a change within the resolution of the mtime
+    _write(os.path.join(object_dir, '1' * 38), 100)
+    os.utime(object_dir, (mtime, mtime))
+
+    assert tracker.get_size(repo_path) == _walk_size(repo_path)
+
+
+def test_object_dirs_outside_of_git_are_not_cached(tmpdir):
+    repo_path = tmpdir.join('hg-repo').strpath
+    pack_dir = os.path.join(
+        repo_path, '.hg', 'store', 'data', 'objects', 'pack')
+    _write(os.path.join(pack_dir, 'file.i'), 100)
+    _age(pack_dir)
+    tracker = size_tracker.SizeTracker()
+    tracker.get_size(repo_path)
+
+    # revlogs are appended in place, the mtime of the directory is unchanged
+    mtime = os.stat(pack_dir).st_mtime
+    with open(os.path.join(pack_dir, 'file.i'), 'ab') as f:
+        f.write('x' * 50)
+    os.utime(pack_dir, (mtime, mtime))
+
+    assert tracker.get_size(repo_path) == 150
+    assert tracker.get_stats()['hits'] == 0
+
+
+def test_scan_dir_without_scandir(repo_path):
+    with mock.patch.object(size_tracker, 'scandir', None):
+        assert size_tracker.SizeTracker().get_size(repo_path) == (
+            _walk_size(repo_path))
@@ -26,6 +26,7 @@ import pytest
 from mock import Mock, patch, DEFAULT
 
 import rhodecode
+from rhodecode.lib.auth import AuthUser
 from rhodecode.model import db, scm
 
 
@@ -333,3 +334,17 @@ class TestInstallHooks(object):
         with patch.object(scm.ScmModel, hook_method) as hooks_mock:
             model.install_hooks(scm_repo, repo_type='hg')
         assert hooks_mock.call_count == 0
+
+
+def test_repo_list_checks_permissions_at_once():
+    repos = [Mock(repo_name=name) for name in ('a', 'b', 'c')]
+    user = Mock(spec=AuthUser)
+    user.permissions = {'repositories': {
+        'a': 'repository.read', 'b': 'repository.none',
+        'c': 'repository.write'}}
+
+    with patch.object(scm.HasRepoPermissionAny, 'check_permissions') as check:
+        repo_list = scm.RepoList(repos, extra_kwargs={'user': user})
+        assert list(repo_list) == [repos[0], repos[2]]
+
+    assert not check.called
@@ -32,6 +32,7 @@ import pytest
 from rhodecode.lib.vcs.backends import base
 from rhodecode.lib.vcs.exceptions import ImproperArchiveTypeError, VCSError
 from rhodecode.lib.vcs.nodes import FileNode
+from rhodecode.lib.vcs.utils.archive import stream_archive
 from rhodecode.tests.vcs.base import BackendTestMixin
 
 
@@ -110,6 +111,52 @@ class TestArchives(BackendTestMixin):
         with pytest.raises(ImproperArchiveTypeError):
             self.tip.archive_repo(self.temp_file, kind='wrong kind')
 
+    @pytest.mark.parametrize('compressor', ['gz', 'bz2'])
+    def test_archive_stream_tar(self, compressor):
+        stream = self.tip.archive_repo_stream(
+            kind='t' + compressor, prefix='repo', buffer_size=1, batch_size=2)
+        out_file = tarfile.open(
+            fileobj=StringIO.StringIO(''.join(stream)), mode='r|' + compressor)
+
+        contents = dict(
+            (member.name, out_file.extractfile(member).read())
+            for member in out_file)
+        for x in xrange(5):
+            node_path = '%d/file_%d.txt' % (x, x)
+            assert contents['repo/' + node_path] == \
+                self.tip.get_node(node_path).content
+
+    def test_archive_stream_zip_with_metadata(self):
+        stream = self.tip.archive_repo_stream(
+            kind='zip', prefix='repo', write_metadata=True, batch_size=2)
+        out = zipfile.ZipFile(StringIO.StringIO(''.join(stream)))
+
+        assert 'rev:%s' % self.tip.raw_id in out.read('.archival.txt')
+        for x in xrange(5):
+            node_path = '%d/file_%d.txt' % (x, x)
+            assert out.read('repo/' + node_path) == \
+                self.tip.get_node(node_path).content
+
+    @pytest.mark.skip_backends(
+        'svn', reason='Subversion fetches the files one by one')
+    def test_archive_stream_fetches_files_in_batches(self):
+        commit_class = type(self.tip)
+        with mock.patch.object(commit_class, 'get_file_content') as get_one:
+            with mock.patch.object(
+                    commit_class, '_get_archive_files',
+                    autospec=True,
+                    side_effect=commit_class._get_archive_files) as get_batch:
+                ''.join(self.tip.archive_repo_stream(
+                    kind='zip', prefix='repo', batch_size=2))
+
+        assert not get_one.called
+        assert [len(call[0][1]) for call in get_batch.call_args_list] == [
+            2, 2, 1]
+
+    def test_archive_stream_wrong_kind(self):
+        with pytest.raises(ImproperArchiveTypeError):
+            self.tip.archive_repo_stream(kind='wrong kind')
+
 
 @pytest.fixture
 def base_commit():
@@ -148,3 +195,25 @@ def test_validate_archive_prefix_falls_back_to_repository_name(base_commit):
         short_id='fake_id')
     assert isinstance(prefix, str)
     assert prefix == expected_prefix
+
+
+def test_stream_archive_yields_chunks_of_buffer_size():
+    file_info = [
+        ('repo/file_%d' % x, 0100644, False, os.urandom(1000))
+        for x in xrange(10)]
+    chunks = list(stream_archive(
+        iter(file_info), 'zip', mtime=0, buffer_size=1500))
+
+    assert len(chunks) > 1
+    out = zipfile.ZipFile(StringIO.StringIO(''.join(chunks)))
+    assert out.namelist() == [info[0] for info in file_info]
+
+
+def test_stream_archive_keeps_symlinks():
+    file_info = [('repo/link', 0120000, True, 'target')]
+    stream = stream_archive(iter(file_info), 'tgz', mtime=0)
+    out = tarfile.open(fileobj=StringIO.StringIO(''.join(stream)), mode='r|gz')
+
+    member = out.next()
+    assert member.issym()
+    assert member.linkname == 'target'
@@ -98,3 +98,139 @@ def test_connect_passes_in_the_same_session(
     assert connection.Hg._session_factory() == stub_session
     assert connection.Svn._session_factory() == stub_session
     assert connection.Git._session_factory() == stub_session
+
+
+@pytest.fixture
+def remote_repo(stub_session_factory, config):
+    repo_maker = client_http.RepoMaker(
+        'server_and_port', 'endpoint', stub_session_factory)
+    return repo_maker('stub_path', config)
+
+
+@mock.patch.object(vcs.conf.settings, 'REMOTE_BATCH_CALLS', True)
+def test_remote_batch_sends_one_request(remote_repo, stub_session):
+    stub_session.post().content = msgpack.packb([
+        {'result': 'first'},
+        {'error': {'type': 'KeyError', 'message': 'missing'}},
+    ])
+    stub_session.reset_mock()
+
+    with remote_repo.batch() as batch:
+        first = batch.example_call('a')
+        second = batch.example_call('b')
+
+    assert stub_session.post.call_count == 1
+    payload = msgpack.unpackb(stub_session.post.call_args[1]['data'])
+    assert [call['params']['args'] for call in payload] == [['a'], ['b']]
+    assert first.result == 'first'
+    with pytest.raises(KeyError):
+        second.result
+
+
+@mock.patch.object(vcs.conf.settings, 'REMOTE_BATCH_CALLS', True)
+def test_remote_batch_rejected_by_server(remote_repo, stub_session):
+    batch_response = mock.Mock(content=msgpack.packb(
+        {'error': {'type': 'Exception', 'message': 'unknown method'}}))
+    call_responses = [
+        mock.Mock(content=msgpack.packb({'result': result}))
+        for result in ('first', 'second')]
+    stub_session.post.side_effect = [batch_response] + call_responses
+
+    with remote_repo.batch() as batch:
+        first = batch.example_call('a')
+        second = batch.example_call('b')
+
+    assert stub_session.post.call_count == 3
+    assert (first.result, second.result) == ('first', 'second')
+
+
+@mock.patch.object(vcs.conf.settings, 'REMOTE_BATCH_CALLS', True)
+def test_remote_batch_with_missing_responses(remote_repo, stub_session):
+    stub_session.post().content = msgpack.packb([{'result': 'first'}])
+    stub_session.reset_mock()
+
+    with remote_repo.batch() as batch:
+        first = batch.example_call('a')
+        second = batch.example_call('b')
+
+    for call in (first, second):
+        with pytest.raises(vcs.exceptions.VCSError):
+            call.result
+
+
+@mock.patch.object(vcs.conf.settings, 'REMOTE_BATCH_CALLS', False)
+def test_remote_batch_falls_back_to_single_calls(remote_repo, stub_session):
+    with remote_repo.batch() as batch:
+        batch.example_call('a')
+        batch.example_call('b')
+
+    assert stub_session.post.call_count == 2
+
+
+def test_remote_batch_result_not_available_before_flush(remote_repo):
+    batch = remote_repo.batch()
+    call = batch.example_call()
+
+    with pytest.raises(RuntimeError):
+        call.result
+
+
+def test_remote_repo_payload_contains_wire(remote_repo, stub_session):
+    remote_repo.example_call('a', key='value')
+
+    payload = msgpack.unpackb(stub_session.post.call_args[1]['data'])
+    assert payload['method'] == 'example_call'
+    assert payload['params']['args'] == ['a']
+    assert payload['params']['kwargs'] == {'key': 'value'}
+    assert payload['params']['wire']['path'] == 'stub_path'
+    assert payload['params']['wire']['config'] == [
+        ['section-a', 'a-1', 'value-a-1']]
+
+
+def test_remote_repo_wire_follows_config_changes(
+        remote_repo, stub_session, config):
+    remote_repo.example_call()
+    config.set('section-b', 'b-1', 'value-b-1')
+    remote_repo.example_call()
+
+    payload = msgpack.unpackb(stub_session.post.call_args[1]['data'])
+    assert ['section-b', 'b-1', 'value-b-1'] in (
+        payload['params']['wire']['config'])
+
+
+def test_remote_repo_wire_follows_wire_changes(remote_repo, stub_session):
+    remote_repo.example_call()
+    remote_repo._wire['cache'] = False
+    remote_repo.example_call()
+
+    payload = msgpack.unpackb(stub_session.post.call_args[1]['data'])
+    assert payload['params']['wire']['cache'] is False
+
+
+def test_remote_repo_reuses_packed_wire(remote_repo, stub_session, config):
+    with mock.patch.object(
+            config, 'serialize', wraps=config.serialize) as serialize:
+        remote_repo.example_call()
+        remote_repo.example_call()
+        assert serialize.call_count == 1
+
+        remote_repo._wire['cache'] = False
+        remote_repo.example_call()
+        assert serialize.call_count == 2
+
+
+@pytest.mark.parametrize('modify', [
+    lambda wire: wire.__setitem__('cache', False),
+    lambda wire: wire.__delitem__('context'),
+    lambda wire: wire.update(cache=False),
+    lambda wire: wire.pop('context'),
+    lambda wire: wire.popitem(),
+    lambda wire: wire.setdefault('cache', False),
+    lambda wire: wire.clear(),
+])
+def test_wire_dict_counts_modifications(modify):
+    wire = client_http.WireDict({'path': 'stub_path', 'context': 'a'})
+
+    modify(wire)
+
+    assert wire.version == 1
@@ -21,10 +21,14 @@
 import datetime
 import time
 
+import mock
 import pytest
+from repoze.lru import LRUCache
 
+from rhodecode.lib.vcs.backends import base
 from rhodecode.lib.vcs.backends.base import (
     CollectionGenerator, FILEMODE_DEFAULT, EmptyCommit)
+from rhodecode.lib.vcs.conf import settings
 from rhodecode.lib.vcs.exceptions import (
     BranchDoesNotExistError, CommitDoesNotExistError,
     RepositoryError, EmptyRepositoryError)
@@ -554,6 +558,49 @@ class TestCommitsChanges(BackendTestMixin):
         history = commit.get_file_history('foo/bar')
         assert len(history) == 1
 
+    def test_get_last_commits(self, last_commits_cache):
+        commit = self.repo.get_commit()
+        paths = ['fallout', 'foo/bar', 'foo/bał', 'foobar']
+        last_commits = commit.get_last_commits(paths)
+
+        assert last_commits == dict(
+            (path, commit.get_file_commit(path)) for path in paths)
+        assert last_commits['foo/bał'] == self.repo[0]
+        assert last_commits['foo/bar'] == self.repo[1]
+
+    def test_get_last_commits_of_subdirectory(self, last_commits_cache):
+        commit = self.repo.get_commit()
+        last_commits = commit.get_last_commits(['foo/bar', u'foo/bał'])
+
+        assert last_commits == {
+            'foo/bar': self.repo[1], 'foo/bał': self.repo[0]}
+
+    def test_get_last_commits_beyond_walk_limit(self, last_commits_cache):
+        commit = self.repo.get_commit()
+        with mock.patch.object(settings, 'LAST_COMMITS_WALK_LIMIT', 1):
+            last_commits = commit.get_last_commits(['foo/bar', 'foo/bał'])
+
+        assert last_commits == {
+            'foo/bar': self.repo[1], 'foo/bał': self.repo[0]}
+
+    def test_get_last_commits_is_cached(self, last_commits_cache):
+        commit = self.repo.get_commit()
+        commit.get_last_commits(['foo/bar', 'foobar'])
+        with mock.patch.object(
+                type(commit), '_find_last_commit_ids') as find_mock:
+            last_commits = commit.get_last_commits(['foobar', 'foo/bar'])
+
+        assert not find_mock.called
+        assert last_commits == {
+            'foo/bar': self.repo[1], 'foobar': self.repo[1]}
+
+
+@pytest.fixture
+def last_commits_cache(request):
+    patcher = mock.patch.object(base, '_last_commits_cache', LRUCache(10))
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
 
 def assert_text_equal(expected, given):
     assert expected == given
@@ -28,8 +28,9 @@ import pytest
 from rhodecode.lib.vcs.backends.base import Reference
 from rhodecode.lib.vcs.backends.git import (
     GitRepository, GitCommit, discover_git_version)
+from rhodecode.lib.vcs.backends.git import commit as git_commit
 from rhodecode.lib.vcs.exceptions import (
-    RepositoryError, VCSError, NodeDoesNotExistError
+    CommitError, RepositoryError, VCSError, NodeDoesNotExistError
 )
 from rhodecode.lib.vcs.nodes import (
     NodeKind, FileNode, DirNode, NodeState, SubModuleNode)
@@ -1027,6 +1028,15 @@ class TestGitSpecificWithRepo(BackendTestMixin):
             commit.get_node('foobar/static/js/admin/base.js').content ==
             'base')
 
+    def test_get_tree_id(self):
+        first, second = self.repo[0], self.repo[1]
+        assert first.get_tree_id('foobar') == second.get_tree_id('foobar/')
+        assert first.get_tree_id('') != second.get_tree_id('')
+
+    def test_get_tree_id_of_file(self):
+        with pytest.raises(CommitError):
+            self.repo.get_commit().get_tree_id('foo')
+
     def test_get_diff_runs_git_command_with_hashes(self):
         self.repo.run_git_command = mock.Mock(return_value=['', ''])
         self.repo.get_diff(self.repo[0], self.repo[1])
@@ -1226,3 +1236,91 @@ class TestGetSubmoduleUrl(object):
         assert len(nodes) == 1
         assert type(nodes[0]) == SubModuleNode
         assert nodes[0].url == submodule_url
+
+
+class TestGitCommitPathResolution(object):
+
+    @pytest.fixture(autouse=True)
+    def tree_cache(self, request):
+        patcher = mock.patch.object(
+            git_commit, '_tree_cache', git_commit.LRUCache(10))
+        patcher.start()
+        request.addfinalizer(patcher.stop)
+
+    def _commit(self, ls_tree_output=''):
+        repository = mock.MagicMock()
+        repository.alias = 'git'
+        repository.run_git_command.return_value = (ls_tree_output, '')
+        repository._remote.__getitem__.return_value = {
+            'tree': 'root', 'id': 'root'}
+        return GitCommit(repository=repository, raw_id='abcdef12', idx=1)
+
+    def test_resolves_deep_path_in_one_call(self):
+        commit = self._commit(
+            '040000 tree t1\ta\0'
+            '040000 tree t2\ta/b\0'
+            '100755 blob b1\ta/b/c.py\0')
+
+        assert commit._get_id_for_path('a/b/c.py') == ['b1', 'blob']
+        assert commit._get_id_for_path('a/b') == ['t2', 'tree']
+        assert commit._stat_modes['a/b/c.py'] == 0100755
+        assert commit.repository.run_git_command.call_count == 1
+        assert not commit._remote.tree_items.called
+
+    def test_missing_parent_directory(self):
+        commit = self._commit('040000 tree t1\ta\0')
+
+        with pytest.raises(CommitError) as excinfo:
+            commit._get_id_for_path('a/b/c.py')
+        assert 'a/b have not been found' in str(excinfo.value)
+
+    def test_parent_is_not_a_directory(self):
+        commit = self._commit('100644 blob b1\ta\0')
+
+        with pytest.raises(CommitError) as excinfo:
+            commit._get_id_for_path('a/b.py')
+        assert 'a is not a directory' in str(excinfo.value)
+
+    def test_missing_file(self):
+        commit = self._commit('040000 tree t1\ta\0')
+
+        with pytest.raises(NodeDoesNotExistError):
+            commit._get_id_for_path('a/missing.py')
+
+    def test_commits_share_tree_entries(self):
+        commit = self._commit()
+        commit._remote.tree_items.side_effect = lambda tree_id: {
+            'root': [('a', 040000, 't1', 'tree')],
+            't1': [('c.py', 0100644, 'b1', 'blob')],
+        }[tree_id]
+        commit.get_nodes('')
+        commit.get_nodes('a')
+
+        other_commit = self._commit()
+        assert other_commit._get_id_for_path('a/c.py') == ['b1', 'blob']
+        assert not other_commit.repository.run_git_command.called
+        assert not other_commit._remote.tree_items.called
+
+    def test_commits_share_resolved_paths(self):
+        ls_tree_output = (
+            '040000 tree t1\ta\0'
+            '100644 blob b1\ta/c.py\0')
+        self._commit(ls_tree_output)._get_id_for_path('a/c.py')
+
+        other_commit = self._commit()
+        assert other_commit._get_id_for_path('a/c.py') == ['b1', 'blob']
+        assert other_commit._get_id_for_path('a') == ['t1', 'tree']
+        assert other_commit._stat_modes['a/c.py'] == 0100644
+        assert not other_commit.repository.run_git_command.called
+        assert not other_commit._remote.tree_items.called
+
+    def test_resolved_paths_do_not_hide_other_entries(self):
+        self._commit(
+            '040000 tree t1\ta\0'
+            '100644 blob b1\ta/c.py\0')._get_id_for_path('a/c.py')
+
+        other_commit = self._commit(
+            '040000 tree t1\ta\0'
+            '100644 blob b2\ta/d.py\0')
+        assert other_commit._get_id_for_path('a/d.py') == ['b2', 'blob']
+        assert other_commit.repository.run_git_command.call_count == 1
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2016  RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import hashlib
+import os
+import subprocess
+
+import mock
+import pytest
+
+from rhodecode.lib.vcs.backends.git import commit_index
+from rhodecode.lib.vcs.backends.git.commit_index import CommitIndex
+from rhodecode.lib.vcs.exceptions import RepositoryError
+
+
+def _sha(value):
+    return hashlib.sha1(str(value)).hexdigest()
+
+
+class LocalGitRepo(object):
+    """
+    Runs the git commands of the commit index in a local repository.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.commands = []
+        self._git('init', '-q')
+
+    def _git(self, *args):
+        env = dict(os.environ, GIT_AUTHOR_NAME='a', GIT_AUTHOR_EMAIL='a@b',
+                   GIT_COMMITTER_NAME='a', GIT_COMMITTER_EMAIL='a@b')
+        return subprocess.check_output(('git', ) + args, cwd=self.path, env=env)
+
+    def commit(self, message):
+        self._git('commit', '-q', '--allow-empty', '-m', message)
+        return self._git('rev-parse', 'HEAD').strip()
+
+    def run_git_command(self, cmd):
+        self.commands.append(cmd)
+        try:
+            return self._git(*cmd), ''
+        except subprocess.CalledProcessError as e:
+            raise RepositoryError(e)
+
+
+@pytest.fixture
+def index_dir(request, tmpdir):
+    patcher = mock.patch.object(
+        commit_index.settings, 'GIT_COMMIT_INDEX_DIR', str(tmpdir.join('idx')))
+    patcher.start()
+    request.addfinalizer(patcher.stop)
+
+
+@pytest.fixture
+def git_repo(tmpdir):
+    path = tmpdir.join('repo')
+    path.ensure(dir=True)
+    return LocalGitRepo(str(path))
+
+
+def test_lookup():
+    commit_ids = [_sha(idx) for idx in xrange(100)]
+    index = CommitIndex.from_commit_ids(commit_ids)
+
+    assert len(index) == 100
+    assert index.commit_ids() == commit_ids
+    for idx, commit_id in enumerate(commit_ids):
+        assert index[commit_id] == idx
+        assert index.commit_id(idx) == commit_id
+    assert _sha('missing') not in index
+    assert 'not-a-sha' not in index
+    with pytest.raises(KeyError):
+        index[_sha('missing')]
+
+
+@pytest.mark.parametrize('length', [1, 7, 12, 40])
+def test_lookup_prefix(length):
+    commit_ids = [_sha(idx) for idx in xrange(100)]
+    index = CommitIndex.from_commit_ids(commit_ids)
+    prefix = commit_ids[42][:length]
+
+    expected = sorted(
+        commit_id for commit_id in commit_ids if commit_id.startswith(prefix))
+    assert index.lookup_prefix(prefix) == expected
+    assert index.lookup_prefix(prefix.upper()) == expected
+    assert index.lookup_prefix(prefix, limit=1) == expected[:1]
+
+
+def test_lookup_prefix_invalid():
+    index = CommitIndex.from_commit_ids([_sha(1)])
+    assert index.lookup_prefix('xyz') == []
+
+
+def test_get_commit_index_disabled(git_repo):
+    assert commit_index.get_commit_index(git_repo) is None
+
+
+def test_get_commit_index_builds_index(index_dir, git_repo):
+    commit_ids = [git_repo.commit('c%s' % idx) for idx in xrange(3)]
+
+    index = commit_index.get_commit_index(git_repo)
+
+    assert index.commit_ids() == commit_ids
+    assert os.path.isfile(commit_index.get_commit_index_path(git_repo))
+
+
+def test_get_commit_index_reuses_stored_index(index_dir, git_repo):
+    git_repo.commit('c1')
+    commit_index.get_commit_index(git_repo)
+    git_repo.commands = []
+
+    index = commit_index.get_commit_index(git_repo)
+
+    assert len(index) == 1
+    assert [cmd[0] for cmd in git_repo.commands] == ['rev-parse']
+
+
+def test_get_commit_index_adds_new_commits(index_dir, git_repo):
+    commit_ids = [git_repo.commit('c1')]
+    commit_index.get_commit_index(git_repo)
+    commit_ids.append(git_repo.commit('c2'))
+    git_repo.commands = []
+
+    index = commit_index.get_commit_index(git_repo)
+
+    assert index.commit_ids() == commit_ids
+    rev_lists = [cmd for cmd in git_repo.commands if cmd[0] == 'rev-list']
+    assert rev_lists[-1][-2:] == ['--not', commit_ids[0]]
+
+
+def test_get_commit_index_rebuilds_rewritten_history(index_dir, git_repo):
+    first = git_repo.commit('c1')
+    git_repo.commit('c2')
+    commit_index.get_commit_index(git_repo)
+    git_repo._git('reset', '-q', '--hard', first)
+
+    index = commit_index.get_commit_index(git_repo)
+
+    assert index.commit_ids() == [first]
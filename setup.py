@@ -181,6 +181,8 @@ paster_commands = [
     'update-repoinfo=rhodecode.lib.paster_commands.update_repoinfo:Command',
     'cache-keys=rhodecode.lib.paster_commands.cache_keys:Command',
     'ishell=rhodecode.lib.paster_commands.ishell:Command',
+    'index-daemon=rhodecode.lib.paster_commands.index_daemon:Command',
+    'commit-graph=rhodecode.lib.paster_commands.commit_graph:Command',
     'upgrade-db=rhodecode.lib.dbmigrate:UpgradeDb',
     'celeryd=rhodecode.lib.celerypylons.commands:CeleryDaemonCommand',
 ]